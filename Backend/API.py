@@ -1,15 +1,56 @@
 import aiosqlite
+import asyncio
+import base64
 import json
 
-from fastapi.responses import JSONResponse, StreamingResponse
-from fastapi import FastAPI, HTTPException, Query, Depends, Body
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
+from fastapi import FastAPI, HTTPException, Query, Depends, Body, Header
 from fastapi.middleware.cors import CORSMiddleware
-from Database import database_initialized, init_db, DB_PATH, CONFIG_PATH
-from pydantic import BaseModel
+import Database
+import Metrics
+
+from Database import init_db, ConnectionPool, DB_PATH, CONFIG_PATH, STATS_WINDOWS
+from Config import config_store
+from ScrapeService import ScrapeService
+from Events import sse_stream
+from Alerts import alert_rules, evaluate_alerts
+from Scheduler import ScheduleRunner, DEFAULT_SCHEDULE, DEFAULT_SCHEDULE_MODE, list_schedules, save_schedule, delete_schedule as remove_schedule
+from Exports import stream_csv, write_xlsx, write_pdf
+from History import history_chart, DEFAULT_CHART_POINTS, MAX_CHART_POINTS
+from Matcher import build_fts_query, normalize_corpus, match_titles
+from pydantic import BaseModel, Field
 from typing import Optional, List
 
 APP = FastAPI(title="Price Tracker API")
-scrape_process = None
+DB_POOL = ConnectionPool(DB_PATH)
+SCRAPE_SERVICE = ScrapeService(CONFIG_PATH, DB_POOL)
+CONFIG = config_store(CONFIG_PATH)
+SCHEDULER = ScheduleRunner(DB_POOL, SCRAPE_SERVICE, CONFIG)
+
+# nullable columns are ordered through the same IFNULL expressions as their indexes in init_db
+ORDER_COLUMNS = {
+    "id": "id",
+    "site_name": "site_name",
+    "title": "title",
+    "last_price": "IFNULL(last_price, -1)",
+    "rating": "IFNULL(rating, -1)",
+    "last_seen_at": "last_seen_at",
+    # product_stats columns; ascending last_change_pct puts the biggest drops first
+    "last_change_pct": "IFNULL(last_change_pct, 0)",
+    "last_change_at": "IFNULL(last_change_at, '')",
+}
+# every product has its product_stats row, so the plain join keeps them all and lets SQLite
+# walk either table's order index; ties break on that table's own rowid so the index covers them too
+STATS_ORDER = {"last_change_pct", "last_change_at"}
+PRODUCTS_FROM = "products JOIN product_stats ON product_stats.product_id = products.id"
+STATS_COLUMNS = ["all_time_min", "all_time_max"] + [f"{agg}_{d}d" for d in STATS_WINDOWS for agg in ("min", "avg")] + \
+                ["last_change", "last_change_pct", "last_change_at"]
+PRODUCT_COLUMNS = """id, site_name, external_id, title, link, currency, last_price,
+            rating, ratings_count, first_seen_at, last_seen_at, """ + ", ".join(STATS_COLUMNS)
+COUNT_CACHE_SIZE = 256
+COUNT_CACHE = dict()
+count_cache_version = None
+MATCH_CORPUS = None
 
 APP.add_middleware(
     CORSMiddleware,
@@ -17,26 +58,63 @@ APP.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if Metrics.METRICS_ENABLED:
+    APP.add_middleware(Metrics.RequestMetrics)
 
 async def get_db():
-    if not database_initialized:
+    if not Database.database_initialized:
         await init_db(DB_PATH)
     
-    db = await aiosqlite.connect(DB_PATH)
+    async with DB_POOL.reader() as db:
+        yield db
 
-    try:
+async def get_writer():
+    if not Database.database_initialized:
+        await init_db(DB_PATH)
+
+    async with DB_POOL.writer() as db:
         yield db
-    finally:
-        await db.close()
 
 @APP.on_event("startup")
 async def on_startup():
-    if not database_initialized:
+    if not Database.database_initialized:
         await init_db(DB_PATH)
 
+    await DB_POOL.open()
+    await SCRAPE_SERVICE.start()
+    await SCHEDULER.start()
+
+@APP.on_event("shutdown")
+async def on_shutdown():
+    await SCHEDULER.stop()
+    await SCRAPE_SERVICE.stop()
+    await DB_POOL.close()
+
 class NumbersRequest(BaseModel):
     numbers: List[int]
 
+class ScheduleIn(BaseModel):
+    query: str
+    mode: str = Field(DEFAULT_SCHEDULE_MODE, pattern="^(full|incremental|watched|adaptive)$")
+    cron: Optional[str] = None
+    interval_minutes: Optional[int] = None
+    jitter_seconds: int = 0
+    catch_up: bool = True
+    enabled: bool = True
+
+class ProductStats(BaseModel):
+    all_time_min: Optional[int]
+    all_time_max: Optional[int]
+    min_7d: Optional[int]
+    avg_7d: Optional[float]
+    min_30d: Optional[int]
+    avg_30d: Optional[float]
+    min_90d: Optional[int]
+    avg_90d: Optional[float]
+    last_change: Optional[int]
+    last_change_pct: Optional[float]
+    last_change_at: Optional[str]
+
 class ProductOut(BaseModel):
     id: int
     site_name: str
@@ -49,18 +127,44 @@ class ProductOut(BaseModel):
     ratings_count: Optional[int]
     first_seen_at: str
     last_seen_at: str
+    stats: Optional[ProductStats] = None
 
 class PricePoint(BaseModel):
-    id: int
+    # one interval of an unchanged price; captured_at is when it was last seen
     product_id: int
     price_minor: Optional[int]
     captured_at: str
+    valid_from: str
+    valid_to: str
+    observations: int
+
+class ChartPoint(BaseModel):
+    captured_at: str
+    price_minor: int
+
+class HistoryStats(BaseModel):
+    count: int
+    min: Optional[int]
+    max: Optional[int]
+    avg: Optional[float]
+    first_at: Optional[str]
+    last_at: Optional[str]
+    last_price: Optional[int]
+    last_change: Optional[int]
+    last_change_pct: Optional[float]
+    last_change_at: Optional[str]
+
+class HistoryChart(BaseModel):
+    product_id: int
+    points: List[ChartPoint]
+    stats: HistoryStats
 
 class ProductsList(BaseModel):
     total: int
     page: int
     per_page: int
     items: List[ProductOut]
+    next_cursor: Optional[str] = None
 
 def row_to_product(row) -> ProductOut:
     # row order must match the SELECT below
@@ -76,32 +180,30 @@ def row_to_product(row) -> ProductOut:
         ratings_count=row[8],
         first_seen_at=row[9].split(".")[0],
         last_seen_at=row[10].split(".")[0],
+        stats=row_to_stats(row[11:11 + len(STATS_COLUMNS)]) if len(row) > 11 else None,
     )
 
-def row_to_price(row) -> PricePoint:
-    return PricePoint(id=row[0], product_id=row[1], price_minor=row[2], captured_at=row[3].split(".")[0])
+def row_to_stats(values) -> ProductStats:
+    stats = dict(zip(STATS_COLUMNS, values))
+    if stats["last_change_at"]:
+        stats["last_change_at"] = stats["last_change_at"].split(".")[0]
 
-@APP.get("/products", response_model=ProductsList)
-async def list_products(
-    q: Optional[str] = Query(None, description="text filter on title"),
-    site: Optional[str] = Query(None, description="filter by site_name"),
-    min_price: Optional[int] = Query(None, description="minimum price in minor units (cents)"),
-    max_price: Optional[int] = Query(None, description="maximum price in minor units (cents)"),
-    page: int = Query(1),
-    per_page: int = Query(25),
-    order_by: Optional[str] = Query(None, description="order products by a criterion"),
-    reversed: bool = Query(0, le=1, ge=0),
-    db: aiosqlite.Connection = Depends(get_db)
-):
-    if per_page not in [10, 25, 50]:
-        per_page = 25
+    return ProductStats(**stats)
 
-    if page < 0:
-        page = 1
-    
+def row_to_price(row, at_start: bool = False) -> PricePoint:
+    valid_from, valid_to = row[2].split(".")[0], row[3].split(".")[0]
+    return PricePoint(product_id=row[0], price_minor=row[1], captured_at=valid_from if at_start else valid_to,
+                      valid_from=valid_from, valid_to=valid_to, observations=row[4])
+
+def build_product_filters(q: Optional[str], site: Optional[str], min_price: Optional[int], max_price: Optional[int],
+                          max_change_pct: Optional[float] = None, all_time_low: bool = False):
     where = []
     params = []
-    if q:
+    fts_query = build_fts_query(q) if q else None
+    if fts_query:
+        where.append("id IN (SELECT rowid FROM products_fts WHERE products_fts MATCH ?)")
+        params.append(fts_query)
+    elif q:
         where.append("LOWER(title) LIKE ?")
         params.append(f"%{q.lower()}%")
     if site:
@@ -113,43 +215,156 @@ async def list_products(
     if max_price is not None:
         where.append("last_price <= ?")
         params.append(max_price)
+    # stats filters stay subqueries on product_stats so the COUNT(*) over products needs no join
+    if max_change_pct is not None:
+        where.append("id IN (SELECT product_id FROM product_stats WHERE IFNULL(last_change_pct, 0) <= ?)")
+        params.append(max_change_pct)
+    if all_time_low:
+        where.append("last_price <= (SELECT all_time_min FROM product_stats WHERE product_stats.product_id = products.id)")
 
-    where_sql = "WHERE " + " AND ".join(where) if where else ""
-    count_sql = f"SELECT COUNT(*) FROM products {where_sql}"
-    async with db.execute(count_sql, params) as cur:
+    return where, params
+
+def encode_cursor(value, id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([value, id]).encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        value, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return value, int(id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def products_version(db: aiosqlite.Connection):
+    async with db.execute("SELECT value FROM db_meta WHERE key = 'products_version'") as cur:
         row = await cur.fetchone()
-        total = row[0] if row is not None else 0
 
-    rev_text = ""
-    if reversed:
-        rev_text = "DESC "
+    return row[0] if row else None
+
+async def count_products(db: aiosqlite.Connection, where: List[str], params: list) -> int:
+    # counts are cached per filter set until the products_version counter (bumped by triggers) moves
+    global count_cache_version
+
+    version = await products_version(db)
+
+    if version != count_cache_version or len(COUNT_CACHE) >= COUNT_CACHE_SIZE:
+        COUNT_CACHE.clear()
+        count_cache_version = version
+
+    key = (tuple(where), tuple(params))
+    if key not in COUNT_CACHE:
+        where_sql = "WHERE " + " AND ".join(where) if where else ""
+        async with db.execute(f"SELECT COUNT(*) FROM products {where_sql}", params) as cur:
+            row = await cur.fetchone()
+        COUNT_CACHE[key] = row[0] if row is not None else 0
+
+    return COUNT_CACHE[key]
+
+@APP.get("/products", response_model=ProductsList)
+async def list_products(
+    q: Optional[str] = Query(None, description="text filter on title"),
+    site: Optional[str] = Query(None, description="filter by site_name"),
+    min_price: Optional[int] = Query(None, description="minimum price in minor units (cents)"),
+    max_price: Optional[int] = Query(None, description="maximum price in minor units (cents)"),
+    max_change_pct: Optional[float] = Query(None, description="last price change at most this percent, -10 for drops of 10% or more"),
+    all_time_low: bool = Query(False, description="only products at their all-time lowest price"),
+    page: int = Query(1),
+    per_page: int = Query(25),
+    order_by: Optional[str] = Query(None, description="order products by a criterion, or \"relevance\" with q"),
+    reversed: bool = Query(0, le=1, ge=0),
+    keyset: bool = Query(False, description="page with next_cursor instead of page numbers"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous keyset page"),
+    db: aiosqlite.Connection = Depends(get_db)
+):
+    if per_page not in [10, 25, 50]:
+        per_page = 25
+
+    if page < 0:
+        page = 1
     
+    where, params = build_product_filters(q, site, min_price, max_price, max_change_pct, all_time_low)
+    total = await count_products(db, where, params)
+
+    order_col = ORDER_COLUMNS.get(order_by or "id", "id")
+    direction = "DESC" if reversed else "ASC"
+    from_sql = PRODUCTS_FROM
+    tie_col = "product_stats.product_id" if order_by in STATS_ORDER else "id"
+    order_sql = f"{order_col} {direction}, {tie_col} {direction}"
+
+    fts_query = build_fts_query(q) if q else None
+    if order_by == "relevance" and fts_query:
+        # best bm25 match first; the MATCH moves into the join instead of the id IN (...) filter
+        where, params = build_product_filters(None, site, min_price, max_price, max_change_pct, all_time_low)
+        from_sql = f"""{PRODUCTS_FROM} JOIN (
+            SELECT rowid AS fts_id, rank AS fts_rank FROM products_fts WHERE products_fts MATCH ?
+        ) ON fts_id = products.id"""
+        params = [fts_query] + params
+        order_sql = "fts_rank, id"
+        keyset = False
+        cursor = None
+
     page_text = ""
-    if per_page != -1:
+    if keyset or cursor:
+        keyset = True
+        if cursor:
+            value, last_id = decode_cursor(cursor)
+            # spelled out instead of a row value so SQLite can seek the expression indexes too
+            op = "<" if reversed else ">"
+            where = where + [f"{order_col} {op}= ? AND ({order_col} {op} ? OR {tie_col} {op} ?)"]
+            params = params + [value, value, last_id]
+        page_text = f"LIMIT {per_page}"
+    elif per_page != -1:
         offset = (page - 1) * per_page
         page_text = f"LIMIT {per_page} OFFSET {offset} "
 
+    where_sql = "WHERE " + " AND ".join(where) if where else ""
     select_sql = f"""
-        SELECT id, site_name, external_id, title, link, currency, last_price,
-            rating, ratings_count, first_seen_at, last_seen_at
-        FROM products
+        SELECT {PRODUCT_COLUMNS}, {order_col}
+        FROM {from_sql}
         {where_sql}
-        ORDER BY {order_by} {rev_text}
+        ORDER BY {order_sql}
         {page_text}
     """
     async with db.execute(select_sql, params) as cur:
         rows = await cur.fetchall()
 
+    next_cursor = None
+    if keyset and len(rows) == per_page:
+        next_cursor = encode_cursor(rows[-1][-1], rows[-1][0])
+
     items = [row_to_product(r) for r in rows]
-    return ProductsList(total=total, page=page, per_page=per_page, items=items)
+    return ProductsList(total=total, page=page, per_page=per_page, items=items, next_cursor=next_cursor)
+
+async def load_match_corpus(db: aiosqlite.Connection):
+    # every product title, normalized once per products_version and reused by each rematch query
+    global MATCH_CORPUS
+
+    version = await products_version(db)
+    if MATCH_CORPUS is None or MATCH_CORPUS[0] != version:
+        async with db.execute("SELECT id, site_name, title FROM products ORDER BY id") as cur:
+            rows = await cur.fetchall()
+
+        titles = [r[2] for r in rows]
+        corpus = await asyncio.to_thread(normalize_corpus, titles)
+        MATCH_CORPUS = (version, [r[0] for r in rows], [r[1] for r in rows], titles, corpus)
+
+    return MATCH_CORPUS[1:]
+
+@APP.get("/products/rematch")
+async def rematch_products(
+    query: str = Query(..., description="Matcher query to re-evaluate stored products against"),
+    site: Optional[str] = Query(None, description="Only report products of this site"),
+    db: aiosqlite.Connection = Depends(get_db)
+):
+    ids, sites, titles, corpus = await load_match_corpus(db)
+    mask, hits = await asyncio.to_thread(match_titles, query, titles, corpus)
+
+    matched = [id for id, s, ok in zip(ids, sites, mask) if ok and (not site or s.lower().startswith(site.lower()))]
+
+    return {"query": query, "checked": len(ids), "matched": len(matched), "ids": matched}
 
 @APP.get("/products/{product_id}", response_model=ProductOut)
 async def get_product(product_id: int, db: aiosqlite.Connection = Depends(get_db)):
-    async with db.execute("""
-        SELECT id, site_name, external_id, title, link, currency, last_price,
-               rating, ratings_count, first_seen_at, last_seen_at
-        FROM products WHERE id = ?
-    """, (product_id,)) as cur:
+    async with db.execute(f"SELECT {PRODUCT_COLUMNS} FROM {PRODUCTS_FROM} WHERE id = ?", (product_id,)) as cur:
         row = await cur.fetchone()
     
     if not row:
@@ -161,54 +376,146 @@ async def get_product(product_id: int, db: aiosqlite.Connection = Depends(get_db
 async def get_price_history(
     product_id: int,
     limit: int = Query(200, ge=1, le=2000),
+    expand: bool = Query(False, description="one point where each price began and one where it was last seen"),
     db: aiosqlite.Connection = Depends(get_db)
 ):
+    # the latest `limit` intervals, still returned oldest first
     async with db.execute("""
-        SELECT id, product_id, price_minor, captured_at
+        SELECT product_id, price_minor, valid_from, valid_to, observations
         FROM price_history
         WHERE product_id = ?
-        ORDER BY captured_at
+        ORDER BY valid_from DESC
         LIMIT ?
     """, (product_id, limit)) as cur:
         rows = await cur.fetchall()
-    
-    return [row_to_price(r) for r in rows]
 
-@APP.post("/scrape/trigger")
-async def trigger_scrape(query: Optional[str] = Query(None, description="Enter the query: ")):
-    cmd = ["python", "scrape_worker.py",
-            query or "",
-            CONFIG_PATH]
-    
-    import subprocess
+    if not expand:
+        return [row_to_price(r) for r in reversed(rows)]
 
-    global scrape_process
-    scrape_process = subprocess.Popen(cmd, stderr=subprocess.PIPE, text=True)
+    points = []
+    for r in reversed(rows):
+        points.append(row_to_price(r, at_start=True))
+        if r[3] != r[2]:
+            points.append(row_to_price(r))
 
-    return {"ok": True}
+    return points
+
+@APP.get("/products/{product_id}/history/chart", response_model=HistoryChart)
+async def get_price_history_chart(
+    product_id: int,
+    start: Optional[str] = Query(None, description="from this time, 'YYYY-MM-DD[ HH:MM:SS]'"),
+    end: Optional[str] = Query(None, description="up to this time, 'YYYY-MM-DD[ HH:MM:SS]'"),
+    points: int = Query(DEFAULT_CHART_POINTS, ge=8, le=MAX_CHART_POINTS, description="at most this many points"),
+    db: aiosqlite.Connection = Depends(get_db)
+):
+    if end and len(end) == 10:
+        end += " 23:59:59.999"
+
+    rows, stats = await history_chart(db, product_id, start, end, points)
+    chart_points = [ChartPoint(captured_at=t.split(".")[0], price_minor=p) for t, p in rows]
+
+    for key in ("first_at", "last_at", "last_change_at"):
+        if stats[key]:
+            stats[key] = stats[key].split(".")[0]
+
+    return HistoryChart(product_id=product_id, points=chart_points, stats=HistoryStats(**stats))
+
+@APP.post("/scrape/trigger")
+async def trigger_scrape(
+    query: Optional[str] = Query(None, description="Enter the query: "),
+    mode: str = Query("full", pattern="^(full|incremental|watched|adaptive)$",
+                      description="full, incremental (stop on pages unchanged since the last run), watched (tracked products only) "
+                                  "or adaptive (tracked products due a check, by how often their price moves)"),
+):
+    job = SCRAPE_SERVICE.submit(query or "", mode)
+
+    return {"ok": True, "job_id": job.id}
 
 @APP.get("/scrape/status")
-def scrape_status():
-    global scrape_process
+def scrape_status(job_id: Optional[int] = Query(None, description="Job returned by /scrape/trigger")):
+    if job_id is None:
+        return SCRAPE_SERVICE.latest_status()
 
-    if scrape_process is None:
-        return {"status": "idle"}
-    elif scrape_process.poll() is None:
-        return {"status": "in_progress"}
-    else:
-        try:
-            with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-                config = json.load(f)
-        except Exception:
-            config = {}
-        
-        scrape_process = None
-        return {"status": "done", "len_products": config["nr_changed_products"]}
+    job = SCRAPE_SERVICE.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    if job.finished_at is not None:
+        job.reported = True
+
+    return job.to_dict()
+
+@APP.get("/scrape/events")
+async def scrape_events(
+    job_id: Optional[int] = Query(None, description="Only this job's events; the stream ends when the job does"),
+    last_event_id: Optional[str] = Header(None, description="Sent by EventSource on reconnect, resumes after it"),
+):
+    # Server-Sent Events: page, site_done, site_error, incremental_stop, recheck_miss and the job_* lifecycle
+    after = int(last_event_id) if last_event_id and last_event_id.isdigit() else 0
+    job = SCRAPE_SERVICE.get(job_id) if job_id is not None else None
+    end = job.end_event if job is not None else None
+
+    return StreamingResponse(sse_stream(SCRAPE_SERVICE.events, after, job_id, end=end), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@APP.get("/metrics")
+def metrics():
+    # Prometheus text format: scrape stage timings, writer connection use and request latency since
+    # the API started, plus the resident browser's request counters per site
+    if not Metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (METRICS=0)")
+
+    engine = Metrics.Registry()
+    playwright = (SCRAPE_SERVICE.engines or {}).get("playwright")
+    for site_name, site_metrics in getattr(playwright, "metrics", {}).items():
+        for key in ("requests", "bytes", "blocked", "cache_hits"):
+            engine.inc(f"scrape_browser_{key}_total", (("site", site_name),), getattr(site_metrics, key))
+
+    return PlainTextResponse(Metrics.REGISTRY.render() + engine.render(), media_type="text/plain; version=0.0.4")
+
+@APP.get("/scrape/jobs")
+def scrape_jobs():
+    return [job.to_dict() for job in SCRAPE_SERVICE.jobs.values()]
+
+@APP.get("/scrape/runs")
+async def scrape_runs(limit: int = Query(20, ge=1, le=500), db: aiosqlite.Connection = Depends(get_db)):
+    # finished runs, newest first; what config.json used to keep as nr_changed_products
+    async with db.execute("""
+        SELECT id, query, started_at, finished_at, changed_products, errors, mode, pages
+        FROM scrape_runs ORDER BY id DESC LIMIT ?
+    """, (limit,)) as cur:
+        rows = await cur.fetchall()
+
+    return [{
+        "id": r[0], "query": r[1], "started_at": r[2].split(".")[0], "finished_at": r[3].split(".")[0],
+        "changed_products": r[4], "errors": r[5].split("\n") if r[5] else [], "mode": r[6], "pages": r[7],
+    } for r in rows]
+
+@APP.get("/alerts")
+async def alerts(
+    limit: int = Query(50, ge=1, le=500),
+    pending: bool = Query(False, description="Only alerts that haven't been sent yet"),
+    db: aiosqlite.Connection = Depends(get_db),
+):
+    # newest first; an alert is raised once per product, rule and price
+    async with db.execute(f"""
+        SELECT alerts.id, alerts.product_id, products.title, alerts.rule, alerts.price_minor, alerts.detail,
+               alerts.created_at, alerts.notified_at
+        FROM alerts JOIN products ON products.id = alerts.product_id
+        {"WHERE alerts.notified_at IS NULL" if pending else ""}
+        ORDER BY alerts.id DESC LIMIT ?
+    """, (limit,)) as cur:
+        rows = await cur.fetchall()
+
+    return [{
+        "id": r[0], "product_id": r[1], "title": r[2], "rule": r[3], "price": r[4], "detail": r[5],
+        "created_at": r[6].split(".")[0], "notified_at": r[7].split(".")[0] if r[7] else None,
+    } for r in rows]
 
 @APP.post("/products/bulk_delete")
 async def bulk_delete_products(
     ids: NumbersRequest,
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_writer)
 ):
     if not ids:
         return JSONResponse({"ok": False, "error": "No ids provided"}, status_code=400)
@@ -223,14 +530,24 @@ async def bulk_delete_products(
     return JSONResponse({"ok": True, "deleted": len(ids.numbers)})
 
 @APP.post("/delete_db")
-async def delete_db(db: aiosqlite.Connection = Depends(get_db)):
+async def delete_db(db: aiosqlite.Connection = Depends(get_writer)):
+    global MATCH_CORPUS
+
     await db.execute("DROP TABLE PRODUCTS")
     await db.execute("DROP TABLE PRICE_HISTORY")
+    await db.execute("DROP TABLE IF EXISTS products_fts")
+    await db.execute("DROP TABLE IF EXISTS product_stats")
+    # product ids start again from 1 after the drop, so nothing may still point at the old ones
+    await db.execute("DELETE FROM alerts")
+    # stored fingerprints would make the next incremental run take the empty catalogue as unchanged
+    await db.execute("DELETE FROM page_fingerprints")
+    await db.execute("DELETE FROM watch_checks")
     
     await db.commit()
 
-    import Database
     Database.database_initialized = False
+    COUNT_CACHE.clear()
+    MATCH_CORPUS = None
 
     return {"ok": True}
 
@@ -241,63 +558,58 @@ async def change_config(
     min_rating: Optional[str] = Query(None, description="Minimum rating of the products"),
     min_rating_number: Optional[str] = Query(None, description="Minimum number of ratings of the products"),
 ):
-    try:
-        with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-            config = json.load(f)
-    except Exception:
-        config = {}
-
-    if min_price is not None:
-        config["configuration"]["min_price"] = min_price
-    if max_price is not None:
-        config["configuration"]["max_price"] = max_price
-    if min_rating is not None:
-        config["configuration"]["min_rating"] = min_rating
-    if min_rating_number is not None:
-        config["configuration"]["min_ratings"] = min_rating_number
-
-    with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-        json.dump(config, f, indent=2, ensure_ascii=False)
+    def change(config):
+        if min_price is not None:
+            config["configuration"]["min_price"] = min_price
+        if max_price is not None:
+            config["configuration"]["max_price"] = max_price
+        if min_rating is not None:
+            config["configuration"]["min_rating"] = min_rating
+        if min_rating_number is not None:
+            config["configuration"]["min_ratings"] = min_rating_number
+
+    CONFIG.update(change)
 
     return {"ok": True}
 
 @APP.post("/get_config")
 async def get_config():
-    try:
-        with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-            config = json.load(f)
-    except Exception:
-        config = {}
+    config = CONFIG.get()
 
     return {"max_price": str(config["configuration"]["max_price"]), 
             "min_price": str(config["configuration"]["min_price"]),
             "min_rating": str(config["configuration"]["min_rating"]),
             "min_ratings": str(config["configuration"]["min_ratings"]) }
 
+def site_settings(site) -> dict:
+    return {
+        "name": site["name"],
+        "url": site["url"],
+        "url_searchTemplate": site["url_searchTemplate"],
+        "concurrency": site.get("concurrency", 1),
+        "delay": site.get("delay", 3),
+        "product": site["selectors"]["product"],
+        "title": site["selectors"]["title"],
+        "link": site["selectors"]["link"],
+        "price": site["selectors"]["price"],
+        "currency": site["selectors"]["currency"],
+        "rating": site["selectors"]["rating"],
+        "id": site["selectors"]["id"],
+        "image_link": site["selectors"]["image_link"],
+        "remove_items_with": site["selectors"]["remove_items_with"],
+        "end_of_pages": site["selectors"]["end_of_pages"]
+    }
+
+@APP.get("/sites")
+async def get_sites():
+    # every site's settings in one response, in get_site_settings' shape
+    return [site_settings(site) for site in CONFIG.get().get("sites", [])]
+
 @APP.get("/get_site_settings")
 async def get_site_settings(index: Optional[str] = Query(None, description="Site index")):
     idx = int(index if index is not None else "0")
-    try:
-        with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-            config = json.load(f)
-    except Exception:
-        config = {}
 
-    return {
-        "name": config["sites"][idx]["name"],
-        "url": config["sites"][idx]["url"],
-        "url_searchTemplate": config["sites"][idx]["url_searchTemplate"],
-        "product": config["sites"][idx]["selectors"]["product"],
-        "title": config["sites"][idx]["selectors"]["title"],
-        "link": config["sites"][idx]["selectors"]["link"],
-        "price": config["sites"][idx]["selectors"]["price"],
-        "currency": config["sites"][idx]["selectors"]["currency"],
-        "rating": config["sites"][idx]["selectors"]["rating"],
-        "id": config["sites"][idx]["selectors"]["id"],
-        "image_link": config["sites"][idx]["selectors"]["image_link"],
-        "remove_items_with": config["sites"][idx]["selectors"]["remove_items_with"],
-        "end_of_pages": config["sites"][idx]["selectors"]["end_of_pages"]
-    }
+    return site_settings(CONFIG.get()["sites"][idx])
 
 @APP.post("/set_site_settings")
 async def set_site_settings(
@@ -315,60 +627,57 @@ async def set_site_settings(
     image_link: Optional[str] = Query(None, description="Product image link selector"),
     remove_items_with: Optional[str] = Query(None, description="Ignore product selector"),
     end_of_pages: Optional[str] = Query(None, description="End of product pages selector"),
+    concurrency: Optional[int] = Query(None, ge=1, description="Result pages fetched in parallel"),
+    delay: Optional[float] = Query(None, ge=0, description="Seconds to wait between rounds of pages"),
 ):
     
     idx = int(index if index is not None else "0")
-    try:
-        with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-            config = json.load(f)
-    except Exception:
-        config = {}
-
-    if config and idx >= len(config["sites"]):
-        config["sites"].append({
-            "name": "",
-            "url": "",
-            "url_searchTemplate": "",
-            "selectors": {
-                "product": "",
-                "title": "",
-                "link": "",
-                "price": "",
-                "currency": "",
-                "rating": "",
-                "id": "",
-                "image_link": "",
-                "remove_items_with": "",
-                "end_of_pages": ""
-            }
-        })
-
-    config["sites"][idx]["name"] = name
-    config["sites"][idx]["url"] = url if url else ""
-    config["sites"][idx]["url_searchTemplate"] = url_searchTemplate if url_searchTemplate else ""
-    config["sites"][idx]["selectors"]["product"] = product if product else ""
-    config["sites"][idx]["selectors"]["title"] = title if title else ""
-    config["sites"][idx]["selectors"]["link"] = link if link else ""
-    config["sites"][idx]["selectors"]["price"] = price if price else ""
-    config["sites"][idx]["selectors"]["currency"] = currency if currency else ""
-    config["sites"][idx]["selectors"]["rating"] = rating if rating else ""
-    config["sites"][idx]["selectors"]["id"] = id if id else ""
-    config["sites"][idx]["selectors"]["image_link"] = image_link if image_link else ""
-    config["sites"][idx]["selectors"]["remove_items_with"] = remove_items_with if remove_items_with else ""
-    config["sites"][idx]["selectors"]["end_of_pages"] = end_of_pages if end_of_pages else ""
-
-    with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-        json.dump(config, f, indent=2, ensure_ascii=False)
+
+    def change(config):
+        if config and idx >= len(config["sites"]):
+            config["sites"].append({
+                "name": "",
+                "url": "",
+                "url_searchTemplate": "",
+                "concurrency": 1,
+                "delay": 3,
+                "selectors": {
+                    "product": "",
+                    "title": "",
+                    "link": "",
+                    "price": "",
+                    "currency": "",
+                    "rating": "",
+                    "id": "",
+                    "image_link": "",
+                    "remove_items_with": "",
+                    "end_of_pages": ""
+                }
+            })
+
+        config["sites"][idx]["name"] = name
+        config["sites"][idx]["url"] = url if url else ""
+        config["sites"][idx]["url_searchTemplate"] = url_searchTemplate if url_searchTemplate else ""
+        config["sites"][idx]["selectors"]["product"] = product if product else ""
+        config["sites"][idx]["selectors"]["title"] = title if title else ""
+        config["sites"][idx]["selectors"]["link"] = link if link else ""
+        config["sites"][idx]["selectors"]["price"] = price if price else ""
+        config["sites"][idx]["selectors"]["currency"] = currency if currency else ""
+        config["sites"][idx]["selectors"]["rating"] = rating if rating else ""
+        config["sites"][idx]["selectors"]["id"] = id if id else ""
+        config["sites"][idx]["selectors"]["image_link"] = image_link if image_link else ""
+        config["sites"][idx]["selectors"]["remove_items_with"] = remove_items_with if remove_items_with else ""
+        config["sites"][idx]["selectors"]["end_of_pages"] = end_of_pages if end_of_pages else ""
+        if concurrency is not None:
+            config["sites"][idx]["concurrency"] = concurrency
+        if delay is not None:
+            config["sites"][idx]["delay"] = delay
+
+    CONFIG.update(change)
 
 @APP.get("/get_site_number")
 async def get_site_number():    
-    try:
-        with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-            config = json.load(f)
-    except Exception:
-        config = {}
-
-    return {"nr_sites": len(config["sites"])}
+    return {"nr_sites": len(CONFIG.get().get("sites", []))}
 
 @APP.post("/delete_site")
 async def delete_site(index: Optional[str] = Query(None, description="Index of the site to delete")):
@@ -379,20 +688,12 @@ async def delete_site(index: Optional[str] = Query(None, description="Index of t
             return
     except Exception:
         return
-    
-    try:
-        with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-            config = json.load(f)
-    except Exception:
-        return
 
-    if idx < 0 or idx >= len(config["sites"]):
-        return
+    def change(config):
+        if 0 <= idx < len(config.get("sites", [])):
+            del config["sites"][idx]
 
-    del config["sites"][idx]
-
-    with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-        json.dump(config, f, indent=2, ensure_ascii=False)
+    CONFIG.update(change)
 
 @APP.get("/product_image")
 async def get_product_image(
@@ -408,156 +709,145 @@ async def get_product_image(
 async def export_csv(
     q: Optional[str] = Query(None, description="Search query"),
     site: Optional[str] = Query(None, description="Site filter"),
-    db: aiosqlite.Connection = Depends(get_db)
+    min_price: Optional[int] = Query(None, description="minimum price in minor units (cents)"),
+    max_price: Optional[int] = Query(None, description="maximum price in minor units (cents)"),
+    gzip: bool = Query(False, description="Send the file gzip-compressed"),
 ):
-    import io
-    import csv
+    if not Database.database_initialized:
+        await init_db(DB_PATH)
 
-    resp = await list_products(q=q, site=site, per_page=-1, page=1, order_by='id', reversed=False, db=db, min_price=None, max_price=None)
-    items = resp.items if resp else None
+    where, params = build_product_filters(q, site, min_price, max_price)
 
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["id","site_name","external_id","title","link","currency","last_price","rating","ratings_count","first_seen_at","last_seen_at"])
-    
-    if items:
-        for r in items:
-            writer.writerow([r.id, r.site_name, r.external_id, r.title, r.link, r.currency, r.last_price, r.rating, r.ratings_count, r.first_seen_at, r.last_seen_at])
-    output.seek(0)
+    if gzip:
+        return StreamingResponse(stream_csv(DB_POOL, where, params, compress=True), media_type="application/gzip",
+                                 headers={"Content-Disposition": "attachment; filename=products.csv.gz"})
 
-    return StreamingResponse(output, media_type="text/csv", headers={"Content-Disposition": "attachment; filename=products.csv"})
+    return StreamingResponse(stream_csv(DB_POOL, where, params), media_type="text/csv",
+                             headers={"Content-Disposition": "attachment; filename=products.csv"})
 
 @APP.get("/export_pdf")
 async def export_pdf(
     q: Optional[str] = Query(None, description="Search query"),
     site: Optional[str] = Query(None, description="Site filter"),
-    db: aiosqlite.Connection = Depends(get_db)
+    min_price: Optional[int] = Query(None, description="minimum price in minor units (cents)"),
+    max_price: Optional[int] = Query(None, description="maximum price in minor units (cents)"),
+    sparklines: bool = Query(False, description="Draw each product's recent price trend"),
 ):
+    import os
     import tempfile
-    from reportlab.lib.pagesizes import A4
-    from reportlab.pdfgen import canvas
-    from reportlab.lib.utils import simpleSplit
     from fastapi.responses import FileResponse
+    from starlette.background import BackgroundTask
 
-    resp = await list_products(q=q, site=site, per_page=-1, page=1, order_by='id', reversed=False, db=db, min_price=None, max_price=None)
-    items = resp.items if resp else None
+    if not Database.database_initialized:
+        await init_db(DB_PATH)
+
+    where, params = build_product_filters(q, site, min_price, max_price)
 
     with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
         pdf_path = tmp.name
-    c = canvas.Canvas(pdf_path, pagesize=A4)
-    width, height = A4
-    x, y = 40, height - 40
-    line_height = 18
-    max_width = width - 80
-
-    if items:
-        keys = list(items[0].dict().keys())
-
-        c.setFont("Helvetica-Bold", 12)
-        header_text = " | ".join(keys)
-        header_lines = simpleSplit(header_text, "Helvetica-Bold", 12, max_width)
-
-        for line in header_lines:
-            c.drawString(x, y, line)
-            y -= line_height
-        
-        c.setFont("Helvetica", 10)
-        for item in items:
-            item_dict = item.dict()
-            line = " | ".join(str(item_dict.get(k, "")) for k in keys)
-            lines = simpleSplit(line, "Helvetica", 10, max_width)
-
-            for l in lines:
-                c.drawString(x, y, l)
-                y -= line_height
-                if y < 40:
-                    c.showPage()
-                    y = height - 40
-
-            y -= line_height
-            if y < 40:
-                c.showPage()
-                y = height - 40
-
-    c.save()
-    return FileResponse(pdf_path, media_type="application/pdf", filename="products.pdf")
+
+    try:
+        await write_pdf(DB_POOL, where, params, pdf_path, sparklines=sparklines)
+    except BaseException:
+        os.remove(pdf_path)
+        raise
+
+    return FileResponse(pdf_path, media_type="application/pdf", filename="products.pdf",
+                        background=BackgroundTask(os.remove, pdf_path))
 
 @APP.get("/export_xlsx")
 async def export_xlsx(q: Optional[str] = Query(None, description="Search query"),
     site: Optional[str] = Query(None, description="Site filter"),
-    db: aiosqlite.Connection = Depends(get_db)
+    min_price: Optional[int] = Query(None, description="minimum price in minor units (cents)"),
+    max_price: Optional[int] = Query(None, description="maximum price in minor units (cents)"),
+    history: bool = Query(False, description="Add the price history of the exported products"),
 ):
+    import os
     import tempfile
-    import xlsxwriter
-    from flask import jsonify
     from fastapi.responses import FileResponse
+    from starlette.background import BackgroundTask
 
-    resp = await list_products(q=q, site=site, per_page=-1, page=1, order_by='id', reversed=False, db=db, min_price=None, max_price=None)
-    items = resp.items if resp else None
+    if not Database.database_initialized:
+        await init_db(DB_PATH)
+
+    where, params = build_product_filters(q, site, min_price, max_price)
 
     with tempfile.NamedTemporaryFile(delete=False, suffix=".xlsx") as tmp:
         xlsx_path = tmp.name
 
-    workbook = xlsxwriter.Workbook(xlsx_path)
-    worksheet = workbook.add_worksheet()
+    try:
+        await write_xlsx(DB_POOL, where, params, xlsx_path, history=history)
+    except BaseException:
+        os.remove(xlsx_path)
+        raise
 
-    if items:
-        keys = list(items[0].dict().keys())
-        for col, key in enumerate(keys):
-            worksheet.write(0, col, key)
-        
-        for row, item in enumerate(items, start=1):
-            for col, key in enumerate(keys):
-                item_dict = item.dict()
-                worksheet.write(row, col, item_dict.get(key, ""))
-    workbook.close()
+    return FileResponse(xlsx_path, media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                        filename="products.xlsx", background=BackgroundTask(os.remove, xlsx_path))
 
-    return FileResponse(xlsx_path, media_type="application/pdf", filename="products.xlsx")
+@APP.get("/schedules")
+async def schedules(db: aiosqlite.Connection = Depends(get_db)):
+    return await list_schedules(db)
 
-@APP.post("/delete_schedule")
-async def delete_schedule():
-    with open(CONFIG_PATH, "r") as f:
-        config = json.load(f)
+@APP.put("/schedules/{name}")
+async def put_schedule(name: str, schedule: ScheduleIn, db: aiosqlite.Connection = Depends(get_writer)):
+    try:
+        saved = await save_schedule(db, {"name": name, **schedule.model_dump()})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    config["schedule_query"] = ""
+    SCHEDULER.wake()
+    return saved
 
-    with open(CONFIG_PATH, "w") as f:
-        json.dump(config, f, indent=2, ensure_ascii=False)
+@APP.delete("/schedules/{name}")
+async def delete_schedule_by_name(name: str, db: aiosqlite.Connection = Depends(get_writer)):
+    if not await remove_schedule(db, name):
+        raise HTTPException(status_code=404, detail="Schedule not found")
 
-    from Scheduler import delete_task
+    SCHEDULER.wake()
+    return {"ok": True}
 
-    delete_task()
+# the UI's single daily schedule, kept as the schedule named DEFAULT_SCHEDULE
+@APP.post("/delete_schedule")
+async def delete_schedule(db: aiosqlite.Connection = Depends(get_writer)):
+    await remove_schedule(db, DEFAULT_SCHEDULE)
+    SCHEDULER.wake()
 
 @APP.post("/add_schedule")
-async def add_schedule(query: str = Query(None), time: str = Query(None), discord_id: str = Query(None)):
-    with open(CONFIG_PATH, "r") as f:
-        config = json.load(f)
+async def add_schedule(query: str = Query(None), time: str = Query(None), discord_id: str = Query(None),
+                       db: aiosqlite.Connection = Depends(get_writer)):
+    if query is None or not query.strip():
+        raise HTTPException(status_code=400, detail="Invalid schedule: query is required")
 
-    config["discord_user_id"] = discord_id
+    CONFIG.update(lambda config: config.update(discord_user_id=discord_id))
 
-    with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-        json.dump(config, f, indent=2, ensure_ascii=False)
-    
-    from Scheduler import create_task
+    try:
+        hour, minute = (int(v) for v in time.split(":"))
+        await save_schedule(db, {"name": DEFAULT_SCHEDULE, "query": query, "cron": f"{minute} {hour} * * *",
+                                 "mode": CONFIG.get().get("schedule_mode", DEFAULT_SCHEDULE_MODE)})
+    except (AttributeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid schedule: {e}")
 
-    create_task(run_time=time, scrape_query=query)
+    SCHEDULER.wake()
 
 @APP.get("/get_schedule_data")
-async def get_schedule_data():
-    with open(CONFIG_PATH, "r") as f:
-        config = json.load(f)
+async def get_schedule_data(db: aiosqlite.Connection = Depends(get_db)):
+    schedule = next((s for s in await list_schedules(db) if s["name"] == DEFAULT_SCHEDULE), None)
+    fields = (schedule["cron"] or "").split() if schedule else []
+    minute, hour = fields[:2] if len(fields) == 5 else ("", "")
+    # a schedule edited through /schedules may not be a plain daily time
+    time = f"{int(hour):02d}:{int(minute):02d}" if hour.isdigit() and minute.isdigit() else ""
 
     return {
-        "query": config["schedule_query"],
-        "time": config["schedule_time"],
-        "discord_id": config["discord_user_id"]
+        "query": schedule["query"] if schedule else "",
+        "time": time,
+        "discord_id": CONFIG.get()["discord_user_id"]
     }
 
 @APP.post("/add_watch_products")
 async def add_watch_products(
     ids: NumbersRequest,
     max_price: Optional[str] = Query(None),
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_writer)
 ):
     q_marks = ','.join(['?'] * len(ids.numbers))
     if max_price is not None:
@@ -566,11 +856,13 @@ async def add_watch_products(
         await db.execute(f"UPDATE products SET watch_price = 1 WHERE id IN ({q_marks})", ids.numbers)
 
     await db.commit()
+    # a product already under its max price alerts now rather than after its next price change
+    await evaluate_alerts(db, ids.numbers, {"below_max": alert_rules(CONFIG.get())["below_max"]})
 
 @APP.post("/delete_watch_products")
 async def delete_watch_products(
     ids: NumbersRequest,
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_writer)
 ):
     q_marks = ','.join(['?'] * len(ids.numbers))
     await db.execute(f"UPDATE products SET watch_price = 0 WHERE id IN ({q_marks})", ids.numbers) 
@@ -595,18 +887,16 @@ async def is_product_tracked(
 async def set_notify_price(
     id: str = Query(None),
     new_max_price: str = Query(None),
-    db: aiosqlite.Connection = Depends(get_db)
+    db: aiosqlite.Connection = Depends(get_writer)
 ):
     await db.execute("UPDATE products SET watch_max_price = ? WHERE id = ?", (new_max_price, id))
     await db.commit()
+    await evaluate_alerts(db, [int(id)], {"below_max": alert_rules(CONFIG.get())["below_max"]})
 
     return {"ok": True}
 
 @APP.get("/total_products")
 async def get_total_products(db: aiosqlite.Connection = Depends(get_db)):
-    async with db.execute("SELECT COUNT(*) FROM products") as cur:
-        row = await cur.fetchone()
-
-    return {"total": row[0] if row else 0}
+    return {"total": await count_products(db, [], [])}
 
 # python -m uvicorn API:APP --reload --host 0.0.0.0 --port 8000
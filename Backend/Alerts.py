@@ -0,0 +1,88 @@
+import aiosqlite
+
+from typing import Any, Dict, Iterable, List, Optional
+
+from Database import NOW_SQL, chunked
+
+# "below_max": the price is under the product's watch_max_price (what the scheduler used to check)
+# "pct_drop": the last price change was a drop of at least this many percent, 0 turns it off
+# "all_time_low": the price dropped to the lowest the product has ever been seen at
+DEFAULT_ALERT_RULES = {"below_max": True, "pct_drop": 0, "all_time_low": False}
+
+# one SELECT per rule over the watched rows; detail is what the rule compared against
+RULE_SQL = {
+    "below_max": "SELECT id, 'below_max', last_price, watch_max_price FROM watched WHERE last_price < watch_max_price",
+    "pct_drop": "SELECT id, 'pct_drop', last_price, last_change_pct FROM watched WHERE last_change_pct <= -:pct_drop",
+    "all_time_low": "SELECT id, 'all_time_low', last_price, all_time_min FROM watched "
+                    "WHERE last_change < 0 AND last_price <= all_time_min",
+}
+
+def alert_rules(config: Dict[str, Any]) -> Dict[str, Any]:
+    return {**DEFAULT_ALERT_RULES, **config.get("alert_rules", {})}
+
+def enabled_rules(rules: Dict[str, Any]) -> List[str]:
+    return [rule for rule in RULE_SQL if rules.get(rule) and float(rules[rule]) > 0]
+
+async def evaluate_alerts(db: aiosqlite.Connection, product_ids: Iterable[int], rules: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # checks the rules for just these products (the ones a write just changed), so the cost follows the
+    # size of the change and not of the catalogue. An alert is stored once per product, rule and price:
+    # the same price never alerts twice, a new price that still matches does. Returns the new alerts
+    product_ids = list(dict.fromkeys(product_ids))
+    selects = enabled_rules(rules)
+    if not product_ids or not selects:
+        return []
+
+    alerts = []
+    for chunk in chunked(product_ids):
+        params = {f"id{i}": product_id for i, product_id in enumerate(chunk)}
+        params["pct_drop"] = float(rules.get("pct_drop") or 0)
+        q_marks = ','.join(f":id{i}" for i in range(len(chunk)))
+
+        async with db.execute(f"""
+            WITH watched AS (
+              SELECT products.id, products.last_price, products.watch_max_price,
+                     product_stats.last_change, product_stats.last_change_pct, product_stats.all_time_min
+              FROM products JOIN product_stats ON product_stats.product_id = products.id
+              WHERE products.id IN ({q_marks}) AND products.watch_price = 1 AND products.last_price IS NOT NULL
+            )
+            INSERT OR IGNORE INTO alerts(product_id, rule, price_minor, detail)
+            {" UNION ALL ".join(RULE_SQL[rule] for rule in selects)}
+            RETURNING id, product_id, rule, price_minor, detail
+        """, params) as cur:
+            columns = [d[0] for d in cur.description]
+            alerts += [dict(zip(columns, row)) for row in await cur.fetchall()]
+
+    await db.commit()
+
+    return alerts
+
+async def load_pending_alerts(db: aiosqlite.Connection, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    # alerts nobody has been told about yet, oldest first; reads the partial index on notified_at
+    async with db.execute(f"""
+        SELECT alerts.id, alerts.product_id, alerts.rule, alerts.price_minor, alerts.detail, alerts.created_at,
+               products.title, products.link, products.site_name, products.currency
+        FROM alerts JOIN products ON products.id = alerts.product_id
+        WHERE alerts.notified_at IS NULL
+        ORDER BY alerts.id
+        {"LIMIT " + str(int(limit)) if limit else ""}
+    """) as cur:
+        columns = [d[0] for d in cur.description]
+        return [dict(zip(columns, row)) for row in await cur.fetchall()]
+
+async def mark_alerts_notified(db: aiosqlite.Connection, alert_ids: List[int]) -> None:
+    for chunk in chunked(alert_ids):
+        q_marks = ','.join(['?'] * len(chunk))
+        await db.execute(f"""
+            UPDATE alerts SET notified_at = ({NOW_SQL}) WHERE id IN ({q_marks})
+        """, chunk)
+
+    await db.commit()
+
+def describe_alert(alert: Dict[str, Any]) -> str:
+    price = f"{alert['price_minor']} {alert.get('currency') or ''}".strip()
+    if alert["rule"] == "below_max":
+        return f"{alert['title']} — {price} < {alert['detail']:g}"
+    if alert["rule"] == "pct_drop":
+        return f"{alert['title']} — {price} ({alert['detail']:g}%)"
+
+    return f"{alert['title']} — {price}, lowest ever"
@@ -0,0 +1,82 @@
+import copy
+import json
+import os
+import tempfile
+import threading
+
+from typing import Callable, Dict, Any
+
+from Database import CONFIG_PATH
+
+class ConfigStore:
+    # config.json parsed once and served from memory. Every read checks the file's mtime and size,
+    # so edits made by hand or by another process are picked up; writes go to a temp file that
+    # replaces config.json, so nobody ever reads a half-written file
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.config: Dict[str, Any] = {}
+        self.stamp = None
+
+    def file_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+
+        return st.st_mtime_ns, st.st_size
+
+    def reload_if_changed(self) -> None:
+        stamp = self.file_stamp()
+        if stamp is None or stamp == self.stamp:
+            return
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            # keep the last good config, a hand edit may be half saved
+            print("[warn] Could not read config:", e)
+            return
+
+        self.config, self.stamp = config, stamp
+
+    def get(self) -> Dict[str, Any]:
+        # the returned dict is shared and must not be changed in place; update() swaps in a new one
+        with self.lock:
+            self.reload_if_changed()
+            return self.config
+
+    def update(self, change: Callable[[Dict[str, Any]], Any]):
+        # change() edits a private copy, which is written out and then published
+        with self.lock:
+            self.reload_if_changed()
+            config = copy.deepcopy(self.config)
+            result = change(config)
+
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(config, f, indent=2, ensure_ascii=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+            self.config, self.stamp = config, self.file_stamp()
+            return result
+
+STORES: Dict[str, ConfigStore] = dict()
+STORES_LOCK = threading.Lock()
+
+def config_store(path: str = CONFIG_PATH) -> ConfigStore:
+    # one store per file, shared by the API, the scraper and the scheduler in the same process
+    key = os.path.normcase(os.path.abspath(path))
+    with STORES_LOCK:
+        if key not in STORES:
+            STORES[key] = ConfigStore(path)
+
+        return STORES[key]
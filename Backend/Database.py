@@ -1,16 +1,44 @@
 import aiosqlite
+import asyncio
 import os
+import time
 
-from typing import Optional
+from contextlib import asynccontextmanager
+from typing import Optional, List, Dict, Any
+from Matcher import search_text
+import Metrics
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = SCRIPT_DIR + "\\../\\Data\\tracker.db"
-CONFIG_PATH = SCRIPT_DIR + "\\../\\Data\\config.json"
+DB_PATH = os.path.join(SCRIPT_DIR, "..", "Data", "tracker.db")
+CONFIG_PATH = os.path.join(SCRIPT_DIR, "..", "Data", "config.json")
 NOW_SQL = "strftime('%Y-%m-%d %H:%M:%f','now','localtime')"
+SQL_MAX_PARAMS = 500
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+STATEMENT_CACHE_SIZE = 256
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA busy_timeout = 5000",
+)
+PRICE_HISTORY_TABLE = """
+CREATE TABLE {name} (
+  product_id INTEGER NOT NULL,
+  valid_from DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f','now','localtime')),
+  valid_to   DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f','now','localtime')),
+  price_minor INTEGER,
+  observations INTEGER NOT NULL DEFAULT 1,
+  PRIMARY KEY(product_id, valid_from),
+  FOREIGN KEY(product_id) REFERENCES products(id)
+) WITHOUT ROWID;
+"""
+STATS_WINDOWS = (7, 30, 90)
 database_initialized = False
 
 async def init_db(path: str = DB_PATH) -> None:
     async with aiosqlite.connect(path) as db:
+        await db.execute("PRAGMA journal_mode = WAL")
         await db.executescript("""
         CREATE TABLE IF NOT EXISTS products (
           id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -27,25 +55,374 @@ async def init_db(path: str = DB_PATH) -> None:
           last_seen_at  DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f','now','localtime')),
           watch_price INTEGER NOT NULL,
           watch_max_price INTEGER,
+          search_title TEXT,
           UNIQUE(site_name, external_id)
         );
-        CREATE TABLE IF NOT EXISTS price_history (
+        CREATE INDEX IF NOT EXISTS idx_products_site_external ON products(site_name, external_id);
+        CREATE INDEX IF NOT EXISTS idx_products_site_link ON products(site_name, link);
+        CREATE INDEX IF NOT EXISTS idx_products_order_site ON products(site_name);
+        CREATE INDEX IF NOT EXISTS idx_products_order_title ON products(title);
+        CREATE INDEX IF NOT EXISTS idx_products_order_price ON products(IFNULL(last_price, -1));
+        CREATE INDEX IF NOT EXISTS idx_products_order_rating ON products(IFNULL(rating, -1));
+        CREATE INDEX IF NOT EXISTS idx_products_order_seen ON products(last_seen_at);
+        CREATE INDEX IF NOT EXISTS idx_products_watched ON products(site_name) WHERE watch_price = 1;
+
+        CREATE TABLE IF NOT EXISTS scrape_runs (
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          query TEXT NOT NULL,
+          started_at DATETIME NOT NULL,
+          finished_at DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f','now','localtime')),
+          changed_products INTEGER NOT NULL,
+          errors TEXT,
+          mode TEXT NOT NULL DEFAULT 'full',
+          pages INTEGER NOT NULL DEFAULT 0
+        );
+
+        CREATE TABLE IF NOT EXISTS page_fingerprints (
+          site_name TEXT NOT NULL,
+          query TEXT NOT NULL,
+          page INTEGER NOT NULL,
+          fingerprint TEXT NOT NULL,
+          seen_at DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f','now','localtime')),
+          PRIMARY KEY(site_name, query, page)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS alerts (
           id INTEGER PRIMARY KEY AUTOINCREMENT,
           product_id INTEGER NOT NULL,
-          price_minor INTEGER,
-          captured_at DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f','now','localtime')),
+          rule TEXT NOT NULL,
+          price_minor INTEGER NOT NULL,
+          detail REAL,
+          created_at DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f','now','localtime')),
+          notified_at DATETIME,
+          UNIQUE(product_id, rule, price_minor),
           FOREIGN KEY(product_id) REFERENCES products(id)
         );
-        CREATE INDEX IF NOT EXISTS idx_products_site_external ON products(site_name, external_id);
-        CREATE INDEX IF NOT EXISTS idx_products_site_link ON products(site_name, link);
-        CREATE INDEX IF NOT EXISTS idx_price_history_product ON price_history(product_id, captured_at);
+        CREATE INDEX IF NOT EXISTS idx_alerts_pending ON alerts(id) WHERE notified_at IS NULL;
+        CREATE TRIGGER IF NOT EXISTS alerts_product_delete AFTER DELETE ON products BEGIN
+          DELETE FROM alerts WHERE product_id = old.id;
+        END;
+
+        CREATE TABLE IF NOT EXISTS watch_checks (
+          product_id INTEGER PRIMARY KEY,
+          interval_hours REAL NOT NULL,
+          next_check_at DATETIME NOT NULL,
+          checked_at DATETIME,
+          FOREIGN KEY(product_id) REFERENCES products(id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_watch_checks_due ON watch_checks(next_check_at);
+        CREATE TRIGGER IF NOT EXISTS watch_checks_product_delete AFTER DELETE ON products BEGIN
+          DELETE FROM watch_checks WHERE product_id = old.id;
+        END;
+
+        CREATE TABLE IF NOT EXISTS schedules (
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          name TEXT NOT NULL UNIQUE,
+          query TEXT NOT NULL,
+          mode TEXT NOT NULL DEFAULT 'incremental',
+          cron TEXT,
+          interval_minutes INTEGER,
+          jitter_seconds INTEGER NOT NULL DEFAULT 0,
+          catch_up INTEGER NOT NULL DEFAULT 1,
+          enabled INTEGER NOT NULL DEFAULT 1,
+          next_run_at DATETIME,
+          last_run_at DATETIME,
+          last_job_id INTEGER
+        );
+
+        CREATE TABLE IF NOT EXISTS db_meta (
+          key TEXT PRIMARY KEY,
+          value INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO db_meta(key, value) VALUES ('products_version', 0);
+
+        CREATE TRIGGER IF NOT EXISTS products_version_insert AFTER INSERT ON products BEGIN
+          UPDATE db_meta SET value = value + 1 WHERE key = 'products_version';
+        END;
+        CREATE TRIGGER IF NOT EXISTS products_version_delete AFTER DELETE ON products BEGIN
+          UPDATE db_meta SET value = value + 1 WHERE key = 'products_version';
+        END;
+        CREATE TRIGGER IF NOT EXISTS products_version_update AFTER UPDATE OF title, site_name, last_price ON products
+        WHEN OLD.title IS NOT NEW.title OR OLD.site_name IS NOT NEW.site_name OR OLD.last_price IS NOT NEW.last_price BEGIN
+          UPDATE db_meta SET value = value + 1 WHERE key = 'products_version';
+        END;
         """)
 
+        async with db.execute("PRAGMA table_info(scrape_runs)") as cur:
+            run_columns = [row[1] for row in await cur.fetchall()]
+        for column, definition in (("mode", "TEXT NOT NULL DEFAULT 'full'"), ("pages", "INTEGER NOT NULL DEFAULT 0")):
+            if column not in run_columns:
+                await db.execute(f"ALTER TABLE scrape_runs ADD COLUMN {column} {definition}")
+
+        await migrate_search_index(db)
+        await migrate_price_intervals(db)
+        await migrate_product_stats(db)
         await db.commit()
 
         global database_initialized
         database_initialized = True
 
+async def migrate_search_index(db: aiosqlite.Connection) -> None:
+    async with db.execute("PRAGMA table_info(products)") as cur:
+        columns = [row[1] for row in await cur.fetchall()]
+    if "search_title" not in columns:
+        await db.execute("ALTER TABLE products ADD COLUMN search_title TEXT")
+
+    async with db.execute("SELECT 1 FROM sqlite_master WHERE name = 'products_fts'") as cur:
+        fts_exists = await cur.fetchone() is not None
+
+    await db.executescript("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+      search_title, content='products', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    );
+    CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+      INSERT INTO products_fts(rowid, search_title) VALUES (new.id, new.search_title);
+    END;
+    CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+      INSERT INTO products_fts(products_fts, rowid, search_title) VALUES ('delete', old.id, old.search_title);
+    END;
+    CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE OF search_title ON products
+    WHEN OLD.search_title IS NOT NEW.search_title BEGIN
+      INSERT INTO products_fts(products_fts, rowid, search_title) VALUES ('delete', old.id, old.search_title);
+      INSERT INTO products_fts(rowid, search_title) VALUES (new.id, new.search_title);
+    END;
+    """)
+
+    async with db.execute("SELECT id, title FROM products WHERE search_title IS NULL") as cur:
+        missing = await cur.fetchall()
+    if missing:
+        await db.executemany("UPDATE products SET search_title = ? WHERE id = ?",
+                             [(search_text(title), product_id) for product_id, title in missing])
+
+    if not fts_exists:
+        await db.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+
+async def migrate_price_intervals(db: aiosqlite.Connection) -> None:
+    # price_history used to be one row per price change whose captured_at was bumped on every unchanged
+    # observation; it is now one interval per run of equal prices. The table is clustered on
+    # (product_id, valid_from), which never changes once written, so it is its own covering index and
+    # an unchanged observation only rewrites valid_to and observations in place
+    async with db.execute("PRAGMA table_info(price_history)") as cur:
+        columns = [row[1] for row in await cur.fetchall()]
+
+    if columns and "captured_at" not in columns:
+        return
+
+    create = PRICE_HISTORY_TABLE.format(name="price_history_intervals" if columns else "price_history")
+    if not columns:
+        await db.executescript(create)
+        return
+
+    # consecutive rows at the same price fold into one interval; the time a migrated price was first
+    # seen is gone, so those intervals start at their oldest surviving observation
+    await db.executescript(f"""
+    BEGIN;
+    {create}
+    INSERT OR IGNORE INTO price_history_intervals(product_id, valid_from, valid_to, price_minor, observations)
+    SELECT product_id, MIN(captured_at), MAX(captured_at), price_minor, COUNT(*)
+    FROM (
+      SELECT product_id, price_minor, captured_at,
+             ROW_NUMBER() OVER (PARTITION BY product_id ORDER BY captured_at, id)
+           - ROW_NUMBER() OVER (PARTITION BY product_id, price_minor ORDER BY captured_at, id) AS run
+      FROM price_history
+    )
+    GROUP BY product_id, price_minor, run;
+    DROP TABLE price_history;
+    ALTER TABLE price_history_intervals RENAME TO price_history;
+    COMMIT;
+    """)
+
+async def migrate_product_stats(db: aiosqlite.Connection) -> None:
+    # one row per product, created and removed with it, so the products list can always join it.
+    # All-time and last-change values move with each price write, the rolling windows are recomputed
+    # by refresh_window_stats for the products a write touched
+    async with db.execute("SELECT 1 FROM sqlite_master WHERE name = 'product_stats'") as cur:
+        stats_exists = await cur.fetchone() is not None
+
+    windows = "".join(f"min_{d}d INTEGER, avg_{d}d REAL, " for d in STATS_WINDOWS)
+    await db.executescript(f"""
+    CREATE TABLE IF NOT EXISTS product_stats (
+      product_id INTEGER PRIMARY KEY,
+      all_time_min INTEGER,
+      all_time_max INTEGER,
+      {windows}
+      last_change INTEGER,
+      last_change_pct REAL,
+      last_change_at DATETIME,
+      FOREIGN KEY(product_id) REFERENCES products(id)
+    );
+    CREATE INDEX IF NOT EXISTS idx_product_stats_change_pct ON product_stats(IFNULL(last_change_pct, 0));
+    CREATE INDEX IF NOT EXISTS idx_product_stats_change_at ON product_stats(IFNULL(last_change_at, ''));
+    CREATE TRIGGER IF NOT EXISTS product_stats_insert AFTER INSERT ON products BEGIN
+      INSERT OR IGNORE INTO product_stats(product_id) VALUES (new.id);
+    END;
+    CREATE TRIGGER IF NOT EXISTS product_stats_delete AFTER DELETE ON products BEGIN
+      DELETE FROM product_stats WHERE product_id = old.id;
+    END;
+    """)
+
+    if stats_exists:
+        return
+
+    # backfill from the existing history: extremes over all intervals, the last change between
+    # consecutive known prices, then the windows
+    await db.executescript("""
+    INSERT OR IGNORE INTO product_stats(product_id) SELECT id FROM products;
+
+    UPDATE product_stats SET all_time_min = h.low, all_time_max = h.high
+    FROM (
+      SELECT product_id, MIN(price_minor) AS low, MAX(price_minor) AS high
+      FROM price_history GROUP BY product_id
+    ) AS h
+    WHERE h.product_id = product_stats.product_id;
+
+    UPDATE product_stats SET last_change = c.price_minor - c.previous,
+                             last_change_pct = ROUND(100.0 * (c.price_minor - c.previous) / c.previous, 2),
+                             last_change_at = c.valid_from
+    FROM (
+      SELECT product_id, price_minor, previous, valid_from,
+             ROW_NUMBER() OVER (PARTITION BY product_id ORDER BY valid_from DESC) AS n
+      FROM (
+        SELECT product_id, price_minor, valid_from,
+               LAG(price_minor) OVER (PARTITION BY product_id ORDER BY valid_from) AS previous
+        FROM price_history WHERE price_minor IS NOT NULL
+      )
+      WHERE price_minor != previous
+    ) AS c
+    WHERE c.n = 1 AND c.product_id = product_stats.product_id;
+    """)
+
+    async with db.execute("SELECT product_id FROM product_stats") as cur:
+        product_ids = [row[0] for row in await cur.fetchall()]
+    await refresh_window_stats(db, product_ids)
+
+async def refresh_window_stats(db: aiosqlite.Connection, product_ids: List[int]) -> None:
+    # old observations leave a window without a write of their own, so the windows are recomputed
+    # instead of carried; with one row per price interval that is a handful of rows per product.
+    # The averages weigh each interval by its observations, like the history chart's
+    columns, values = [], []
+    for d in STATS_WINDOWS:
+        since = f"strftime('%Y-%m-%d %H:%M:%f','now','localtime','-{d} days')"
+        columns += [f"min_{d}d", f"avg_{d}d"]
+        values += [
+            f"MIN(CASE WHEN valid_to >= {since} THEN price_minor END)",
+            f"ROUND(1.0 * SUM(CASE WHEN valid_to >= {since} THEN price_minor * observations END)"
+            f" / SUM(CASE WHEN valid_to >= {since} AND price_minor IS NOT NULL THEN observations END), 2)",
+        ]
+    oldest = f"strftime('%Y-%m-%d %H:%M:%f','now','localtime','-{max(STATS_WINDOWS)} days')"
+
+    for chunk in chunked(product_ids):
+        q_marks = ','.join(['?'] * len(chunk))
+        await db.execute(f"""
+            UPDATE product_stats SET ({', '.join(columns)}) = (
+              SELECT {', '.join(values)}
+              FROM price_history
+              WHERE price_history.product_id = product_stats.product_id AND valid_to >= {oldest}
+            )
+            WHERE product_id IN ({q_marks})
+        """, chunk)
+
+async def record_price_stats(db: aiosqlite.Connection, changes: List[tuple]) -> None:
+    # changes are (product_id, price_minor) pairs about to be written as new intervals; run before the
+    # insert so the latest known price in price_history is still the previous one
+    await db.executemany(f"""
+        UPDATE product_stats SET
+          all_time_min = COALESCE(MIN(all_time_min, new.price), all_time_min, new.price),
+          all_time_max = COALESCE(MAX(all_time_max, new.price), all_time_max, new.price),
+          last_change = CASE WHEN new.price != new.previous THEN new.price - new.previous ELSE last_change END,
+          last_change_pct = CASE WHEN new.price != new.previous
+            THEN ROUND(100.0 * (new.price - new.previous) / new.previous, 2) ELSE last_change_pct END,
+          last_change_at = CASE WHEN new.price != new.previous THEN {NOW_SQL} ELSE last_change_at END
+        FROM (
+          SELECT ? AS id, ? AS price, (
+            SELECT price_minor FROM price_history
+            WHERE product_id = ?1 AND price_minor IS NOT NULL
+            ORDER BY valid_from DESC LIMIT 1
+          ) AS previous
+        ) AS new
+        WHERE product_id = new.id
+    """, changes)
+
+async def connect(path: str = DB_PATH) -> aiosqlite.Connection:
+    db = await aiosqlite.connect(path, cached_statements=STATEMENT_CACHE_SIZE)
+    for pragma in CONNECTION_PRAGMAS:
+        await db.execute(pragma)
+
+    return db
+
+class ConnectionPool:
+    # Reader connections are handed out one request at a time; all writes share one connection
+    def __init__(self, path: str = DB_PATH, size: int = DB_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self.readers: asyncio.Queue = asyncio.Queue()
+        # Queue.get hands a returned connection to whoever asks first, so a task that releases and
+        # asks again would keep it; waiting in a lock first serves waiters in arrival order
+        self.reader_turn = asyncio.Lock()
+        self.connections: List[aiosqlite.Connection] = []
+        self.write_conn: Optional[aiosqlite.Connection] = None
+        self.write_lock = asyncio.Lock()
+        self.write_commits = 0
+
+    async def open(self) -> None:
+        if self.write_conn is not None:
+            return
+
+        self.write_conn = await connect(self.path)
+        if Metrics.METRICS_ENABLED:
+            # commits are counted where they're made; a trace callback would cost a Python call per statement
+            self.write_conn.commit = self.counted_commit
+        for _ in range(self.size):
+            db = await connect(self.path)
+            self.connections.append(db)
+            self.readers.put_nowait(db)
+
+    async def close(self) -> None:
+        for db in self.connections:
+            await db.close()
+        self.connections = []
+        self.readers = asyncio.Queue()
+
+        if self.write_conn is not None:
+            await self.write_conn.close()
+            self.write_conn = None
+
+    @asynccontextmanager
+    async def reader(self):
+        if self.size == 0:
+            async with self.writer() as db:
+                yield db
+            return
+
+        async with self.reader_turn:
+            db = await self.readers.get()
+        try:
+            yield db
+        finally:
+            self.readers.put_nowait(db)
+
+    async def counted_commit(self) -> None:
+        # sqlite3 only sends COMMIT when a transaction is open
+        if self.write_conn.in_transaction:
+            self.write_commits += 1
+        await aiosqlite.Connection.commit(self.write_conn)
+
+    @asynccontextmanager
+    async def writer(self):
+        requested = time.perf_counter()
+        async with self.write_lock:
+            acquired = time.perf_counter()
+            commits = self.write_commits
+            try:
+                yield self.write_conn
+            except BaseException:
+                await self.write_conn.rollback()
+                raise
+            finally:
+                Metrics.observe("db_writer_wait_seconds", acquired - requested)
+                Metrics.observe("db_writer_hold_seconds", time.perf_counter() - acquired)
+                Metrics.inc("db_commits_total", self.write_commits - commits)
+
 async def upsert_product(db: aiosqlite.Connection,
                          site_name: str,
                          title: str,
@@ -58,34 +435,30 @@ async def upsert_product(db: aiosqlite.Connection,
                          min_hours_between_changes: float) -> int:
 
     await db.execute("""
-        INSERT OR IGNORE INTO products(site_name, external_id, image_link, title, link, currency, rating, ratings_count, watch_price, watch_max_price)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (site_name, external_id, image_link, title, link, currency, rating, ratings_count, 0, 0))
+        INSERT OR IGNORE INTO products(site_name, external_id, image_link, title, link, currency, rating, ratings_count, watch_price, watch_max_price, search_title)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (site_name, external_id, image_link, title, link, currency, rating, ratings_count, 0, 0, search_text(title)))
 
-    async with db.execute("""
-        SELECT id, price_minor, captured_at
+    async with db.execute(f"""
+        SELECT (julianday({NOW_SQL}) - julianday(valid_to)) * 24.0
         FROM price_history
         WHERE product_id = ?
-        ORDER BY captured_at DESC
+        ORDER BY valid_from DESC
         LIMIT 1
     """, (external_id,)) as cur:
         last_hist = await cur.fetchone()
 
     if last_hist:
-        _, _, last_captured_at = last_hist
-
-        async with db.execute(f"SELECT (julianday({NOW_SQL}) - julianday(?)) * 24.0", (last_captured_at,)) as q:
-            diff_row = await q.fetchone()
-        diff_hours = diff_row[0] if diff_row else None
+        diff_hours = last_hist[0]
 
         if diff_hours is not None and diff_hours < min_hours_between_changes:
             await db.execute(f"""
                 UPDATE products
-                SET title = ?, link = ?, currency = COALESCE(?, currency),
+                SET title = ?, search_title = ?, link = ?, currency = COALESCE(?, currency),
                     rating = COALESCE(?, rating), ratings_count = COALESCE(?, ratings_count),
                     last_seen_at = ({NOW_SQL})
                 WHERE site_name = ? AND external_id = ?
-            """, (title, link, currency, rating, ratings_count, site_name, external_id))
+            """, (title, search_text(title), link, currency, rating, ratings_count, site_name, external_id))
 
             await db.commit()
 
@@ -98,33 +471,28 @@ async def upsert_price_history(db: aiosqlite.Connection,
                                price_minor: Optional[int],
                                min_hours_between_changes: float) -> None:
     
-    async with db.execute("""
-        SELECT id, price_minor, captured_at
+    async with db.execute(f"""
+        SELECT valid_from, (julianday({NOW_SQL}) - julianday(valid_to)) * 24.0
         FROM price_history
         WHERE product_id = ?
-        ORDER BY captured_at DESC
+        ORDER BY valid_from DESC
         LIMIT 1
     """, (product_id,)) as cur:
         last_hist = await cur.fetchone()
 
-    if last_hist:
-        _, _, last_captured_at = last_hist
-
-        async with db.execute(f"SELECT (julianday({NOW_SQL}) - julianday(?)) * 24.0", (last_captured_at,)) as q:
-            diff_row = await q.fetchone()
-        diff_hours = diff_row[0] if diff_row else None
-
-        if diff_hours is not None and diff_hours < min_hours_between_changes:
-            return
+    last_valid_from, diff_hours = last_hist if last_hist else (None, None)
+    if diff_hours is not None and diff_hours < min_hours_between_changes:
+        return
         
     async with db.execute("SELECT last_price FROM products WHERE id = ?", (product_id,)) as cur:
         row = await cur.fetchone()
     last_price = row[0] if row is not None else None
 
     if last_price is None:
+        await record_price_stats(db, [(product_id, price_minor)])
         await db.execute(f"""
-            INSERT INTO price_history(product_id, price_minor, captured_at)
-            VALUES (?, ?, {NOW_SQL})
+            INSERT OR REPLACE INTO price_history(product_id, price_minor, valid_from, valid_to)
+            VALUES (?, ?, {NOW_SQL}, {NOW_SQL})
         """, (product_id, price_minor))
 
         await db.execute(f"""
@@ -133,25 +501,25 @@ async def upsert_price_history(db: aiosqlite.Connection,
             WHERE id = ?
         """, (price_minor, 0, price_minor, product_id))
 
+        await refresh_window_stats(db, [product_id])
         await db.commit()
         return
     
-    if last_price == price_minor:
-        async with db.execute(
-            "SELECT id FROM price_history WHERE product_id = ? ORDER BY captured_at DESC LIMIT 1",
-            (product_id,)) as cur:
-            last_row = await cur.fetchone()
-
-        last_hist_id = last_row[0] if last_row is not None else None
-        await db.execute(f"UPDATE price_history SET captured_at = ({NOW_SQL}) WHERE id = ?", (last_hist_id,))
+    if last_price == price_minor and last_valid_from is not None:
+        await db.execute(f"""
+            UPDATE price_history SET valid_to = ({NOW_SQL}), observations = observations + 1
+            WHERE product_id = ? AND valid_from = ?
+        """, (product_id, last_valid_from))
 
         await db.execute(f"UPDATE products SET last_seen_at = ({NOW_SQL}) WHERE id = ?", (product_id,))
+        await refresh_window_stats(db, [product_id])
         await db.commit()
         return
 
+    await record_price_stats(db, [(product_id, price_minor)])
     await db.execute(f"""
-        INSERT INTO price_history(product_id, price_minor, captured_at)
-        VALUES (?, ?, {NOW_SQL})
+        INSERT OR REPLACE INTO price_history(product_id, price_minor, valid_from, valid_to)
+        VALUES (?, ?, {NOW_SQL}, {NOW_SQL})
     """, (product_id, price_minor))
 
     await db.execute(f"""
@@ -159,5 +527,146 @@ async def upsert_price_history(db: aiosqlite.Connection,
         SET last_price = ?, last_seen_at = ({NOW_SQL})
         WHERE id = ?
     """, (price_minor, product_id))
-    
+
+    await refresh_window_stats(db, [product_id])
+    await db.commit()
+
+async def record_scrape_run(db: aiosqlite.Connection, query: str, started_at: str, changed_products: int,
+                            errors: List[str], mode: str = "full", pages: int = 0) -> None:
+    # run results used to be written back into config.json as nr_changed_products
+    await db.execute("""
+        INSERT INTO scrape_runs(query, started_at, changed_products, errors, mode, pages) VALUES (?, ?, ?, ?, ?, ?)
+    """, (query, started_at, changed_products, "\n".join(errors) or None, mode, pages))
+    await db.commit()
+
+async def load_page_fingerprints(db: aiosqlite.Connection, site_name: str, query: str) -> Dict[int, str]:
+    async with db.execute("SELECT page, fingerprint FROM page_fingerprints WHERE site_name = ? AND query = ?",
+                          (site_name, query)) as cur:
+        return {page: fingerprint for page, fingerprint in await cur.fetchall()}
+
+async def save_page_fingerprint(db: aiosqlite.Connection, site_name: str, query: str, page: int, fingerprint: str) -> None:
+    await db.execute(f"""
+        INSERT INTO page_fingerprints(site_name, query, page, fingerprint) VALUES (?, ?, ?, ?)
+        ON CONFLICT(site_name, query, page) DO UPDATE SET fingerprint = excluded.fingerprint, seen_at = ({NOW_SQL})
+    """, (site_name, query, page, fingerprint))
     await db.commit()
+
+async def load_watched_products(db: aiosqlite.Connection, site_name: str) -> List[Dict[str, Any]]:
+    # the stored columns upsert_products_bulk expects, so a recheck only has to supply the price
+    async with db.execute("""
+        SELECT external_id, title, link, image_link, currency, rating, ratings_count
+        FROM products WHERE watch_price = 1 AND site_name = ?
+        ORDER BY id
+    """, (site_name,)) as cur:
+        columns = [d[0] for d in cur.description]
+        return [dict(zip(columns, row)) for row in await cur.fetchall()]
+
+def chunked(values: List[Any], size: int = SQL_MAX_PARAMS):
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+async def upsert_products_bulk(db: aiosqlite.Connection,
+                               site_name: str,
+                               items: List[Dict[str, Any]],
+                               min_hours_between_changes: float,
+                               changed: Optional[List[int]] = None) -> List[int]:
+    # items carry the products columns plus "price_minor"; one transaction, one commit per call.
+    # The ids of products whose price moved are appended to changed, for the alert rules.
+    # Items without an external_id are skipped, like the INSERT OR IGNORE of upsert_product did
+    items = [item for item in items if item["external_id"]]
+    if not items:
+        return []
+
+    by_external_id = {item["external_id"]: item for item in items}
+
+    await db.executemany(f"""
+        INSERT INTO products(site_name, external_id, image_link, title, link, currency, rating, ratings_count, watch_price, watch_max_price, search_title)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, 0, ?)
+        ON CONFLICT(site_name, external_id) DO UPDATE SET
+            title = excluded.title,
+            search_title = excluded.search_title,
+            link = excluded.link,
+            image_link = excluded.image_link,
+            currency = COALESCE(excluded.currency, currency),
+            rating = COALESCE(excluded.rating, rating),
+            ratings_count = COALESCE(excluded.ratings_count, ratings_count),
+            last_seen_at = ({NOW_SQL})
+    """, [(site_name, it["external_id"], it["image_link"] or "N/A", it["title"], it["link"] or "N/A", it["currency"],
+           it["rating"], it["ratings_count"], search_text(it["title"])) for it in by_external_id.values()])
+
+    products = dict()
+    for chunk in chunked(list(by_external_id.keys())):
+        q_marks = ','.join(['?'] * len(chunk))
+        async with db.execute(f"""
+            SELECT external_id, id, last_price
+            FROM products
+            WHERE site_name = ? AND external_id IN ({q_marks})
+        """, [site_name, *chunk]) as cur:
+            for external_id, product_id, last_price in await cur.fetchall():
+                products[external_id] = (product_id, last_price)
+
+    latest = dict()
+    product_ids = [product_id for product_id, _ in products.values()]
+    for chunk in chunked(product_ids):
+        q_marks = ','.join(['?'] * len(chunk))
+        # SQLite returns the bare valid_to column from the interval holding MAX(valid_from)
+        async with db.execute(f"""
+            SELECT product_id, MAX(valid_from), (julianday({NOW_SQL}) - julianday(valid_to)) * 24.0
+            FROM price_history
+            WHERE product_id IN ({q_marks})
+            GROUP BY product_id
+        """, chunk) as cur:
+            for product_id, valid_from, diff_hours in await cur.fetchall():
+                latest[product_id] = (valid_from, diff_hours)
+
+    first_prices, new_prices, unchanged = [], [], []
+    for external_id, item in by_external_id.items():
+        product_id, last_price = products[external_id]
+        price_minor = item["price_minor"]
+        valid_from, diff_hours = latest.get(product_id, (None, None))
+
+        if diff_hours is not None and diff_hours < min_hours_between_changes:
+            continue
+
+        if last_price is None:
+            first_prices.append((product_id, price_minor))
+        elif last_price == price_minor:
+            unchanged.append((product_id, valid_from))
+        else:
+            new_prices.append((product_id, price_minor))
+
+    if first_prices or new_prices:
+        await record_price_stats(db, first_prices + new_prices)
+        await db.executemany(f"""
+            INSERT OR REPLACE INTO price_history(product_id, price_minor, valid_from, valid_to)
+            VALUES (?, ?, {NOW_SQL}, {NOW_SQL})
+        """, first_prices + new_prices)
+
+    if first_prices:
+        await db.executemany(f"""
+            UPDATE products
+            SET last_price = ?, last_seen_at = ({NOW_SQL}), watch_price = 0, watch_max_price = ?
+            WHERE id = ?
+        """, [(price, price, product_id) for product_id, price in first_prices])
+
+    if new_prices:
+        await db.executemany(f"""
+            UPDATE products
+            SET last_price = ?, last_seen_at = ({NOW_SQL})
+            WHERE id = ?
+        """, [(price, product_id) for product_id, price in new_prices])
+
+        if changed is not None:
+            changed.extend(product_id for product_id, _ in new_prices)
+
+    if unchanged:
+        # an unchanged price only stretches its interval
+        await db.executemany(f"""
+            UPDATE price_history SET valid_to = ({NOW_SQL}), observations = observations + 1
+            WHERE product_id = ? AND valid_from = ?
+        """, [(product_id, valid_from) for product_id, valid_from in unchanged if valid_from is not None])
+
+    await refresh_window_stats(db, [product_id for product_id, _ in first_prices + new_prices + unchanged])
+    await db.commit()
+
+    return [products[item["external_id"]][0] for item in items]
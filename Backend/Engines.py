@@ -0,0 +1,488 @@
+import asyncio
+import fnmatch
+import hashlib
+import json
+import os
+import re
+import time
+
+from typing import Optional, List, Dict, Any
+
+import Metrics
+from Metrics import timer
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36"
+DEFAULT_ENGINE = "playwright"
+DEFAULT_EXTRACTION = "evaluate"
+HTTP_MAX_CONNECTIONS = 20
+# only text and src/href attributes are read, so images, fonts and media never need to load.
+# Stylesheets stay allowed by default: innerText depends on them (hidden elements, text-transform)
+DEFAULT_BLOCK_RESOURCES = ["image", "media", "font"]
+DEFAULT_BLOCK_URLS = [
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*googlesyndication.com*",
+    "*facebook.net*", "*hotjar.com*", "*criteo.*", "*tiktok.com*",
+]
+ASSET_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Data", "asset_cache")
+ASSET_CACHE_MAX_AGE = 24 * 3600
+ASSET_CACHE_MAX_BYTES = 256 * 1024 * 1024
+# puts between two sweeps of the cache directory; the first put of a process sweeps too
+ASSET_CACHE_SWEEP_EVERY = 200
+CACHEABLE_RESOURCES = {"stylesheet", "script", "font", "image"}
+# route.fetch() hands back the decoded body, so headers describing the bytes on the wire don't apply to it
+UNREPLAYABLE_HEADERS = {"content-encoding", "content-length", "transfer-encoding"}
+
+def site_headers(site) -> Dict[str, str]:
+    return {
+        "Accept-Language": "en-US;q=0.8,en;q=0.7",
+        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+        "Connection": "keep-alive",
+        "Referer": site["url"],
+    }
+
+# Mirrors PlaywrightSession.extract_cards_handles and extract_cards_html:
+# missing text elements come back as null, a missing link or image as "N/A"
+EXTRACT_CARDS_JS = """
+(sel) => {
+    const end = sel.end_of_pages !== "" && document.querySelector(sel.end_of_pages) !== null;
+    const cards = Array.from(document.querySelectorAll(sel.product)).map((card) => {
+        const find = (s) => (s ? card.querySelector(s) : null);
+        const text = (el) => (el ? el.innerText.trim() : null);
+
+        if (sel.remove_items_with !== "" && card.querySelector(sel.remove_items_with) !== null) {
+            return { skip: true };
+        }
+
+        const link = find(sel.link);
+        const image = find(sel.image_link);
+
+        return {
+            skip: false,
+            title: text(find(sel.title)),
+            price: text(find(sel.price)),
+            rating: text(find(sel.rating)),
+            link: link ? link.getAttribute("href") : "N/A",
+            id: sel.id !== "" ? card.getAttribute(sel.id) : null,
+            image: image ? image.getAttribute("src") : "N/A",
+            currency: sel.currency !== "" ? text(find(sel.currency)) : null,
+        };
+    });
+
+    return { end, cards };
+}
+"""
+
+def extract_cards_html(html: str, selectors) -> Optional[List[Dict[str, Any]]]:
+    from selectolax.lexbor import LexborHTMLParser
+
+    tree = LexborHTMLParser(html)
+
+    if selectors["end_of_pages"] != "" and tree.css_first(selectors["end_of_pages"]) is not None:
+        return None
+
+    def find(card, selector):
+        return card.css_first(selector) if selector else None
+
+    def text(node):
+        # innerText collapses the markup's whitespace, do the same for the raw text
+        return " ".join(node.text().split()) if node is not None else None
+
+    cards = []
+    for card in tree.css(selectors["product"]):
+        if selectors["remove_items_with"] != "" and card.css_first(selectors["remove_items_with"]) is not None:
+            cards.append({"skip": True})
+            continue
+
+        link = find(card, selectors["link"])
+        image = find(card, selectors["image_link"])
+
+        cards.append({
+            "skip": False,
+            "title": text(find(card, selectors["title"])),
+            "price": text(find(card, selectors["price"])),
+            "rating": text(find(card, selectors["rating"])),
+            "link": link.attributes.get("href") if link is not None else "N/A",
+            "id": card.attributes.get(selectors["id"]) if selectors["id"] != "" else None,
+            "image": image.attributes.get("src") if image is not None else "N/A",
+            "currency": text(find(card, selectors["currency"])) if selectors["currency"] != "" else None,
+        })
+
+    return cards
+
+class SiteMetrics:
+    def __init__(self):
+        self.pages = 0
+        self.page_time = 0.0
+        self.requests = 0
+        self.bytes = 0
+        self.blocked = 0
+        self.cache_hits = 0
+
+    def to_dict(self) -> dict:
+        return {
+            "pages": self.pages,
+            "avg_page_time": round(self.page_time / self.pages, 3) if self.pages else None,
+            "requests": self.requests,
+            "bytes": self.bytes,
+            "blocked": self.blocked,
+            "cache_hits": self.cache_hits,
+        }
+
+def replayable_headers(headers: Dict[str, str]) -> Dict[str, str]:
+    return {name: value for name, value in headers.items() if name.lower() not in UNREPLAYABLE_HEADERS}
+
+class AssetCache:
+    # static assets on disk by URL, so repeated search pages don't download the same CSS and scripts
+    def __init__(self, path: str = ASSET_CACHE_DIR, max_age: float = ASSET_CACHE_MAX_AGE,
+                 max_bytes: int = ASSET_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.puts = 0
+
+    def file(self, url: str) -> str:
+        return os.path.join(self.path, hashlib.sha256(url.encode("utf-8")).hexdigest())
+
+    def get(self, url: str):
+        path = self.file(url)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                self.remove(path)
+                return None
+            with open(path + ".json", "r", encoding="utf-8") as f:
+                headers = json.load(f)
+            with open(path, "rb") as f:
+                # entries stored before the headers were filtered are cleaned up on the way out
+                return replayable_headers(headers), f.read()
+        except (OSError, ValueError):
+            return None
+
+    def put(self, url: str, headers: Dict[str, str], body: bytes) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        if self.puts % ASSET_CACHE_SWEEP_EVERY == 0:
+            self.sweep()
+        self.puts += 1
+
+        path = self.file(url)
+        with open(path + ".json", "w", encoding="utf-8") as f:
+            json.dump(replayable_headers(headers), f)
+        with open(path, "wb") as f:
+            f.write(body)
+
+    def remove(self, path: str) -> None:
+        for name in (path, path + ".json"):
+            try:
+                os.remove(name)
+            except OSError:
+                pass
+
+    def sweep(self) -> None:
+        # drops expired entries, then the oldest ones until the directory fits in max_bytes
+        entries, total, now = [], 0, time.time()
+        with os.scandir(self.path) as it:
+            for entry in it:
+                if entry.name.endswith(".json"):
+                    continue
+                path = entry.path
+                try:
+                    stat = entry.stat()
+                    size = stat.st_size + os.path.getsize(path + ".json")
+                except OSError:
+                    self.remove(path)
+                    continue
+                if now - stat.st_mtime > self.max_age:
+                    self.remove(path)
+                    continue
+                entries.append((stat.st_mtime, size, path))
+                total += size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self.remove(path)
+            total -= size
+
+class RequestPolicy:
+    # one route handler per site, installed on every context opened for it. Sites tune it with
+    # "block_resources" (Playwright resource types), "block_urls" (glob patterns) and "asset_cache"
+    def __init__(self, site, metrics: SiteMetrics, cache: Optional[AssetCache], count_bytes: bool = False):
+        self.key = RequestPolicy.settings(site)
+        self.resources = set(site.get("block_resources", DEFAULT_BLOCK_RESOURCES))
+        patterns = site.get("block_urls", DEFAULT_BLOCK_URLS)
+        self.urls = re.compile("|".join(fnmatch.translate(p) for p in patterns)) if patterns else None
+        self.metrics = metrics
+        self.cache = cache if site.get("asset_cache", False) else None
+        self.count_bytes = count_bytes
+        self.served = set()
+
+    @staticmethod
+    def settings(site) -> str:
+        return json.dumps([site.get("block_resources"), site.get("block_urls"), site.get("asset_cache")])
+
+    @property
+    def active(self) -> bool:
+        return bool(self.resources or self.urls or self.cache)
+
+    def blocks(self, resource_type: str, url: str) -> bool:
+        return resource_type in self.resources or (self.urls is not None and self.urls.match(url) is not None)
+
+    async def handle(self, route) -> None:
+        request = route.request
+        if self.blocks(request.resource_type, request.url):
+            self.metrics.blocked += 1
+            await route.abort("blockedbyclient")
+            return
+
+        if self.cache is None or request.method != "GET" or request.resource_type not in CACHEABLE_RESOURCES:
+            await route.continue_()
+            return
+
+        cached = await asyncio.to_thread(self.cache.get, request.url)
+        if cached is not None:
+            headers, body = cached
+            self.metrics.cache_hits += 1
+            if self.count_bytes:
+                self.served.add(request)
+            await route.fulfill(status=200, headers=headers, body=body)
+            return
+
+        response = await route.fetch()
+        body = await response.body()
+        if response.ok:
+            await asyncio.to_thread(self.cache.put, request.url, response.headers, body)
+        await route.fulfill(response=response, body=body)
+
+    async def count(self, request) -> None:
+        # requestfinished also fires for fulfilled requests; those never went over the network
+        if request in self.served:
+            self.served.discard(request)
+            return
+
+        try:
+            sizes = await request.sizes()
+        except Exception:
+            return
+        self.metrics.requests += 1
+        self.metrics.bytes += sizes["responseHeadersSize"] + max(sizes["responseBodySize"], 0)
+
+    def forget(self, request) -> None:
+        # a fulfilled request that fails never reaches requestfinished
+        self.served.discard(request)
+
+class PlaywrightSession:
+    def __init__(self, context, site, metrics: Optional[SiteMetrics] = None):
+        self.context = context
+        self.site = site
+        self.metrics = metrics if metrics is not None else SiteMetrics()
+
+    async def extract_cards(self, page):
+        # a single round-trip: every card's fields come back as one JSON array
+        result = await page.evaluate(EXTRACT_CARDS_JS, self.site["selectors"])
+        if result["end"]:
+            return None
+
+        return result["cards"]
+
+    async def extract_cards_handles(self, page):
+        selectors = self.site["selectors"]
+
+        items = await page.query_selector_all(selectors["product"])
+        if not items:
+            return None
+
+        if selectors["end_of_pages"] != "":
+            svg_elem = await page.query_selector(selectors["end_of_pages"])
+            if svg_elem:
+                return None
+
+        cards = []
+        for item in items:
+            if selectors["remove_items_with"] != "":
+                svg_elem = await item.query_selector(selectors["remove_items_with"])
+                if svg_elem:
+                    cards.append({"skip": True})
+                    continue
+
+            title = await item.query_selector(selectors["title"])
+            price = await item.query_selector(selectors["price"])
+            rating = await item.query_selector(selectors["rating"])
+            link = await item.query_selector(selectors["link"])
+            image = await item.query_selector(selectors["image_link"])
+            currency = await item.query_selector(selectors["currency"]) if selectors["currency"] != "" else None
+
+            cards.append({
+                "skip": False,
+                "title": (await title.inner_text()).strip() if title else None,
+                "price": (await price.inner_text()).strip() if price else None,
+                "rating": (await rating.inner_text()).strip() if rating else None,
+                "link": await link.get_attribute("href") if link else "N/A",
+                "id": await item.get_attribute(selectors["id"]) if selectors["id"] != "" else None,
+                "image": await image.get_attribute("src") if image else "N/A",
+                "currency": (await currency.inner_text()).strip() if currency else None,
+            })
+
+        return cards
+
+    async def fetch_cards(self, url: str):
+        from playwright.async_api import TimeoutError as PWTimeout
+
+        page = await self.context.new_page()
+        site_name = self.site["name"]
+        start = time.perf_counter()
+
+        try:
+            with timer("scrape_navigation_seconds", site=site_name):
+                await page.goto(url, timeout=60000, wait_until="domcontentloaded")
+
+            try:
+                with timer("scrape_selector_wait_seconds", site=site_name):
+                    await page.wait_for_selector(self.site["selectors"]["product"], timeout=4000)
+            except PWTimeout:
+                return None
+            finally:
+                self.metrics.pages += 1
+                self.metrics.page_time += time.perf_counter() - start
+
+            with timer("scrape_extract_seconds", site=site_name):
+                if self.site.get("extraction", DEFAULT_EXTRACTION) == "handles":
+                    return await self.extract_cards_handles(page)
+
+                return await self.extract_cards(page)
+        finally:
+            await page.close()
+
+    async def fetch_text(self, url: str, selector: str) -> Optional[str]:
+        # one element's text from a product page, None when it never shows up
+        from playwright.async_api import TimeoutError as PWTimeout
+
+        page = await self.context.new_page()
+
+        try:
+            with timer("scrape_navigation_seconds", site=self.site["name"]):
+                await page.goto(url, timeout=60000, wait_until="domcontentloaded")
+
+            try:
+                with timer("scrape_selector_wait_seconds", site=self.site["name"]):
+                    element = await page.wait_for_selector(selector, timeout=4000)
+            except PWTimeout:
+                return None
+
+            return (await element.inner_text()).strip()
+        finally:
+            await page.close()
+
+    async def close(self):
+        await self.context.close()
+
+class PlaywrightEngine:
+    # count_bytes sizes every finished request (one extra round-trip to the browser each), for the
+    # requests/bytes of SiteMetrics; it follows the METRICS switch unless a caller asks for it
+    def __init__(self, cache: Optional[AssetCache] = None, count_bytes: Optional[bool] = None):
+        self.playwright = None
+        self.browser = None
+        self.lock = asyncio.Lock()
+        self.cache = cache if cache is not None else AssetCache()
+        self.count_bytes = Metrics.METRICS_ENABLED if count_bytes is None else count_bytes
+        self.metrics: Dict[str, SiteMetrics] = dict()
+        self.policies: Dict[str, RequestPolicy] = dict()
+
+    async def get_browser(self):
+        # Chromium is only launched once a site actually needs it
+        async with self.lock:
+            if self.browser is None:
+                from playwright.async_api import async_playwright
+
+                self.playwright = await async_playwright().start()
+                self.browser = await self.playwright.chromium.launch(headless=True, channel="chrome",
+                    args=[
+                        "--no-sandbox",
+                        "--disable-gpu",
+                        "--disable-dev-shm-usage",
+                        "--disable-blink-features=AutomationControlled",
+                ])
+
+        return self.browser
+
+    def policy(self, site) -> RequestPolicy:
+        # rebuilt when the site's settings change, otherwise shared by all of its contexts
+        policy = self.policies.get(site["name"])
+        if policy is None or policy.key != RequestPolicy.settings(site):
+            metrics = self.metrics.setdefault(site["name"], SiteMetrics())
+            policy = RequestPolicy(site, metrics, self.cache, self.count_bytes)
+            self.policies[site["name"]] = policy
+
+        return policy
+
+    async def open(self, site) -> PlaywrightSession:
+        browser = await self.get_browser()
+        context = await browser.new_context(user_agent=USER_AGENT, locale="en-US")
+        await context.set_extra_http_headers(site_headers(site))
+
+        policy = self.policy(site)
+        if policy.active:
+            await context.route("**/*", policy.handle)
+        if self.count_bytes:
+            context.on("requestfinished", policy.count)
+            context.on("requestfailed", policy.forget)
+
+        return PlaywrightSession(context, site, policy.metrics)
+
+    async def close(self):
+        if self.browser is not None:
+            await self.browser.close()
+            self.browser = None
+        if self.playwright is not None:
+            await self.playwright.stop()
+            self.playwright = None
+
+class HttpSession:
+    def __init__(self, client, site):
+        self.client = client
+        self.site = site
+        self.headers = site_headers(site)
+
+    async def fetch_cards(self, url: str):
+        with timer("scrape_navigation_seconds", site=self.site["name"]):
+            resp = await self.client.get(url, headers=self.headers)
+        if resp.status_code >= 400:
+            return None
+
+        with timer("scrape_extract_seconds", site=self.site["name"]):
+            return extract_cards_html(resp.text, self.site["selectors"])
+
+    async def fetch_text(self, url: str, selector: str) -> Optional[str]:
+        from selectolax.lexbor import LexborHTMLParser
+
+        with timer("scrape_navigation_seconds", site=self.site["name"]):
+            resp = await self.client.get(url, headers=self.headers)
+        if resp.status_code >= 400:
+            return None
+
+        node = LexborHTMLParser(resp.text).css_first(selector)
+        return " ".join(node.text().split()) if node is not None else None
+
+    async def close(self):
+        pass
+
+class HttpEngine:
+    def __init__(self, max_connections: int = HTTP_MAX_CONNECTIONS):
+        self.max_connections = max_connections
+        self.client = None
+
+    async def open(self, site) -> HttpSession:
+        if self.client is None:
+            import httpx
+
+            self.client = httpx.AsyncClient(
+                headers={"User-Agent": USER_AGENT},
+                limits=httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections),
+                follow_redirects=True,
+                timeout=60,
+            )
+
+        return HttpSession(self.client, site)
+
+    async def close(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
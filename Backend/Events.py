@@ -0,0 +1,78 @@
+import asyncio
+import itertools
+import json
+import time
+
+from collections import deque
+from typing import AsyncIterator, Optional, Set
+
+EVENT_HISTORY = 500
+SUBSCRIBER_QUEUE_SIZE = 1000
+SSE_HEARTBEAT = 15.0
+JOB_END_EVENTS = ("job_done", "job_failed")
+
+def offer(queue: asyncio.Queue, event: dict) -> None:
+    # publishing never waits on a subscriber: one that falls a full queue behind loses its oldest events
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+class EventBus:
+    # in-process fan-out of scrape progress. Every event gets an increasing id, and the last
+    # EVENT_HISTORY are kept so a client reconnecting with Last-Event-ID catches up
+    def __init__(self, history: int = EVENT_HISTORY):
+        self.ids = itertools.count(1)
+        self.history = deque(maxlen=history)
+        self.subscribers: Set[asyncio.Queue] = set()
+
+    def publish(self, event: dict) -> dict:
+        event = {"id": next(self.ids), "time": round(time.time(), 3), **event}
+        self.history.append(event)
+        for queue in self.subscribers:
+            offer(queue, event)
+
+        return event
+
+    def subscribe(self, after: int = 0) -> asyncio.Queue:
+        queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+        for event in self.history:
+            if event["id"] > after:
+                offer(queue, event)
+        self.subscribers.add(queue)
+
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self.subscribers.discard(queue)
+
+def sse_format(event: dict) -> str:
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+
+async def sse_stream(bus: EventBus, after: int = 0, job_id: Optional[int] = None,
+                     heartbeat: float = SSE_HEARTBEAT, end: Optional[dict] = None) -> AsyncIterator[str]:
+    # a job's stream ends with its job_done/job_failed event; the unfiltered stream runs until the
+    # client goes away. The comment lines keep proxies from closing an idle connection.
+    # end is the terminal event of a job that has already finished: once the history it left is
+    # replayed, it is sent from there instead of waiting for an event that was already dropped
+    queue = bus.subscribe(after)
+    try:
+        while True:
+            if end is not None and queue.empty():
+                if end["id"] > after:
+                    yield sse_format(end)
+                return
+
+            try:
+                event = await asyncio.wait_for(queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+
+            if job_id is not None and event.get("job_id") != job_id:
+                continue
+
+            yield sse_format(event)
+            if job_id is not None and event["event"] in JOB_END_EVENTS:
+                return
+    finally:
+        bus.unsubscribe(queue)
@@ -0,0 +1,84 @@
+import sys
+import os
+import time
+import random
+import asyncio
+import sqlite3
+import tempfile
+
+from Database import init_db, ConnectionPool
+from Exports import stream_csv, write_xlsx, write_pdf
+
+# Usage: python Export_benchmark.py <csv|xlsx|xlsx_history|pdf|pdf_sparklines> [products] [history points per product]
+# One format per run, so the reported peak RSS belongs to that export alone.
+
+WORDS = ["laptop", "asus", "lenovo", "rtx", "4060", "16gb", "ssd", "1tb", "gaming", "monitor", "144hz", "casti", "wireless"]
+
+def build_db(path: str, products: int, points: int) -> None:
+    asyncio.run(init_db(path))
+
+    r = random.Random(1)
+    con = sqlite3.connect(path)
+    con.executemany("""
+        INSERT INTO products(site_name, external_id, image_link, title, search_title, link, currency,
+                             rating, ratings_count, last_price, watch_price)
+        VALUES (?, ?, '', ?, ?, ?, 'RON', ?, ?, ?, 0)
+    """, ((
+        "site" + str(i % 3), str(i),
+        " ".join(r.choice(WORDS) for _ in range(8)), "",
+        f"https://example.com/p/{i}", round(r.uniform(1, 5), 1), r.randint(0, 500), r.randint(1000, 900000),
+    ) for i in range(products)))
+    con.executemany("""
+        INSERT INTO price_history(product_id, price_minor, valid_from, valid_to)
+        VALUES (?, ?, datetime('now', ?), datetime('now', ?))
+    """, ((i, r.randint(1000, 900000), f"-{2 * d + 1} days", f"-{2 * d} days")
+          for i in range(1, products + 1) for d in reversed(range(points))))
+    con.commit()
+    con.close()
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+async def run(fmt: str, path: str, products: int) -> None:
+    pool = ConnectionPool(path, size=1)
+    await pool.open()
+
+    start, rss = time.perf_counter(), peak_rss_mb()
+    try:
+        if fmt == "csv":
+            size = 0
+            async for chunk in stream_csv(pool, [], []):
+                size += len(chunk)
+        elif fmt.startswith("pdf"):
+            out = path + ".pdf"
+            await write_pdf(pool, [], [], out, sparklines=(fmt == "pdf_sparklines"))
+            size = os.path.getsize(out)
+            os.remove(out)
+        else:
+            out = path + ".xlsx"
+            await write_xlsx(pool, [], [], out, history=(fmt == "xlsx_history"))
+            size = os.path.getsize(out)
+            os.remove(out)
+    finally:
+        await pool.close()
+
+    took = time.perf_counter() - start
+    print(f"{fmt}: {products} products in {took:.2f}s ({products / took:.0f} rows/s), {size / 1e6:.1f} MB")
+    if rss is not None:
+        print(f"peak RSS {peak_rss_mb():.0f} MB (before export {rss:.0f} MB)")
+
+if __name__ == "__main__":
+    fmt = sys.argv[1]
+    products = int(sys.argv[2]) if len(sys.argv) > 2 else 200000
+    points = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    path = os.path.join(tempfile.gettempdir(), f"export_benchmark_{products}_{points}.db")
+    if not os.path.exists(path):
+        build_db(path, products, points)
+
+    asyncio.run(run(fmt, path, products))
@@ -0,0 +1,259 @@
+import asyncio
+import csv
+import io
+import zlib
+
+from bisect import bisect_right
+from collections import defaultdict
+from typing import Dict, List, AsyncIterator
+
+from Database import ConnectionPool
+
+EXPORT_FETCH_SIZE = 1000
+EXPORT_COLUMNS = ["id", "site_name", "external_id", "title", "link", "currency", "last_price",
+                  "rating", "ratings_count", "first_seen_at", "last_seen_at"]
+
+def export_query(where: List[str]) -> str:
+    where_sql = "WHERE " + " AND ".join(where) if where else ""
+
+    return f"SELECT {', '.join(EXPORT_COLUMNS)} FROM products {where_sql} ORDER BY id"
+
+def export_row(row) -> tuple:
+    # same shape as row_to_product, without building a model per row
+    return row[:9] + (row[9].split(".")[0], row[10].split(".")[0])
+
+async def stream_csv(pool: ConnectionPool, where: List[str], params: list, compress: bool = False) -> AsyncIterator[bytes]:
+    # rows go from the cursor to the client one fetchmany() batch at a time; the connection is
+    # taken here rather than from the request dependency because it has to outlive the handler
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    gzip = zlib.compressobj(wbits=31) if compress else None
+
+    def flush() -> bytes:
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+        return gzip.compress(data) if gzip else data
+
+    writer.writerow(EXPORT_COLUMNS)
+
+    async with pool.reader() as db:
+        async with db.execute(export_query(where), params) as cur:
+            while rows := await cur.fetchmany(EXPORT_FETCH_SIZE):
+                writer.writerows(export_row(r) for r in rows)
+                if chunk := flush():
+                    yield chunk
+
+    if chunk := flush():
+        yield chunk
+    if gzip:
+        yield gzip.flush()
+
+XLSX_MAX_ROWS = 1048576
+HISTORY_COLUMNS = ["product_id", "price_minor", "valid_from", "valid_to", "observations"]
+
+def history_query(where: List[str]) -> str:
+    where_sql = "WHERE product_id IN (SELECT id FROM products WHERE " + " AND ".join(where) + ")" if where else ""
+
+    return f"SELECT {', '.join(HISTORY_COLUMNS)} FROM price_history {where_sql} ORDER BY product_id, valid_from"
+
+def write_rows(worksheet, first_row: int, rows) -> None:
+    # write_row types each cell: ints and floats become numbers, None stays an empty cell
+    for r, row in enumerate(rows, start=first_row):
+        worksheet.write_row(r, 0, row)
+
+async def write_xlsx(pool: ConnectionPool, where: List[str], params: list, path: str, history: bool = False) -> None:
+    # constant_memory keeps only the current row in memory, so rows are written strictly in order,
+    # one sheet after the other; xlsxwriter runs in a thread to keep the event loop free
+    import xlsxwriter
+
+    workbook = xlsxwriter.Workbook(path, {"constant_memory": True, "strings_to_urls": False})
+    bold = workbook.add_format({"bold": True})
+
+    async def fill(name: str, columns: List[str], query: str, params: list, shape) -> None:
+        worksheet, sheet_no, row_no = None, 0, XLSX_MAX_ROWS
+
+        async with pool.reader() as db:
+            async with db.execute(query, params) as cur:
+                while rows := await cur.fetchmany(EXPORT_FETCH_SIZE):
+                    rows = [shape(r) for r in rows]
+                    while rows:
+                        if row_no == XLSX_MAX_ROWS:
+                            # a sheet holds at most 1048576 rows, the rest spills into name_2, name_3, ...
+                            sheet_no += 1
+                            worksheet = workbook.add_worksheet(name if sheet_no == 1 else f"{name}_{sheet_no}")
+                            worksheet.write_row(0, 0, columns, bold)
+                            row_no = 1
+
+                        part, rows = rows[:XLSX_MAX_ROWS - row_no], rows[XLSX_MAX_ROWS - row_no:]
+                        await asyncio.to_thread(write_rows, worksheet, row_no, part)
+                        row_no += len(part)
+
+        if worksheet is None:
+            workbook.add_worksheet(name).write_row(0, 0, columns, bold)
+
+    try:
+        await fill("products", EXPORT_COLUMNS, export_query(where), params, export_row)
+        if history:
+            await fill("price_history", HISTORY_COLUMNS, history_query(where), params,
+                       lambda r: (r[0], r[1], r[2].split(".")[0], r[3].split(".")[0], r[4]))
+    finally:
+        await asyncio.to_thread(workbook.close)
+
+PDF_MARGIN = 30
+PDF_ROW_HEIGHT = 14
+PDF_FONT_SIZE = 7
+PDF_COLUMNS = [
+    # header, width, numeric (right-aligned)
+    ("ID", 40, True),
+    ("Site", 60, False),
+    ("Title", 330, False),
+    ("Price", 55, True),
+    ("Currency", 40, False),
+    ("Rating", 35, True),
+    ("Reviews", 40, True),
+    ("Last seen", 80, False),
+]
+SPARKLINE_WIDTH = 80
+SPARKLINE_POINTS = 30
+
+class PdfReport:
+    # draws the products table straight onto the canvas, one page at a time, instead of
+    # building platypus flowables for the whole catalogue
+    def __init__(self, path: str, sparklines: bool = False):
+        from reportlab.lib.pagesizes import A4, landscape
+        from reportlab.pdfgen import canvas
+
+        self.canvas = canvas.Canvas(path, pagesize=landscape(A4))
+        self.width, self.height = landscape(A4)
+        self.sparklines = sparklines
+        self.columns = PDF_COLUMNS + ([("Trend", SPARKLINE_WIDTH, False)] if sparklines else [])
+        self.x = [PDF_MARGIN]
+        for _, width, _ in self.columns:
+            self.x.append(self.x[-1] + width)
+        self.page = 0
+        self.y = 0
+
+    def fit(self, text: str, width: float) -> str:
+        from reportlab.pdfbase.pdfmetrics import stringWidth
+
+        # no Helvetica glyph is wider than 1 em, so short texts skip the measuring
+        if len(text) * PDF_FONT_SIZE <= width or stringWidth(text, "Helvetica", PDF_FONT_SIZE) <= width:
+            return text
+
+        # cut by the average glyph width first, then trim what still overflows
+        text = text[:int(len(text) * width / stringWidth(text, "Helvetica", PDF_FONT_SIZE))]
+        while text and stringWidth(text + "...", "Helvetica", PDF_FONT_SIZE) > width:
+            text = text[:-1]
+
+        return text + "..."
+
+    def new_page(self) -> None:
+        c = self.canvas
+        if self.page:
+            c.showPage()
+        self.page += 1
+        self.y = self.height - PDF_MARGIN - PDF_ROW_HEIGHT
+
+        c.setFont("Helvetica", PDF_FONT_SIZE)
+        c.drawRightString(self.width - PDF_MARGIN, PDF_MARGIN / 2, f"Page {self.page}")
+
+        c.setFillGray(0.85)
+        c.rect(self.x[0], self.y, self.x[-1] - self.x[0], PDF_ROW_HEIGHT, stroke=0, fill=1)
+        c.setFillGray(0)
+        c.setFont("Helvetica-Bold", PDF_FONT_SIZE)
+        for (header, width, numeric), x in zip(self.columns, self.x):
+            if numeric:
+                c.drawRightString(x + width - 3, self.y + 4, header)
+            else:
+                c.drawString(x + 3, self.y + 4, header)
+        c.setFont("Helvetica", PDF_FONT_SIZE)
+
+    def sparkline(self, x: float, y: float, prices: List[int]) -> None:
+        prices = [p for p in prices if p is not None][-SPARKLINE_POINTS:]
+        if len(prices) < 2:
+            return
+
+        low, high = min(prices), max(prices)
+        span = (high - low) or 1
+        step = (SPARKLINE_WIDTH - 6) / (len(prices) - 1)
+
+        path = self.canvas.beginPath()
+        for i, price in enumerate(prices):
+            px, py = x + 3 + i * step, y + 2 + (PDF_ROW_HEIGHT - 4) * (price - low) / span
+            if i == 0:
+                path.moveTo(px, py)
+            else:
+                path.lineTo(px, py)
+        self.canvas.drawPath(path, stroke=1, fill=0)
+
+    def draw_rows(self, rows, history: Dict[int, List[int]]) -> None:
+        c = self.canvas
+        for row in rows:
+            if self.page == 0 or self.y - PDF_ROW_HEIGHT < PDF_MARGIN:
+                self.new_page()
+            self.y -= PDF_ROW_HEIGHT
+
+            id, site_name, _, title, _, currency, last_price, rating, ratings_count, _, last_seen_at = row
+            cells = (id, site_name, title, last_price, currency, rating, ratings_count, last_seen_at)
+            for (_, width, numeric), x, value in zip(self.columns, self.x, cells):
+                if value is None:
+                    continue
+                text = self.fit(str(value), width - 6)
+                if numeric:
+                    c.drawRightString(x + width - 3, self.y + 4, text)
+                else:
+                    c.drawString(x + 3, self.y + 4, text)
+
+            if self.sparklines:
+                self.sparkline(self.x[-2], self.y, history.get(id, []))
+
+            c.setStrokeGray(0.8)
+            c.line(self.x[0], self.y, self.x[-1], self.y)
+            c.setStrokeGray(0)
+
+    def close(self) -> None:
+        if self.page == 0:
+            self.new_page()
+        self.canvas.save()
+
+async def write_pdf(pool: ConnectionPool, where: List[str], params: list, path: str, sparklines: bool = False) -> None:
+    # products and their price history are read side by side, both ordered by product id,
+    # so each batch of rows only carries the history it draws
+    report = PdfReport(path, sparklines)
+
+    async with pool.reader() as db:
+        products = await db.execute(export_query(where), params)
+        history = await db.execute(history_query(where), params) if sparklines else None
+        pending = None
+
+        try:
+            while rows := await products.fetchmany(EXPORT_FETCH_SIZE):
+                rows = [export_row(r) for r in rows]
+                prices = defaultdict(list)
+
+                while history is not None:
+                    if pending is None:
+                        pending = await history.fetchmany(EXPORT_FETCH_SIZE)
+                        if not pending:
+                            await history.close()
+                            history = None
+                            break
+                    if pending[-1][0] <= rows[-1][0]:
+                        batch, pending = pending, None
+                    else:
+                        cut = bisect_right([r[0] for r in pending], rows[-1][0])
+                        batch, pending = pending[:cut], pending[cut:]
+                    for product_id, price_minor, *_ in batch:
+                        prices[product_id].append(price_minor)
+                    if pending is not None:
+                        break
+
+                await asyncio.to_thread(report.draw_rows, rows, prices)
+        finally:
+            await products.close()
+            if history is not None:
+                await history.close()
+
+    await asyncio.to_thread(report.close)
@@ -0,0 +1,76 @@
+import os
+import sys
+import asyncio
+import threading
+import time
+
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+from Engines import PlaywrightEngine, extract_cards_html
+
+# Usage: python Extract_benchmark.py [rounds] [fixture.html]
+# Times reading the product cards out of an already loaded search page: one page.evaluate call,
+# a round-trip per element handle, and the HTML parser used by the "http" engine. The page is a saved
+# 64-card search page from tests/fixtures, served from a local server.
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURE = os.path.join(SCRIPT_DIR, "..", "tests", "fixtures", "search_page_1.html")
+SELECTORS = {
+    "product": "div.card-item", "title": "a.card-title", "link": "a.card-title", "price": "p.product-new-price",
+    "currency": "", "rating": "div.rating", "id": "data-product-id", "image_link": "div.thumb-wrap img",
+    "remove_items_with": "svg[viewBox=\"0 0 16 16\"]", "end_of_pages": "svg.no-results",
+}
+
+def start_server(directory: str):
+    class Handler(SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(Handler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+def report(name: str, timings, cards: int) -> None:
+    timings = sorted(timings)
+    print(f"{name:16} {cards} cards, median {timings[len(timings) // 2] * 1000:7.2f} ms, best {timings[0] * 1000:7.2f} ms")
+
+async def run(url: str, html: str, rounds: int) -> None:
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        cards = extract_cards_html(html, SELECTORS)
+        timings.append(time.perf_counter() - start)
+    report("html parser", timings, len(cards))
+
+    engine = PlaywrightEngine()
+    site = {"name": "fixture", "url": url, "selectors": SELECTORS, "block_resources": [], "block_urls": []}
+    try:
+        session = await engine.open(site)
+        try:
+            page = await session.context.new_page()
+            await page.goto(url, wait_until="domcontentloaded")
+            for name, extract in (("handles", session.extract_cards_handles), ("evaluate", session.extract_cards)):
+                timings = []
+                for _ in range(rounds):
+                    start = time.perf_counter()
+                    cards = await extract(page)
+                    timings.append(time.perf_counter() - start)
+                report(name, timings, len(cards))
+        finally:
+            await session.close()
+    finally:
+        await engine.close()
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    fixture = os.path.abspath(sys.argv[2]) if len(sys.argv) > 2 else os.path.abspath(FIXTURE)
+    with open(fixture, encoding="utf-8") as f:
+        html = f.read()
+
+    server = start_server(os.path.dirname(fixture))
+    try:
+        asyncio.run(run(f"http://127.0.0.1:{server.server_address[1]}/{os.path.basename(fixture)}", html, rounds))
+    finally:
+        server.shutdown()
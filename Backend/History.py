@@ -0,0 +1,120 @@
+import aiosqlite
+
+from datetime import datetime
+from typing import Optional, List, Dict, Any, Tuple
+
+DEFAULT_CHART_POINTS = 300
+MAX_CHART_POINTS = 2000
+
+def range_sql(product_id: int, start: Optional[str], end: Optional[str]):
+    # times are stored as 'YYYY-MM-DD HH:MM:SS.fff' text, so ranges compare as strings;
+    # an interval is in range when it overlaps [start, end]. The one still open at start is found
+    # with a seek on the primary key, which gives the scan a lower bound on valid_from
+    where, params = [], []
+    if start:
+        where.append("""valid_from >= COALESCE((
+            SELECT MAX(valid_from) FROM price_history WHERE product_id = ? AND valid_from <= ?), ?)""")
+        where.append("valid_to >= ?")
+        params += [product_id, start, start, start]
+    if end:
+        where.append("valid_from <= ?")
+        params.append(end)
+
+    return "".join(" AND " + w for w in where), params
+
+def expand_intervals(rows, start: Optional[str] = None, end: Optional[str] = None) -> List[Tuple[str, Optional[int]]]:
+    # (valid_from, valid_to, price_minor) intervals as (time, price) points: where the price began and
+    # where it was last seen, clipped to the requested range
+    points = set()
+    for valid_from, valid_to, price_minor in rows:
+        points.add((max(valid_from, start) if start else valid_from, price_minor))
+        points.add((min(valid_to, end) if end else valid_to, price_minor))
+
+    return sorted(points)
+
+def bucket_bounds(first_at: str, last_at: str, buckets: int) -> List[Tuple[str, str]]:
+    first, last = datetime.fromisoformat(first_at), datetime.fromisoformat(last_at)
+    step = (last - first) / buckets
+    edges = [(first + step * i).isoformat(sep=" ", timespec="milliseconds") for i in range(buckets)]
+
+    # the first edge is first_at itself and the last bucket is left open so last_at falls inside it;
+    # the open end has to stay text, the column's affinity would turn a bare "9999" into a number
+    return list(zip([first_at] + edges[1:], edges[1:] + ["9999-12-31"]))
+
+async def history_chart(db: aiosqlite.Connection, product_id: int, start: Optional[str] = None,
+                        end: Optional[str] = None, points: int = DEFAULT_CHART_POINTS) -> Tuple[List[tuple], Dict[str, Any]]:
+    range_where, range_params = range_sql(product_id, start, end)
+    stats = {
+        "count": 0, "min": None, "max": None, "avg": None, "first_at": None, "last_at": None,
+        "last_price": None, "last_change": None, "last_change_pct": None, "last_change_at": None,
+    }
+
+    async with db.execute(f"""
+        SELECT valid_from, valid_to, price_minor FROM price_history
+        WHERE product_id = ? AND price_minor IS NOT NULL {range_where}
+        ORDER BY valid_from LIMIT 1
+    """, [product_id] + range_params) as cur:
+        first = await cur.fetchone()
+    if first is None:
+        return [], stats
+
+    async with db.execute(f"""
+        SELECT valid_from, valid_to, price_minor FROM price_history
+        WHERE product_id = ? AND price_minor IS NOT NULL {range_where}
+        ORDER BY valid_from DESC LIMIT 1
+    """, [product_id] + range_params) as cur:
+        last = await cur.fetchone()
+
+    # min/max buckets: the range is cut into equal time buckets by valid_from and each keeps its lowest and
+    # highest interval, so drops and spikes survive. Every bucket is an index range of its own instead of
+    # a value computed per row, and the same pass yields the observation counts behind the stats.
+    # Intervals don't overlap, so everything from first to last is in range without repeating the filter
+    # A kept interval expands to two points, hence four per bucket
+    bounds = bucket_bounds(first[0], last[0], max((points - 4) // 4, 1))
+    values = ", ".join(["(?, ?, ?)"] * len(bounds))
+    bucket_params = [v for i, (lo, hi) in enumerate(bounds) for v in (i, lo, hi)]
+    query = f"""
+        WITH bounds(bucket, lo, hi) AS (VALUES {values})
+        SELECT bucket, valid_from, valid_to, {{agg}}(price_minor), SUM(observations), SUM(price_minor * observations)
+        FROM bounds JOIN price_history
+          ON product_id = ? AND valid_from >= lo AND valid_from < hi AND valid_from <= ?
+        WHERE price_minor IS NOT NULL
+        GROUP BY bucket
+    """
+    params = bucket_params + [product_id, last[0]]
+
+    kept = {first, last}
+    count, total = 0, 0
+    async with db.execute(query.format(agg="MIN"), params) as cur:
+        for _, valid_from, valid_to, low, n, s in await cur.fetchall():
+            kept.add((valid_from, valid_to, low))
+            stats["min"] = low if stats["min"] is None else min(stats["min"], low)
+            count += n
+            total += s
+    async with db.execute(query.format(agg="MAX"), params) as cur:
+        for _, valid_from, valid_to, high, _, _ in await cur.fetchall():
+            kept.add((valid_from, valid_to, high))
+            stats["max"] = high if stats["max"] is None else max(stats["max"], high)
+
+    chart = expand_intervals(kept, start, end)
+    stats.update(count=count, avg=round(total / count, 2), first_at=chart[0][0], last_at=chart[-1][0], last_price=last[2])
+
+    # the latest interval at a different price; the current price began with the interval after it
+    async with db.execute(f"""
+        SELECT price_minor, valid_from FROM price_history
+        WHERE product_id = ? AND price_minor IS NOT NULL AND price_minor != ? {range_where}
+        ORDER BY valid_from DESC LIMIT 1
+    """, [product_id, last[2]] + range_params) as cur:
+        previous = await cur.fetchone()
+
+    if previous is not None:
+        async with db.execute("""
+            SELECT MIN(valid_from) FROM price_history WHERE product_id = ? AND valid_from > ?
+        """, (product_id, previous[1])) as cur:
+            stats["last_change_at"] = (await cur.fetchone())[0]
+
+        stats["last_change"] = last[2] - previous[0]
+        if previous[0]:
+            stats["last_change_pct"] = round(100.0 * stats["last_change"] / previous[0], 2)
+
+    return chart, stats
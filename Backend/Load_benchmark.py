@@ -0,0 +1,86 @@
+import sys
+import os
+import time
+import random
+import asyncio
+import tempfile
+
+import httpx
+
+import API
+import Database
+from Database import init_db, upsert_products_bulk
+from Scraper import PERSIST_BATCH_SIZE
+from Upsert_benchmark import build_items, change_prices
+
+# Usage: python Load_benchmark.py [readers] [seconds] [products]
+# Serves the API in-process against a generated catalogue and runs that many concurrent GET /products
+# readers (random pages of 50) while one writer task keeps upserting pages of changed prices through the
+# pool's writer, the way a scrape does. Reports throughput and the p50/p99 read latency.
+
+def percentile(values, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+async def reader(client: httpx.AsyncClient, pages: int, until: float, latencies, r: random.Random) -> None:
+    while time.perf_counter() < until:
+        start = time.perf_counter()
+        response = await client.get("/products", params={"page": r.randint(1, pages), "per_page": 50})
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - start)
+
+async def writer(items, until: float) -> int:
+    batches, round = 0, 0
+    while time.perf_counter() < until:
+        round += 1
+        changed = change_prices(items, 10.0, seed=round)
+        for i in range(0, len(changed), PERSIST_BATCH_SIZE):
+            if time.perf_counter() >= until:
+                break
+            async with API.DB_POOL.writer() as db:
+                await upsert_products_bulk(db, "site", changed[i:i + PERSIST_BATCH_SIZE], 0)
+            batches += 1
+            # a scrape fetches the next page between writes
+            await asyncio.sleep(0)
+
+    return batches
+
+async def run(readers: int, seconds: float, products: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "load_benchmark.db")
+        await init_db(path)
+        API.DB_PATH = path
+        API.DB_POOL.path = path
+        Database.database_initialized = True
+
+        items = build_items(products)
+        await API.DB_POOL.open()
+        try:
+            async with API.DB_POOL.writer() as db:
+                for i in range(0, len(items), PERSIST_BATCH_SIZE):
+                    await upsert_products_bulk(db, "site", items[i:i + PERSIST_BATCH_SIZE], 0)
+
+            latencies = []
+            transport = httpx.ASGITransport(app=API.APP)
+            async with httpx.AsyncClient(transport=transport, base_url="http://load") as client:
+                start = time.perf_counter()
+                until = start + seconds
+                pages = max(1, products // 50)
+                batches, *_ = await asyncio.gather(
+                    writer(items, until),
+                    *(reader(client, pages, until, latencies, random.Random(n)) for n in range(readers)))
+                took = time.perf_counter() - start
+        finally:
+            await API.DB_POOL.close()
+
+    print(f"{readers} readers, {products} products, {took:.1f}s, pool of {API.DB_POOL.size} readers")
+    print(f"{len(latencies) / took:8.0f} req/s  p50 {percentile(latencies, 50) * 1000:6.1f} ms"
+          f"  p99 {percentile(latencies, 99) * 1000:6.1f} ms  max {max(latencies) * 1000:6.1f} ms")
+    print(f"{batches} writer batches of {PERSIST_BATCH_SIZE} ({batches * PERSIST_BATCH_SIZE / took:.0f} items/s)")
+
+if __name__ == "__main__":
+    readers = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+    products = int(sys.argv[3]) if len(sys.argv) > 3 else 50000
+
+    asyncio.run(run(readers, seconds, products))
@@ -2,16 +2,62 @@ import re
 import unicodedata
 import math
 
+from bisect import bisect_right
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+TITLE_CACHE_SIZE = 100000
+MATCHER_CACHE_SIZE = 256
+SEPARATORS_RE = re.compile(r"[/_+,;:~]+")
+SPACES_RE = re.compile(r"\s+")
+WORD_RE = re.compile(r"\w+")
+TITLE_SEPARATOR = "\x00"
+
 def strip_accents(s: str) -> str:
+    if s.isascii():
+        return s
+
     return ''.join(c for c in unicodedata.normalize('NFD', s) if unicodedata.category(c) != 'Mn')
 
 def normalize(s: str) -> str:
     s = strip_accents(s).lower()
-    s = re.sub(r"[/_+,;:~]+", " ", s)
-    s = re.sub(r"\s+", " ", s).strip()
+    s = SEPARATORS_RE.sub(" ", s)
+    s = SPACES_RE.sub(" ", s).strip()
 
     return s
 
+def normalize_corpus(titles: List[str]) -> Tuple[str, List[int]]:
+    # normalize() over all titles at once, with whole-string str methods instead of per-title regexes;
+    # titles come back joined by TITLE_SEPARATOR
+    blob = TITLE_SEPARATOR.join(titles)
+    if blob.count(TITLE_SEPARATOR) != max(len(titles) - 1, 0):
+        blob = TITLE_SEPARATOR.join(t.replace(TITLE_SEPARATOR, " ") for t in titles)
+
+    if not blob.isascii():
+        blob = unicodedata.normalize('NFD', blob)
+        for c in set(blob):
+            if unicodedata.category(c) == 'Mn':
+                blob = blob.replace(c, "")
+
+    blob = blob.lower()
+    for c in "/_+,;:~":
+        blob = blob.replace(c, " ")
+    blob = " ".join(blob.split())
+    blob = blob.replace(" " + TITLE_SEPARATOR, TITLE_SEPARATOR).replace(TITLE_SEPARATOR + " ", TITLE_SEPARATOR)
+
+    starts, pos = [], 0
+    for part in blob.split(TITLE_SEPARATOR):
+        starts.append(pos)
+        pos += len(part) + 1
+
+    return blob, starts
+
+@lru_cache(maxsize=TITLE_CACHE_SIZE)
+def title_words(title: str):
+    # titles repeat across pages and runs, so their normalized form and word set are memoized
+    t = normalize(title)
+    return t, frozenset(WORD_RE.findall(t))
+
 def tokenize_keep_quotes(q: str):
     phrases = re.findall(r'"([^"]+)"', q)
     q_wo = re.sub(r'"[^"]+"', " ", q)
@@ -25,6 +71,23 @@ def split_letters_digits(tok: str):
     if not m: return None
     return m.group(1), m.group(2)
 
+def scan_token_pattern(tok: str) -> str:
+    # build_token_pattern with the leading \b moved into a lookbehind, so the pattern starts
+    # with a literal and re can jump between candidates instead of trying every position
+    if split := split_letters_digits(tok):
+        letters, digits = split
+        return rf"{re.escape(letters)}(?<=\b{re.escape(letters)})\s*-?\s*{re.escape(digits)}\b"
+
+    return rf"{re.escape(tok)}(?<=\b{re.escape(tok)})\b"
+
+def required_hits(n: int) -> int:
+    if n <= 3:
+        return n
+    elif n <= 6:
+        return n - 1
+
+    return math.ceil(0.7 * n)
+
 def build_token_pattern(tok: str) -> str:
     if split := split_letters_digits(tok):
         letters, digits = split
@@ -35,26 +98,90 @@ def build_token_pattern(tok: str) -> str:
     
     return rf"\b{re.escape(tok)}\b"
 
+def search_text(s: str) -> str:
+    # the form titles are indexed under in products_fts: normalized, with letters and digits split apart
+    return re.sub(r"(?<=[a-z])(?=[0-9])|(?<=[0-9])(?=[a-z])", " ", normalize(s))
+
+def build_fts_query(query: str):
+    must_phrases, tokens = tokenize_keep_quotes(query)
+
+    terms = []
+    for phrase in must_phrases:
+        words = re.findall(r"[a-z0-9]+", search_text(phrase))
+        if words:
+            terms.append('"' + " ".join(words) + '"')
+
+    # every token is a prefix match, "rtx4070" becomes the phrase "rtx 4070"*
+    for tok in tokens:
+        words = re.findall(r"[a-z0-9]+", search_text(tok))
+        if words:
+            terms.append('"' + " ".join(words) + '"*')
+
+    return " AND ".join(terms) if terms else None
+
+@lru_cache(maxsize=MATCHER_CACHE_SIZE)
 def build_generic_matcher(query: str):
     must_phrases, tokens = tokenize_keep_quotes(query)
-    pos_patterns = [build_token_pattern(t) for t in tokens]
-    pos_res = [re.compile(p, re.IGNORECASE) for p in pos_patterns]
-    phrase_res = [re.compile(re.escape(normalize(p)), re.IGNORECASE) for p in must_phrases]
+    phrases = [normalize(p) for p in must_phrases]
 
-    n = len(pos_res)
-    if n <= 3:
-        need = n
-    elif n <= 6:
-        need = n - 1
-    else:
-        need = math.ceil(0.7 * n)
+    # \btok\b on an all-word-character token is a word-set lookup; the other shapes keep their
+    # regex but only run it when the cheap necessary condition holds
+    words_only, split_tokens, other_tokens = [], [], []
+    for tok in tokens:
+        pattern = re.compile(build_token_pattern(tok), re.IGNORECASE)
+        if split := split_letters_digits(tok):
+            letters, digits = split
+            split_tokens.append((letters + digits, letters, digits, pattern))
+        elif WORD_RE.fullmatch(tok):
+            words_only.append(tok)
+        else:
+            other_tokens.append((tok, pattern))
+
+    need = required_hits(len(tokens))
 
     def matcher(title: str) -> bool:
-        t = normalize(title)
-        for pr in phrase_res:
-            if not pr.search(t):
+        t, words = title_words(title)
+        for phrase in phrases:
+            if phrase not in t:
                 return False
-        hits = sum(1 for r in pos_res if r.search(t))
+
+        hits = 0
+        for tok in words_only:
+            if tok in words:
+                hits += 1
+        for joined, letters, digits, pattern in split_tokens:
+            if joined in words or (letters in words and digits in words and pattern.search(t)):
+                hits += 1
+        for tok, pattern in other_tokens:
+            if tok in t and pattern.search(t):
+                hits += 1
+
         return hits >= need
 
     return matcher
+
+def match_titles(query: str, titles: List[str], corpus: Optional[Tuple[str, List[int]]] = None) -> Tuple[List[bool], List[int]]:
+    # batch form of build_generic_matcher: each phrase and token is one scan over the joined corpus.
+    # corpus is normalize_corpus(titles), for callers that match the same titles against many queries
+    must_phrases, tokens = tokenize_keep_quotes(query)
+    blob, starts = corpus if corpus is not None else normalize_corpus(titles)
+
+    def titles_matching(pattern: str) -> set:
+        return {bisect_right(starts, m.start()) - 1 for m in re.finditer(pattern, blob)}
+
+    phrase_ok = None
+    for phrase in must_phrases:
+        found = titles_matching(re.escape(phrase))
+        phrase_ok = found if phrase_ok is None else phrase_ok & found
+
+    hits = [0] * len(titles)
+    for tok in tokens:
+        for i in titles_matching(scan_token_pattern(tok)):
+            hits[i] += 1
+
+    need = required_hits(len(tokens))
+    mask = [h >= need for h in hits]
+    if phrase_ok is not None:
+        mask = [ok and i in phrase_ok for i, ok in enumerate(mask)]
+
+    return mask, hits
@@ -0,0 +1,88 @@
+import re
+import sys
+import time
+import random
+import unicodedata
+
+from Matcher import build_generic_matcher, title_words, tokenize_keep_quotes, build_token_pattern, required_hits
+
+# Usage: python Matcher_benchmark.py [titles] [distinct titles]
+# Times the matcher from before the title/matcher caches, the single named-group alternation and the
+# current word-set matcher over the same generated titles, and checks that they agree title by title.
+
+WORDS = ["laptop", "asus", "lenovo", "rtx", "4060", "rtx4070", "rtx-4070", "rtx 4070", "16gb", "ssd", "1tb", "gaming",
+         "monitor", "144hz", "casti", "wireless", "i7-13700h", "Tastatură", "mouse", "usb-c", "negru/argintiu", "oled"]
+
+QUERIES = ["laptop rtx4070", "asus gaming 16gb ssd", "i7-13700h", "monitor 144hz oled", "\"usb-c\" casti wireless",
+           "lenovo rtx 4060 16gb 1tb ssd gaming", "tastatura", "mouse", "rtx-4070 laptop asus"]
+
+def baseline_normalize(s: str) -> str:
+    s = ''.join(c for c in unicodedata.normalize('NFD', s) if unicodedata.category(c) != 'Mn').lower()
+    s = re.sub(r"[/_+,;:~]+", " ", s)
+    s = re.sub(r"\s+", " ", s).strip()
+
+    return s
+
+def baseline_matcher(query: str):
+    # build_generic_matcher as it was before the caches: normalize and one re.search per token, every title
+    must_phrases, tokens = tokenize_keep_quotes(query)
+    pos_res = [re.compile(build_token_pattern(t), re.IGNORECASE) for t in tokens]
+    phrase_res = [re.compile(re.escape(baseline_normalize(p)), re.IGNORECASE) for p in must_phrases]
+    need = required_hits(len(pos_res))
+
+    def matcher(title: str) -> bool:
+        t = baseline_normalize(title)
+        for pr in phrase_res:
+            if not pr.search(t):
+                return False
+        return sum(1 for r in pos_res if r.search(t)) >= need
+
+    return matcher
+
+def alternation_matcher(query: str):
+    # every token pattern in one regex with a named group each, the title scanned once with finditer.
+    # Matches are non-overlapping, so a token inside another token's match is not counted
+    must_phrases, tokens = tokenize_keep_quotes(query)
+    combined = re.compile("|".join(f"(?P<t{i}>{build_token_pattern(t)})" for i, t in enumerate(tokens)), re.IGNORECASE)
+    phrases = [baseline_normalize(p) for p in must_phrases]
+    need = required_hits(len(tokens))
+
+    def matcher(title: str) -> bool:
+        t, _ = title_words(title)
+        for phrase in phrases:
+            if phrase not in t:
+                return False
+        return len({m.lastgroup for m in combined.finditer(t)}) >= need
+
+    return matcher
+
+def build_titles(count: int, distinct: int, seed: int = 1):
+    r = random.Random(seed)
+    pool = [" ".join(r.choice(WORDS) for _ in range(r.randint(4, 10))) + f" {i}" for i in range(distinct)]
+    return [r.choice(pool) for _ in range(count)]
+
+def run(name: str, build, titles):
+    title_words.cache_clear()
+    build_generic_matcher.cache_clear()
+
+    start = time.perf_counter()
+    results = [[match(t) for t in titles] for match in map(build, QUERIES)]
+    elapsed = time.perf_counter() - start
+
+    print(f"{name:12} {elapsed:7.2f} s  {len(titles) * len(QUERIES) / elapsed:10.0f} titles/s")
+    return results
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    distinct = int(sys.argv[2]) if len(sys.argv) > 2 else 30000
+
+    titles = build_titles(count, distinct)
+    print(f"{count} titles ({distinct} distinct), {len(QUERIES)} queries")
+
+    baseline = run("baseline", baseline_matcher, titles)
+    alternation = run("alternation", alternation_matcher, titles)
+    current = run("word-set", build_generic_matcher, titles)
+
+    for name, results in (("alternation", alternation), ("word-set", current)):
+        differ = sum(a != b for base, other in zip(baseline, results) for a, b in zip(base, other))
+        print(f"{name} differs from baseline on {differ} of {count * len(QUERIES)} title/query pairs")
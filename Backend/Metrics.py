@@ -0,0 +1,204 @@
+import contextvars
+import json
+import os
+import threading
+import time
+
+from bisect import bisect_left
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+# METRICS=0 turns instrumentation off: timers and counters return before reading the clock, the
+# request middleware isn't installed and /metrics answers 404
+METRICS_ENABLED = os.getenv("METRICS", "1") != "0"
+PROFILE_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Data", "profiles"))
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRIC_HELP = {
+    "scrape_navigation_seconds": "Time to load a search or product page (page.goto or the HTTP GET)",
+    "scrape_selector_wait_seconds": "Time waiting for the product selector after navigation",
+    "scrape_extract_seconds": "Time reading the cards out of a loaded page",
+    "scrape_card_parse_seconds": "Time parsing and filtering one page's cards in Python, matcher included",
+    "scrape_matcher_seconds": "Time spent in the title matcher for one page",
+    "scrape_db_write_seconds": "Time persisting one page, waiting for the writer included",
+    "scrape_cards_total": "Product cards read from result pages",
+    "scrape_pages_total": "Pages requested",
+    "db_writer_wait_seconds": "Time waiting for the shared writer connection",
+    "db_writer_hold_seconds": "Time the writer connection was held",
+    "db_commits_total": "Commits on the writer connection",
+    "http_request_seconds": "API request latency by route",
+    "scrape_browser_requests_total": "Requests the browser completed",
+    "scrape_browser_bytes_total": "Bytes the browser received",
+    "scrape_browser_blocked_total": "Requests the browser's request policy blocked",
+    "scrape_browser_cache_hits_total": "Requests answered from the asset cache",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+class Registry:
+    # histograms and counters keyed by metric name and label pairs; the lock is for the few values
+    # written from other threads
+    def __init__(self):
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = dict()
+        self.counters: Dict[Tuple[str, Labels], float] = dict()
+        self.lock = threading.Lock()
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        with self.lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = self.histograms[(name, labels)] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name: str, labels: Labels, value: float = 1) -> None:
+        with self.lock:
+            self.counters[(name, labels)] = self.counters.get((name, labels), 0) + value
+
+    def render(self) -> str:
+        # Prometheus text exposition format
+        lines, described = [], set()
+        with self.lock:
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                if name not in described:
+                    described.add(name)
+                    lines += [f"# HELP {name} {METRIC_HELP.get(name, name)}", f"# TYPE {name} histogram"]
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{format_labels(labels)} {histogram.sum:.6f}")
+                lines.append(f"{name}_count{format_labels(labels)} {histogram.count}")
+
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in described:
+                    described.add(name)
+                    lines += [f"# HELP {name} {METRIC_HELP.get(name, name)}", f"# TYPE {name} counter"]
+                lines.append(f"{name}{format_labels(labels)} {value:g}")
+
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        # what a run profile stores: totals and averages per metric and label set
+        result: Dict[str, Any] = dict()
+        with self.lock:
+            for (name, labels), h in sorted(self.histograms.items()):
+                result.setdefault(name, []).append({
+                    **dict(labels), "count": h.count, "total": round(h.sum, 6),
+                    "avg": round(h.sum / h.count, 6) if h.count else None, "max": round(h.max, 6),
+                })
+            for (name, labels), value in sorted(self.counters.items()):
+                result.setdefault(name, []).append({**dict(labels), "value": value})
+
+        return result
+
+def format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+REGISTRY = Registry()
+# the profile of the scrape run this task belongs to; tasks started by the run inherit it
+CURRENT_PROFILE: contextvars.ContextVar[Optional[Registry]] = contextvars.ContextVar("CURRENT_PROFILE", default=None)
+
+def observe(name: str, seconds: float, **labels) -> None:
+    if not METRICS_ENABLED:
+        return
+
+    key = tuple(labels.items())
+    REGISTRY.observe(name, key, seconds)
+    profile = CURRENT_PROFILE.get()
+    if profile is not None:
+        profile.observe(name, key, seconds)
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    if not METRICS_ENABLED or not value:
+        return
+
+    key = tuple(labels.items())
+    REGISTRY.inc(name, key, value)
+    profile = CURRENT_PROFILE.get()
+    if profile is not None:
+        profile.inc(name, key, value)
+
+class Timer:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name: str, labels: Dict[str, str]):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+class NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+NULL_TIMER = NullTimer()
+
+def timer(name: str, **labels):
+    # with timer("scrape_navigation_seconds", site=...): ...  A shared no-op when metrics are off
+    return Timer(name, labels) if METRICS_ENABLED else NULL_TIMER
+
+class RequestMetrics:
+    # ASGI middleware timing each request until its last body chunk, labelled with the matched
+    # route's path template so ids in the URL don't make a series each
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_timed(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            route = scope.get("route")
+            observe("http_request_seconds", time.perf_counter() - start, method=scope["method"],
+                    route=getattr(route, "path", "unmatched"), status=str(status[0]))
+
+def write_profile(profile: Registry, run: Dict[str, Any], directory: str = PROFILE_DIR) -> str:
+    # one JSON file per run: the run's summary plus everything its tasks measured
+    os.makedirs(directory, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")[:-3]
+    path = os.path.join(directory, f"run-{stamp}-{run.get('mode', 'full')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({**run, "metrics": profile.to_dict()}, f, indent=2, ensure_ascii=False)
+
+    return path
@@ -0,0 +1,287 @@
+import asyncio
+import random
+import sys
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from Database import ConnectionPool
+from Alerts import load_pending_alerts, mark_alerts_notified, describe_alert
+
+DISCORD_API = "https://discord.com/api/v10"
+DISCORD_MESSAGE_LIMIT = 2000
+NOTIFY_TIMEOUT = 10.0
+NOTIFY_BATCH_WINDOW = 0.5
+NOTIFY_MIN_INTERVAL = 1.0
+NOTIFY_RETRIES = 4
+NOTIFY_BACKOFF = 1.0
+NOTIFY_MAX_BACKOFF = 30.0
+
+class NotificationError(Exception):
+    # retry_after comes from a 429; a non retryable error (bad token, unknown user) fails the send at once
+    def __init__(self, message: str, retry_after: Optional[float] = None, retryable: bool = True):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.retryable = retryable
+
+def split_message(text: str, limit: int = DISCORD_MESSAGE_LIMIT) -> List[str]:
+    # splits on line breaks so a list item stays in one message; only a line longer than limit is cut
+    chunks, current = [], ""
+    for line in text.split("\n"):
+        while len(line) > limit:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(line[:limit])
+            line = line[limit:]
+
+        candidate = current + "\n" + line if current else line
+        if len(candidate) > limit:
+            chunks.append(current)
+            current = line
+        else:
+            current = candidate
+
+    if current:
+        chunks.append(current)
+
+    return chunks
+
+def raise_for_delivery(response: httpx.Response) -> None:
+    if response.status_code == 429:
+        retry_after = response.headers.get("Retry-After")
+        try:
+            retry_after = float(response.json().get("retry_after", retry_after))
+        except (ValueError, AttributeError):
+            retry_after = float(retry_after) if retry_after else None
+        raise NotificationError("rate limited", retry_after=retry_after)
+
+    if response.status_code >= 500:
+        raise NotificationError(f"HTTP {response.status_code}")
+    if response.status_code >= 400:
+        raise NotificationError(f"HTTP {response.status_code}: {response.text[:200]}", retryable=False)
+
+class HttpSink:
+    name = "http"
+
+    def __init__(self, client: Optional[httpx.AsyncClient] = None):
+        self.client = client or httpx.AsyncClient(timeout=NOTIFY_TIMEOUT)
+        self.owns_client = client is None
+
+    async def post(self, url: str, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> httpx.Response:
+        try:
+            response = await self.client.post(url, json=payload, headers=headers)
+        except httpx.TransportError as e:
+            raise NotificationError(f"{type(e).__name__}: {e}")
+
+        raise_for_delivery(response)
+        return response
+
+    async def close(self) -> None:
+        if self.owns_client:
+            await self.client.aclose()
+
+class DiscordDMSink(HttpSink):
+    # direct messages over the REST API: no gateway connection, so nothing to log in to or wait for.
+    # The DM channel is opened once and reused for every message
+    name = "discord"
+
+    def __init__(self, token: str, user_id: str, api_base: str = DISCORD_API, client: Optional[httpx.AsyncClient] = None):
+        super().__init__(client)
+        self.api_base = api_base.rstrip("/")
+        self.headers = {"Authorization": f"Bot {token}"}
+        self.user_id = str(user_id)
+        self.channel_id = None
+
+    async def send(self, text: str) -> None:
+        if self.channel_id is None:
+            response = await self.post(f"{self.api_base}/users/@me/channels", {"recipient_id": self.user_id}, self.headers)
+            self.channel_id = response.json()["id"]
+
+        await self.post(f"{self.api_base}/channels/{self.channel_id}/messages", {"content": text}, self.headers)
+
+class WebhookSink(HttpSink):
+    # a Discord (or Slack-compatible) incoming webhook, posted {"content": text}
+    name = "webhook"
+
+    def __init__(self, url: str, client: Optional[httpx.AsyncClient] = None):
+        super().__init__(client)
+        self.url = url
+
+    async def send(self, text: str) -> None:
+        await self.post(self.url, {"content": text})
+
+class FileSink:
+    # appends each message to a file, or prints it with path "-"; for trying out rules without a bot
+    name = "file"
+
+    def __init__(self, path: str = "-"):
+        self.path = path
+
+    async def send(self, text: str) -> None:
+        entry = f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}]\n{text}\n\n"
+        if self.path == "-":
+            sys.stdout.write(entry)
+            sys.stdout.flush()
+            return
+
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(entry)
+
+    async def close(self) -> None:
+        pass
+
+def sinks_from_config(config: Dict[str, Any], discord_token: Optional[str] = None) -> list:
+    # discord_user_id plus DISCORD_TOKEN, "notify_webhook" (a URL) and "notify_file" (a path, "-" for stdout)
+    sinks = []
+    if discord_token and str(config.get("discord_user_id") or "").strip():
+        sinks.append(DiscordDMSink(discord_token, str(config["discord_user_id"]).strip()))
+    if config.get("notify_webhook"):
+        sinks.append(WebhookSink(config["notify_webhook"]))
+    if config.get("notify_file"):
+        sinks.append(FileSink(config["notify_file"]))
+
+    return sinks
+
+class Notifier:
+    # messages are queued and sent by one worker. Whatever arrives within batch_window goes out as one
+    # text (split at the message limit), each sink gets at most one request per min_interval, and a
+    # failed request is retried with exponential backoff, or after the server's retry_after on a 429.
+    # notify() returns a future that tells whether at least one sink got the message
+    def __init__(self, sinks: list, batch_window: float = NOTIFY_BATCH_WINDOW, min_interval: float = NOTIFY_MIN_INTERVAL,
+                 retries: int = NOTIFY_RETRIES, backoff: float = NOTIFY_BACKOFF, max_backoff: float = NOTIFY_MAX_BACKOFF,
+                 limit: int = DISCORD_MESSAGE_LIMIT):
+        self.sinks = sinks
+        self.batch_window = batch_window
+        self.min_interval = min_interval
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.limit = limit
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.last_sent: Dict[int, float] = dict()
+        self.task: Optional[asyncio.Task] = None
+
+    def notify(self, text: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((text, future))
+        if self.task is None:
+            self.task = asyncio.create_task(self.worker())
+
+        return future
+
+    async def worker(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                delivered = await self.deliver("\n\n".join(text for text, _ in batch))
+            except Exception as e:
+                print("[err] Notification failed:", e)
+                delivered = False
+
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(delivered)
+                self.queue.task_done()
+
+    async def deliver(self, text: str) -> bool:
+        chunks = split_message(text, self.limit)
+        delivered = False
+        for sink in self.sinks:
+            try:
+                for chunk in chunks:
+                    await self.send_with_retry(sink, chunk)
+                delivered = True
+            except NotificationError as e:
+                print(f"[err] Notification to {sink.name} failed:", e)
+
+        return delivered
+
+    async def send_with_retry(self, sink, text: str) -> None:
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.retries + 1):
+            wait = self.min_interval - (loop.time() - self.last_sent.get(id(sink), float("-inf")))
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            try:
+                await sink.send(text)
+                return
+            except NotificationError as e:
+                if not e.retryable or attempt == self.retries:
+                    raise
+                delay = e.retry_after
+                if delay is None:
+                    delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+                print(f"[warn] Notification to {sink.name} failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+            finally:
+                self.last_sent[id(sink)] = loop.time()
+
+    async def close(self) -> None:
+        # sends whatever is still queued, then releases the sinks' connections
+        await self.queue.join()
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+        for sink in self.sinks:
+            await sink.close()
+
+ALERT_HEADINGS = {
+    "below_max": "**Products below threshold:**",
+    "pct_drop": "**Price drops:**",
+    "all_time_low": "**New all-time lows:**",
+}
+
+def build_alert_message(alerts: List[Dict[str, Any]]) -> str:
+    if not alerts:
+        return "There are no products below the threshold."
+
+    lines = []
+    for rule, heading in ALERT_HEADINGS.items():
+        matching = [alert for alert in alerts if alert["rule"] == rule]
+        if matching:
+            lines.append(heading)
+            lines += [f"- {describe_alert(alert)}" for alert in matching]
+
+    return "\n".join(lines)
+
+async def send_pending_alerts(pool: ConnectionPool, config: Dict[str, Any], discord_token: Optional[str]) -> int:
+    # the scrape raised these while saving prices; they stay pending until a sink took them,
+    # so a failed send is retried after the next run. Returns how many went out
+    async with pool.reader() as db:
+        alerts = await load_pending_alerts(db)
+    if not alerts:
+        return 0
+
+    sinks = sinks_from_config(config, discord_token)
+    if not sinks:
+        print("[warn] No notification sink configured,", len(alerts), "alerts stay pending")
+        return 0
+
+    notifier = Notifier(sinks)
+    try:
+        if not await notifier.notify(build_alert_message(alerts)):
+            return 0
+    finally:
+        await notifier.close()
+
+    async with pool.writer() as db:
+        await mark_alerts_notified(db, [alert["id"] for alert in alerts])
+
+    return len(alerts)
@@ -0,0 +1,92 @@
+import aiosqlite
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from Database import NOW_SQL, chunked
+
+# hours between two checks of one watched product in the "adaptive" scrape mode
+ADAPTIVE_MIN_HOURS = 1.0
+ADAPTIVE_MAX_HOURS = 24.0
+ADAPTIVE_START_HOURS = 6.0
+# checks within a product's usual time between two price changes
+ADAPTIVE_CHECKS_PER_CHANGE = 4
+# a product priced within this many percent above its watch_max_price is checked at least this often
+ADAPTIVE_NEAR_PCT = 10.0
+ADAPTIVE_NEAR_HOURS = 2.0
+# how far back price_history is read to tell how often a product's price moves
+ADAPTIVE_HISTORY_DAYS = 30
+
+def next_interval(previous: Optional[float], changed: Optional[bool], changes_per_day: float,
+                  last_price: Optional[int], watch_max_price: Optional[int]) -> float:
+    # doubles while the price holds and drops to a quarter when it moves, but stays within a fraction
+    # of the product's usual time between changes, and short while it sits just above the price it is
+    # watched for. changed is None when the check didn't get a price, which keeps the interval
+    if previous is None:
+        interval = ADAPTIVE_START_HOURS
+    elif changed is None:
+        interval = previous
+    elif changed:
+        interval = previous / 4
+    else:
+        interval = previous * 2
+
+    if changes_per_day > 0:
+        interval = min(interval, 24.0 / changes_per_day / ADAPTIVE_CHECKS_PER_CHANGE)
+    if last_price is not None and watch_max_price and last_price <= watch_max_price * (1 + ADAPTIVE_NEAR_PCT / 100):
+        interval = min(interval, ADAPTIVE_NEAR_HOURS)
+
+    return max(ADAPTIVE_MIN_HOURS, min(ADAPTIVE_MAX_HOURS, interval))
+
+async def load_due_watched(db: aiosqlite.Connection, site_name: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    # the watched products whose next check has come, most overdue first, after the ones never checked
+    # this way; watch_checks.next_check_at is the queue
+    columns = """products.id, products.external_id, products.title, products.link, products.image_link,
+                 products.currency, products.rating, products.ratings_count"""
+    async with db.execute(f"""
+        SELECT * FROM (
+          SELECT {columns}, '' AS due_at
+          FROM products LEFT JOIN watch_checks ON watch_checks.product_id = products.id
+          WHERE products.watch_price = 1 AND products.site_name = :site AND watch_checks.product_id IS NULL
+          UNION ALL
+          SELECT {columns}, watch_checks.next_check_at
+          FROM watch_checks JOIN products ON products.id = watch_checks.product_id
+          WHERE watch_checks.next_check_at <= ({NOW_SQL}) AND products.watch_price = 1 AND products.site_name = :site
+        )
+        ORDER BY due_at, id
+        {"LIMIT " + str(int(limit)) if limit else ""}
+    """, {"site": site_name}) as cur:
+        names = [d[0] for d in cur.description][:-1]
+        return [dict(zip(names, row)) for row in await cur.fetchall()]
+
+async def record_checks(db: aiosqlite.Connection, checks: List[Tuple[int, Optional[bool]]]) -> None:
+    # checks are (product_id, changed) for one round of product pages; sets each one's next check
+    for chunk in chunked(checks):
+        ids = [product_id for product_id, _ in chunk]
+        q_marks = ','.join(['?'] * len(ids))
+        async with db.execute(f"""
+            SELECT products.id, watch_checks.interval_hours, products.last_price, products.watch_max_price,
+                   (SELECT COUNT(*) - 1 FROM price_history
+                    WHERE price_history.product_id = products.id
+                      AND price_history.valid_to >= strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime', '-{ADAPTIVE_HISTORY_DAYS} days'))
+            FROM products LEFT JOIN watch_checks ON watch_checks.product_id = products.id
+            WHERE products.id IN ({q_marks})
+        """, ids) as cur:
+            rows = {row[0]: row[1:] for row in await cur.fetchall()}
+
+        intervals = []
+        for product_id, changed in chunk:
+            if product_id not in rows:
+                continue
+            previous, last_price, watch_max_price, changes = rows[product_id]
+            hours = next_interval(previous, changed, max(0, changes) / ADAPTIVE_HISTORY_DAYS, last_price, watch_max_price)
+            intervals.append((product_id, hours, f"{hours * 3600:.0f} seconds"))
+
+        await db.executemany(f"""
+            INSERT INTO watch_checks(product_id, interval_hours, next_check_at, checked_at)
+            VALUES (?, ?, strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime', ?3), ({NOW_SQL}))
+            ON CONFLICT(product_id) DO UPDATE SET
+                interval_hours = excluded.interval_hours, next_check_at = excluded.next_check_at,
+                checked_at = excluded.checked_at
+        """, intervals)
+
+    await db.commit()
@@ -1,82 +1,287 @@
-import subprocess
-import sys
-import json
+import asyncio
 import os
+import random
 
-from Database import SCRIPT_DIR, CONFIG_PATH
-
-def run_cmd(args):
-    try:
-        cp = subprocess.run(args, capture_output=True, text=True, check=False)
-    except FileNotFoundError:
-        raise RuntimeError("'schtasks' was not found. Must be run on Windows.")
-    
-    return cp.returncode, cp.stdout.strip(), cp.stderr.strip()
-
-def task_exists(task_name: str) -> bool:
-    args = ["schtasks", "/Query", "/TN", task_name]
-    rc, _, _ = run_cmd(args)
-
-    return rc == 0
-
-def create_task(run_time: str,
-                scrape_query: str,
-                task_name: str = "Price_tracker",
-                script_path: str = SCRIPT_DIR + "\\SchedulerStarter.py"
-):
-
-    if task_exists(task_name):
-        print(f"[warn] Task '{task_name}' already exists.")
-        return False
-    
-    with open(CONFIG_PATH, "r") as f:
-            config = json.load(f)
-    
-    config["schedule_query"] = scrape_query
-    config["schedule_time"] = run_time
-
-    with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-        json.dump(config, f, indent=2, ensure_ascii=False)
-
-    python_exe = sys.executable.replace("python.exe", "pythonw.exe")
-    tr = f'"{python_exe}" "{script_path}"'
-    args = ["schtasks", "/Create", "/TN", task_name, "/TR", tr, "/ST", run_time, "/SC", "DAILY"]
-
-    rc, out, err = run_cmd(args)
-    if rc == 0:
-        subprocess.run([
-            "powershell", "-Command",
-            r'$task = Get-ScheduledTask -TaskName "Price_tracker"; '
-            r'$task.Settings.DisallowStartIfOnBatteries = $false; '
-            r'$task.Settings.StopIfGoingOnBatteries = $false; '
-            r'$task.Settings.StartWhenAvailable = $true; '
-            r'Set-ScheduledTask -TaskName "Price_tracker" -Settings $task.Settings'
-        ])
-
-        return True
-    else:
-        print(f"[err] Task creation failed (code {rc}).")
-        if out:
-            print("stdout:", out)
-        if err:
-            print("stderr:", err)
-        
-        return False
-
-def delete_task(task_name: str = "Price_tracker") -> bool:
-    if not task_exists(task_name):
-        return False
-
-    args = ["schtasks", "/Delete", "/TN", task_name, "/F"]
-    rc, out, err = run_cmd(args)
-
-    if rc == 0:
-        return True
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Set
+
+import aiosqlite
+
+from Database import ConnectionPool
+from Config import ConfigStore
+from Notifications import send_pending_alerts
+
+DEFAULT_SCHEDULE = "default"
+DEFAULT_SCHEDULE_MODE = "incremental"
+SCHEDULE_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+# the loop wakes at least this often, so a changed system clock can't leave it asleep past a run
+SCHEDULER_MAX_SLEEP = 60.0
+# a schedule that could neither start nor be moved to its next run is tried again after this long
+SCHEDULER_RETRY_DELAY = 30.0
+CRON_ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+}
+CRON_FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day of month", 1, 31), ("month", 1, 12), ("day of week", 0, 7))
+
+def parse_cron_field(text: str, name: str, low: int, high: int) -> List[int]:
+    values = set()
+    for part in text.split(","):
+        span, _, step = part.partition("/")
+        try:
+            step = int(step) if step else 1
+            if span == "*":
+                start, end = low, high
+            elif "-" in span:
+                start, end = (int(v) for v in span.split("-", 1))
+            else:
+                start = int(span)
+                end = high if step != 1 or "/" in part else start
+        except ValueError:
+            raise ValueError(f"Invalid cron {name}: '{part}'")
+
+        if step < 1 or not low <= start <= end <= high:
+            raise ValueError(f"Invalid cron {name}: '{part}' (allowed {low}-{high})")
+        values.update(range(start, end + 1, step))
+
+    return sorted(values)
+
+class CronExpression:
+    # the five standard fields (minute hour day-of-month month day-of-week, 0 or 7 = Sunday) with
+    # lists, ranges and steps, plus @hourly/@daily/@weekly/@monthly. As in cron, when both day fields
+    # are restricted a day matching either one fires
+    def __init__(self, expression: str):
+        fields = CRON_ALIASES.get(expression.strip(), expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"Invalid cron expression '{expression}': expected 5 fields")
+
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            parse_cron_field(text, *spec) for text, spec in zip(fields, CRON_FIELDS)
+        )
+        self.weekdays = {d % 7 for d in weekdays}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def day_matches(self, day: date) -> bool:
+        if day.month not in self.months:
+            return False
+
+        in_days = day.day in self.days
+        in_weekdays = (day.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return in_days and in_weekdays
+
+        return in_days or in_weekdays
+
+    def next_after(self, after: datetime) -> datetime:
+        start = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.date()
+        # a matching day is at most a few years away (29 February on a given weekday)
+        for _ in range(366 * 8):
+            if self.day_matches(day):
+                for hour in self.hours:
+                    for minute in self.minutes:
+                        candidate = datetime.combine(day, time(hour, minute))
+                        if candidate >= start:
+                            return candidate
+            day += timedelta(days=1)
+
+        raise ValueError(f"Cron expression '{self.expression}' never fires")
+
+def check_schedule(schedule: Dict[str, Any]) -> None:
+    # exactly one of cron and interval_minutes; raises ValueError with what's wrong
+    if bool(schedule.get("cron")) == bool(schedule.get("interval_minutes")):
+        raise ValueError("A schedule needs either a cron expression or interval_minutes")
+    if schedule.get("cron"):
+        CronExpression(schedule["cron"]).next_after(datetime.now())
+    elif int(schedule["interval_minutes"]) < 1:
+        raise ValueError("interval_minutes must be at least 1")
+
+def next_run(schedule: Dict[str, Any], after: datetime) -> datetime:
+    if schedule.get("cron"):
+        at = CronExpression(schedule["cron"]).next_after(after)
     else:
-        print(f"[err] Task deletion failed (code {rc}).")
-        if out:
-            print("stdout:", out)
-        if err:
-            print("stderr:", err)
-        
-        return False
+        at = after + timedelta(minutes=int(schedule["interval_minutes"]))
+
+    # jitter spreads schedules that share a time, so their first page requests don't land together
+    return at + timedelta(seconds=random.uniform(0, schedule.get("jitter_seconds") or 0))
+
+def format_time(at: datetime) -> str:
+    return at.strftime(SCHEDULE_TIME_FORMAT)
+
+def parse_time(text: str) -> datetime:
+    return datetime.strptime(text.split(".")[0], SCHEDULE_TIME_FORMAT)
+
+async def list_schedules(db: aiosqlite.Connection, enabled_only: bool = False) -> List[Dict[str, Any]]:
+    async with db.execute(f"""
+        SELECT id, name, query, mode, cron, interval_minutes, jitter_seconds, catch_up, enabled,
+               next_run_at, last_run_at, last_job_id
+        FROM schedules {"WHERE enabled = 1" if enabled_only else ""}
+        ORDER BY name
+    """) as cur:
+        columns = [d[0] for d in cur.description]
+        return [dict(zip(columns, row)) for row in await cur.fetchall()]
+
+async def save_schedule(db: aiosqlite.Connection, schedule: Dict[str, Any]) -> Dict[str, Any]:
+    # creates or replaces the schedule with this name; its next run is computed from now
+    check_schedule(schedule)
+    schedule = {
+        "mode": DEFAULT_SCHEDULE_MODE, "cron": None, "interval_minutes": None, "jitter_seconds": 0,
+        "catch_up": True, "enabled": True, **schedule,
+    }
+    schedule["next_run_at"] = format_time(next_run(schedule, datetime.now()))
+
+    await db.execute("""
+        INSERT INTO schedules(name, query, mode, cron, interval_minutes, jitter_seconds, catch_up, enabled, next_run_at)
+        VALUES (:name, :query, :mode, :cron, :interval_minutes, :jitter_seconds, :catch_up, :enabled, :next_run_at)
+        ON CONFLICT(name) DO UPDATE SET
+            query = excluded.query, mode = excluded.mode, cron = excluded.cron,
+            interval_minutes = excluded.interval_minutes, jitter_seconds = excluded.jitter_seconds,
+            catch_up = excluded.catch_up, enabled = excluded.enabled, next_run_at = excluded.next_run_at
+    """, {key: schedule[key] for key in ("name", "query", "mode", "cron", "interval_minutes", "jitter_seconds",
+                                         "catch_up", "enabled", "next_run_at")})
+    await db.commit()
+
+    return schedule
+
+async def delete_schedule(db: aiosqlite.Connection, name: str) -> bool:
+    cur = await db.execute("DELETE FROM schedules WHERE name = ?", (name,))
+    await db.commit()
+
+    return cur.rowcount > 0
+
+async def migrate_config_schedule(db: aiosqlite.Connection, config: Dict[str, Any]) -> None:
+    # the daily query and time used to live in config.json (and in a Windows scheduled task)
+    query, at = config.get("schedule_query"), config.get("schedule_time")
+    if not query or not at:
+        return
+
+    async with db.execute("SELECT 1 FROM schedules LIMIT 1") as cur:
+        if await cur.fetchone() is not None:
+            return
+
+    hour, minute = (int(v) for v in at.split(":"))
+    await save_schedule(db, {"name": DEFAULT_SCHEDULE, "query": query, "cron": f"{minute} {hour} * * *",
+                             "mode": config.get("schedule_mode", DEFAULT_SCHEDULE_MODE)})
+
+class ScheduleRunner:
+    # runs the schedules table inside the API process: a due schedule becomes a job on the resident
+    # ScrapeService (warm engines, shared pool) and its alerts are sent once the job is done.
+    # Runs missed while the API was down fire once at startup when catch_up is set and are skipped
+    # otherwise; a schedule whose previous job is still going skips that firing
+    def __init__(self, pool: ConnectionPool, service, config: ConfigStore):
+        self.pool = pool
+        self.service = service
+        self.config = config
+        self.changed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.followers: Set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        # lazy, like the API's other optional pieces: the Discord token comes from .env when it's there
+        try:
+            from dotenv import load_dotenv
+            load_dotenv()
+        except ImportError:
+            pass
+
+        async with self.pool.writer() as db:
+            await migrate_config_schedule(db, self.config.get())
+            await self.catch_up(db)
+
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        for task in [self.task, *self.followers]:
+            if task is not None:
+                task.cancel()
+        await asyncio.gather(*(t for t in [self.task, *self.followers] if t is not None), return_exceptions=True)
+        self.task = None
+        self.followers.clear()
+
+    def wake(self) -> None:
+        # called after the schedules table changed
+        self.changed.set()
+
+    async def catch_up(self, db: aiosqlite.Connection) -> None:
+        now = datetime.now()
+        skipped = []
+        for schedule in await list_schedules(db, enabled_only=True):
+            if schedule["next_run_at"] is None or (not schedule["catch_up"] and parse_time(schedule["next_run_at"]) < now):
+                skipped.append((format_time(next_run(schedule, now)), schedule["id"]))
+
+        if skipped:
+            await db.executemany("UPDATE schedules SET next_run_at = ? WHERE id = ?", skipped)
+        # job ids restart with the process, so an id stored by the last one would name some other job
+        await db.execute("UPDATE schedules SET last_job_id = NULL WHERE last_job_id IS NOT NULL")
+        await db.commit()
+
+    async def run(self) -> None:
+        while True:
+            self.changed.clear()
+            async with self.pool.reader() as db:
+                schedules = [s for s in await list_schedules(db, enabled_only=True) if s["next_run_at"] is not None]
+
+            now = datetime.now()
+            due = [s for s in schedules if parse_time(s["next_run_at"]) <= now]
+            stuck = False
+            for schedule in due:
+                try:
+                    await self.fire(schedule, now)
+                except Exception as e:
+                    print(f"[err] Schedule '{schedule['name']}' failed to start:", e)
+                    # moved on to its next run all the same, or it would be due again right away
+                    try:
+                        await self.advance(schedule, now)
+                    except Exception as e:
+                        print(f"[err] Schedule '{schedule['name']}' could not be moved to its next run:", e)
+                        stuck = True
+
+            if stuck:
+                try:
+                    await asyncio.wait_for(self.changed.wait(), SCHEDULER_RETRY_DELAY)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            if due:
+                continue
+
+            wait = min([(parse_time(s["next_run_at"]) - now).total_seconds() for s in schedules] + [SCHEDULER_MAX_SLEEP])
+            try:
+                await asyncio.wait_for(self.changed.wait(), max(0.0, wait))
+            except asyncio.TimeoutError:
+                pass
+
+    async def fire(self, schedule: Dict[str, Any], now: datetime) -> None:
+        previous = self.service.get(schedule["last_job_id"]) if schedule["last_job_id"] else None
+        job = None
+        if previous is not None and previous.status in ("queued", "in_progress"):
+            print(f"[warn] Schedule '{schedule['name']}' skipped, job {previous.id} is still running")
+        else:
+            job = self.service.submit(schedule["query"], schedule["mode"])
+            follower = asyncio.create_task(self.follow(job))
+            self.followers.add(follower)
+            follower.add_done_callback(self.followers.discard)
+
+        await self.advance(schedule, now, job)
+
+    async def advance(self, schedule: Dict[str, Any], now: datetime, job=None) -> None:
+        # sets the schedule's next run, and its last one when job was started for it
+        async with self.pool.writer() as db:
+            await db.execute("""
+                UPDATE schedules SET next_run_at = ?, last_run_at = COALESCE(?, last_run_at),
+                                     last_job_id = COALESCE(?, last_job_id)
+                WHERE id = ?
+            """, (format_time(next_run(schedule, now)), format_time(now) if job else None,
+                  job.id if job else None, schedule["id"]))
+            await db.commit()
+
+    async def follow(self, job) -> None:
+        await job.done.wait()
+        try:
+            await send_pending_alerts(self.pool, self.config.get(), os.getenv("DISCORD_TOKEN"))
+        except Exception as e:
+            print(f"[err] Sending alerts after job {job.id} failed:", e)
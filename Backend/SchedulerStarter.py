@@ -1,101 +1,42 @@
 import sys
-import sqlite3
-import subprocess
-import discord
 import asyncio
 import os
-import json
 
-from typing import List, Tuple, Union
 from dotenv import load_dotenv
-from Database import DB_PATH, CONFIG_PATH, SCRIPT_DIR
-
-def get_products_under_maxprice():
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-
-    cur.execute(""" 
-        SELECT title, last_price, watch_max_price
-        FROM products
-        WHERE watch_price = 1 AND last_price < watch_max_price
-    """)
-
-    results = cur.fetchall()
-    conn.close()
-
-    return results
-
-def build_discord_message(products: List[Tuple[str, float]]) -> str:
-    if not products:
-        return "There are no products below the threshold."
-    
-    lines = ["**Products below threshold:**"]
-    for t, p, *rest in products:
-        lines.append(f"- {t} — {p} < {rest[0]}")
-    
-    return "\n".join(lines)
-
-def send_discord_alert_dm(products: List[Tuple[str, float]], token: str, user_id: Union[int, str]):
-    if user_id is None or user_id == '':
-        return
-    
+from Database import DB_PATH, CONFIG_PATH, ConnectionPool, init_db
+from Config import config_store
+from Scraper import Scraper, load_run_settings
+from Scheduler import DEFAULT_SCHEDULE, list_schedules, migrate_config_schedule
+from Notifications import send_pending_alerts
+
+# Usage: python SchedulerStarter.py [schedule name]
+# Runs one schedule right away and sends its alerts, for driving runs from cron or another scheduler
+# instead of the API's built-in one. Scraping and notifying share this one process.
+
+async def main(name: str) -> int:
+    await init_db(DB_PATH)
+    config = config_store(CONFIG_PATH).get()
+
+    pool = ConnectionPool(DB_PATH, size=0)
+    await pool.open()
     try:
-        user_id = int(user_id)
-    except Exception:
-        print("Invalid user_id — must be an int.")
-        return
-
-    async def main():
-        intents = discord.Intents.default()
-        intents.guilds = True
-        intents.messages = True
-        client = discord.Client(intents=intents)
+        async with pool.writer() as db:
+            await migrate_config_schedule(db, config)
+            schedule = next((s for s in await list_schedules(db) if s["name"] == name), None)
+        if schedule is None:
+            print(f"[err] No schedule named '{name}'")
+            return 1
 
-        async def send_and_close():
-            try:
-                user = await client.fetch_user(user_id)
-                if user is None:
-                    print("User not found.")
-                    return
+        scraper = Scraper(CONFIG_PATH)
+        filter, min_hours_update = load_run_settings(scraper.config)
+        await scraper.RunScrap(schedule["query"], filter, min_hours_update, pool=pool, mode=schedule["mode"])
 
-                await user.send(build_discord_message(products))
-            except Exception as e:
-                print("Error sending DM:", e)
+        await send_pending_alerts(pool, config, os.getenv("DISCORD_TOKEN"))
+    finally:
+        await pool.close()
 
-        try:
-            await client.login(token)
-        except Exception as e:
-            print("Login failed:", e)
-            return
-
-        try:
-            asyncio.create_task(client.connect())
-            await client.wait_until_ready()
-            await send_and_close()
-        except Exception as e:
-            print("Connect/send failed:", e)
-        finally:
-            try:
-                await client.close()
-            except Exception as e:
-                print("Error closing client:", e)
-
-    asyncio.run(main())
+    return 0
 
 if __name__ == "__main__":
-    with open(CONFIG_PATH, "r") as f:
-        config = json.load(f)
-    
-    python_exe = sys.executable
-    cmd = [f"{python_exe}", SCRIPT_DIR + "\\Scrape_worker.py", config["schedule_query"], CONFIG_PATH]
-
-    proc = subprocess.Popen(cmd)
-    proc.wait()
-
-    products = get_products_under_maxprice()
-    if len(products) > 0:
-        load_dotenv()
-
-        send_discord_alert_dm(products=get_products_under_maxprice(), token=os.getenv("DISCORD_TOKEN") or "", user_id=config["discord_user_id"])
-
-    sys.exit(0)
\ No newline at end of file
+    load_dotenv()
+    sys.exit(asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_SCHEDULE)))
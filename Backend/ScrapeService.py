@@ -0,0 +1,146 @@
+import asyncio
+import itertools
+import time
+
+from typing import Callable, Dict, Optional
+
+from Database import ConnectionPool
+from Engines import PlaywrightEngine, HttpEngine
+from Scraper import Scraper, load_run_settings
+from Events import EventBus
+
+SCRAPE_WORKERS = 2
+MAX_FINISHED_JOBS = 50
+
+class ScrapeJob:
+    def __init__(self, id: int, query: str, mode: str = "full", publish: Optional[Callable[[dict], None]] = None):
+        self.id = id
+        self.query = query
+        self.mode = mode
+        self.publish = publish
+        self.status = "queued"
+        self.pages = 0
+        self.len_products = 0
+        self.errors = []
+        self.created_at = time.time()
+        self.started_at = None
+        self.first_result_at = None
+        self.finished_at = None
+        self.reported = False
+        self.end_event = None
+        self.done = asyncio.Event()
+
+    def on_event(self, event: dict) -> None:
+        if event["event"] == "page":
+            self.pages += 1
+            self.len_products += event["persisted"]
+            if self.first_result_at is None:
+                self.first_result_at = time.time()
+        elif event["event"] == "site_error":
+            self.errors.append(f"{event['site']}: {event['error']}")
+
+        if self.publish is not None:
+            self.publish({**event, "job_id": self.id})
+
+    def finish(self, status: str) -> None:
+        self.status = status
+        self.finished_at = time.time()
+        self.done.set()
+        if self.publish is not None:
+            # kept with the job, for streams opened after it has left the bus history
+            self.end_event = self.publish({"event": "job_" + status, "job_id": self.id, "len_products": self.len_products,
+                          "pages": self.pages, "errors": self.errors, "duration": self.to_dict()["duration"]})
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "query": self.query,
+            "mode": self.mode,
+            "status": self.status,
+            "pages": self.pages,
+            "len_products": str(self.len_products),
+            "errors": self.errors,
+            "first_result_after": round(self.first_result_at - self.created_at, 3) if self.first_result_at else None,
+            "duration": round((self.finished_at or time.time()) - self.started_at, 3) if self.started_at else None,
+        }
+
+# Resident scrape workers sharing one warm set of engines (browser and HTTP pool)
+class ScrapeService:
+    def __init__(self, config_path: str, pool: ConnectionPool, workers: int = SCRAPE_WORKERS):
+        self.config_path = config_path
+        self.pool = pool
+        self.workers = workers
+        self.queue = asyncio.Queue()
+        self.jobs: Dict[int, ScrapeJob] = dict()
+        self.ids = itertools.count(1)
+        self.tasks = []
+        self.engines = None
+        self.events = EventBus()
+
+    async def start(self) -> None:
+        self.engines = {"playwright": PlaywrightEngine(), "http": HttpEngine()}
+        self.tasks = [asyncio.create_task(self.worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+        if self.engines is not None:
+            for engine in self.engines.values():
+                await engine.close()
+            self.engines = None
+
+    def submit(self, query: str, mode: str = "full") -> ScrapeJob:
+        job = ScrapeJob(next(self.ids), query, mode, publish=self.events.publish)
+        self.jobs[job.id] = job
+        job.on_event({"event": "job_queued", "query": query, "mode": mode})
+        self.queue.put_nowait(job)
+        self.prune()
+
+        return job
+
+    def get(self, job_id: int) -> Optional[ScrapeJob]:
+        return self.jobs.get(job_id)
+
+    def prune(self) -> None:
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished_at is not None]
+        for job_id in finished[:-MAX_FINISHED_JOBS]:
+            del self.jobs[job_id]
+
+    def latest_status(self) -> dict:
+        # the single-job view used by callers that do not track job ids: "done" is reported once
+        if any(job.status in ("queued", "in_progress") for job in self.jobs.values()):
+            return {"status": "in_progress"}
+
+        unreported = [job for job in self.jobs.values() if job.finished_at is not None and not job.reported]
+        if not unreported:
+            return {"status": "idle"}
+
+        for job in unreported:
+            job.reported = True
+
+        return {"status": "done", "len_products": unreported[-1].to_dict()["len_products"]}
+
+    async def worker(self) -> None:
+        while True:
+            job = await self.queue.get()
+            job.status = "in_progress"
+            job.started_at = time.time()
+            job.on_event({"event": "job_started"})
+
+            try:
+                scraper = Scraper(self.config_path, on_event=job.on_event)
+                filter, min_hours_update = load_run_settings(scraper.config)
+                await scraper.RunScrap(job.query, filter, min_hours_update, engines=self.engines, pool=self.pool, mode=job.mode)
+                job.finish("done")
+            except asyncio.CancelledError:
+                job.finish("failed")
+                raise
+            except Exception as e:
+                print(f"[err] Scrape job {job.id} failed:", e)
+                job.errors.append(str(e))
+                job.finish("failed")
+            finally:
+                self.queue.task_done()
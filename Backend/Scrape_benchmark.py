@@ -0,0 +1,121 @@
+import sys
+import asyncio
+import gzip
+import tempfile
+import threading
+import time
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from Engines import PlaywrightEngine, AssetCache, DEFAULT_BLOCK_RESOURCES, DEFAULT_BLOCK_URLS
+
+# Usage: python Scrape_benchmark.py [pages] [latency ms]
+# Serves search pages shaped like a shop's (product images, a web font, CSS, a tracker script)
+# from a local server and loads them through PlaywrightEngine with each blocking setup.
+# CSS and scripts are gzipped like a real origin's, so cached copies are replayed from compressed responses.
+
+CARDS_PER_PAGE = 40
+ASSETS = {
+    # path: (content type, size in bytes)
+    "/static/site.css": ("text/css", 120_000),
+    "/static/app.js": ("application/javascript", 300_000),
+    "/static/font.woff2": ("font/woff2", 80_000),
+    "/track/googletagmanager.com/gtm.js": ("application/javascript", 150_000),
+}
+IMAGE_SIZE = 25_000
+
+SETUPS = [
+    ("no blocking", {"block_resources": [], "block_urls": []}),
+    ("default blocking", {}),
+    ("default + stylesheets", {"block_resources": DEFAULT_BLOCK_RESOURCES + ["stylesheet"], "block_urls": DEFAULT_BLOCK_URLS}),
+    ("default + asset cache", {"asset_cache": True}),
+]
+
+def search_page(page: int) -> str:
+    cards = "".join(f"""
+        <div class="card" data-id="{i}">
+          <img src="/img/{i}.jpg">
+          <a class="title" href="/product/{i}">Laptop gaming {i}</a>
+          <p class="price">{1000 + i},99 Lei</p>
+        </div>""" for i in range((page - 1) * CARDS_PER_PAGE, page * CARDS_PER_PAGE))
+
+    return f"""<html><head>
+        <link rel="stylesheet" href="/static/site.css">
+        <style>@font-face {{ font-family: shop; src: url(/static/font.woff2); }} body {{ font-family: shop; }}</style>
+        <script src="/static/app.js"></script>
+        <script src="/track/googletagmanager.com/gtm.js"></script>
+        </head><body>{cards}</body></html>"""
+
+def start_server(latency: float):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(latency)
+            url = urlparse(self.path)
+            encoding = None
+            if url.path == "/search":
+                body, content_type = search_page(int(parse_qs(url.query)["page"][0])).encode(), "text/html"
+            elif url.path.startswith("/img/"):
+                body, content_type = b"\0" * IMAGE_SIZE, "image/jpeg"
+            elif url.path in ASSETS:
+                content_type, size = ASSETS[url.path]
+                body = b"/" * size
+                if content_type != "font/woff2" and "gzip" in self.headers.get("Accept-Encoding", ""):
+                    body, encoding = gzip.compress(body), "gzip"
+            else:
+                self.send_response(404)
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            if encoding is not None:
+                self.send_header("Content-Encoding", encoding)
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+async def run(base: str, pages: int) -> None:
+    selectors = {"product": "div.card", "title": "a.title", "link": "a.title", "price": "p.price", "currency": "",
+                 "rating": "", "id": "data-id", "image_link": "img", "remove_items_with": "", "end_of_pages": ""}
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        for name, settings in SETUPS:
+            # a fresh engine per setup, so the browser's own cache doesn't carry over
+            engine = PlaywrightEngine(cache=AssetCache(cache_dir), count_bytes=True)
+            site = {"name": name, "url": base, "url_searchTemplate": base + "/search?q={query}&page={page}",
+                    "selectors": selectors, **settings}
+            try:
+                cards = 0
+                for page in range(1, pages + 1):
+                    # one context per page, as a scrape round opens them, so the shared cache is what repeats
+                    session = await engine.open(site)
+                    try:
+                        cards += len(await session.fetch_cards(site["url_searchTemplate"].format(query="x", page=page)) or [])
+                    finally:
+                        await session.close()
+
+                m = engine.metrics[name].to_dict()
+                print(f"{name:24} {cards} cards, {m['bytes'] / 1e6:7.2f} MB in {m['requests']} requests, "
+                      f"{m['blocked']} blocked, {m['cache_hits']} cache hits, {m['avg_page_time'] * 1000:.0f} ms/page")
+            finally:
+                await engine.close()
+
+if __name__ == "__main__":
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.02
+
+    server = start_server(latency)
+    try:
+        asyncio.run(run(f"http://127.0.0.1:{server.server_address[1]}", pages))
+    finally:
+        server.shutdown()
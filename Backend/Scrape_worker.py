@@ -1,26 +1,14 @@
 import sys
-import json
 import asyncio
 
-from Scraper import Filters, Scraper
+from Scraper import Scraper, load_run_settings
 
 if __name__ == "__main__":
     query = sys.argv[1]
     config_path = sys.argv[2]
+    mode = sys.argv[3] if len(sys.argv) > 3 else "full"
 
-    try:
-        with open(config_path, "r", encoding="utf-8") as f:
-            config = json.load(f)
-    except Exception:
-        config = {}
-
-    min_price = int(config["configuration"]["min_price"])
-    max_price = int(config["configuration"]["max_price"])
-    min_rating = float(config["configuration"]["min_rating"])
-    min_ratings = int(config["configuration"]["min_ratings"])
-    min_hours_update = int(config["configuration"]["min_hours_update"])
-
-    filter = Filters(min_price, max_price, min_rating, min_ratings)
     scraper = Scraper(config_path)
+    filter, min_hours_update = load_run_settings(scraper.config)
     
-    asyncio.run(scraper.RunScrap(query, filter, min_hours_update))
+    asyncio.run(scraper.RunScrap(query, filter, min_hours_update, mode=mode))
@@ -1,13 +1,28 @@
 import asyncio
-import json
+import hashlib
 import os
+import time
 
-from playwright.async_api import async_playwright
-from playwright.async_api import TimeoutError as PWTimeout
+from datetime import datetime
+from typing import Callable, Optional, Tuple
 from urllib.parse import quote_plus
 
 from Matcher import build_generic_matcher
+from Engines import PlaywrightEngine, HttpEngine, DEFAULT_ENGINE
 from Database import * 
+from Config import config_store
+from Alerts import alert_rules, evaluate_alerts
+from Rechecks import load_due_watched, record_checks
+
+import Database
+import Metrics
+from Metrics import timer, observe, inc
+
+PERSIST_BATCH_SIZE = 500
+DEFAULT_SITE_CONCURRENCY = 1
+DEFAULT_SITE_DELAY = 3.0
+DEFAULT_INCREMENTAL_PAGES = 2
+SCRAPE_MODES = ("full", "incremental", "watched", "adaptive")
 
 class Filters:
     def __init__(self, min_price = 0, max_price = 0, min_rating:float = 0, min_ratings = 0):
@@ -16,10 +31,46 @@ class Filters:
         self.min_rating = min_rating
         self.min_ratings = min_ratings
 
+def load_run_settings(config) -> Tuple[Filters, float]:
+    min_price = int(config["configuration"]["min_price"])
+    max_price = int(config["configuration"]["max_price"])
+    min_rating = float(config["configuration"]["min_rating"])
+    min_ratings = int(config["configuration"]["min_ratings"])
+    min_hours_update = int(config["configuration"]["min_hours_update"])
+
+    return Filters(min_price, max_price, min_rating, min_ratings), min_hours_update
+
+def page_fingerprint(batch) -> str:
+    # what a result page says about the catalogue: which products it lists and at what price
+    pairs = sorted(f"{item['external_id']}\t{item['price_minor']}" for item in batch)
+    return hashlib.blake2b("\n".join(pairs).encode("utf-8"), digest_size=16).hexdigest()
+
+def engine_counters(engines, before=None) -> dict:
+    # the browser engine's per-site request counters, or how much they grew since before
+    counters = {name: dict(vars(metrics)) for name, metrics in getattr(engines.get("playwright"), "metrics", {}).items()}
+    if before is None:
+        return counters
+
+    return {
+        name: {key: round(value - before.get(name, {}).get(key, 0), 3) for key, value in values.items()}
+        for name, values in counters.items()
+    }
+
 class Scraper:
-    def __init__(self, config_path):
-        with open(config_path, "r", encoding="utf-8") as f:
-            self.config = json.load(f)
+    def __init__(self, config_path, on_event: Optional[Callable[[dict], None]] = None):
+        self.config = config_store(config_path).get()
+
+        self.on_event = on_event
+        self.pages_fetched = 0
+        self.alert_rules = alert_rules(self.config)
+
+    def report(self, event: str, **data) -> None:
+        if self.on_event is not None:
+            self.on_event({"event": event, **data})
+
+    def report_alerts(self, site_name: str, alerts) -> None:
+        for alert in alerts:
+            self.report("alert", site=site_name, **alert)
 
     def parse_price(self, price_str : str, separator: str = ","):   
         match = price_str.strip().split(" ")
@@ -70,145 +121,283 @@ class Scraper:
 
         return value, nr
 
-    async def RunScrap(self, query, filter: Filters, update_time: float = 0.0):
-        if not database_initialized:
-            await init_db()
-        db = await aiosqlite.connect(DB_PATH)
-
-        jumpSite = dict()
+    async def ScrapePage(self, session, site, query, matcher, filter: Filters, pgn: int):
+        # returns the page's accepted items, or None when the site has no more results
+        q = quote_plus(query.replace("\"", ""))
+        url = site["url_searchTemplate"].format(query=q, page=pgn)
+        self.pages_fetched += 1
+        inc("scrape_pages_total", site=site["name"])
+        cards = await session.fetch_cards(url)
+
+        if not cards:
+            return None
+
+        inc("scrape_cards_total", len(cards), site=site["name"])
+        # the matcher runs once per card, so its time is summed and reported once per page
+        timed = Metrics.METRICS_ENABLED
+        start = time.perf_counter() if timed else 0.0
+        matcher_time = 0.0
+        empty = True
+        batch = []
+        for card in cards:
+            if card["skip"]:
+                continue
+
+            title_text = card["title"] if card["title"] is not None else "N/A"
+            price_value, currency = self.parse_price(card["price"] if card["price"] is not None else "N/A")
+            ratingValue, ratingsNumber = self.parse_rating(card["rating"] if card["rating"] is not None else "N/A")
+
+            link_text = card["link"]
+            if link_text != None and link_text.startswith("/"):
+                link_text = site["url"] + link_text
+            
+            if site["selectors"]["id"] != "":
+                id = card["id"]
+            else:
+                id = link_text
+            
+            # getAttribute gives null for a missing attribute, e.g. a lazy image without src yet
+            image_link = card["image"] if card["image"] is not None else "N/A"
+
+            if site["selectors"]["currency"] != "":
+                currency = card["currency"] if card["currency"] is not None else "N/A"
+
+            if title_text == "N/A":
+                continue
+            if timed:
+                matched_at = time.perf_counter()
+                matched = matcher(title_text)
+                matcher_time += time.perf_counter() - matched_at
+            else:
+                matched = matcher(title_text)
+            if not matched:
+                continue
+
+            empty = False
+
+            if filter.min_price != 0 and (price_value is None or price_value < filter.min_price):
+                continue
+            if filter.max_price != 0 and (price_value is None or price_value > filter.max_price):
+                continue
+            if filter.min_rating != 0 and (ratingValue is None or ratingValue < filter.min_rating):
+                continue
+            if filter.min_ratings != 0 and (ratingsNumber is None or ratingsNumber < filter.min_ratings):
+                continue
+            # a product can't be stored without an id to find it again by
+            if not id:
+                continue
+            
+            batch.append({
+                "external_id": id,
+                "title": title_text,
+                "link": link_text if link_text is not None else "N/A",
+                "image_link": image_link,
+                "currency": currency,
+                "rating": ratingValue,
+                "ratings_count": ratingsNumber,
+                "price_minor": int(price_value) if price_value else None,
+            })
+
+        if timed:
+            observe("scrape_card_parse_seconds", time.perf_counter() - start, site=site["name"])
+            observe("scrape_matcher_seconds", matcher_time, site=site["name"])
+
+        return None if empty else batch
+
+    async def ScrapeSite(self, engines, pool: ConnectionPool, site, query, matcher, filter: Filters, update_time: float,
+                         incremental: bool = False) -> int:
+        concurrency = max(1, int(site.get("concurrency", DEFAULT_SITE_CONCURRENCY)))
+        delay = float(site.get("delay", DEFAULT_SITE_DELAY))
+        engine = site.get("engine", DEFAULT_ENGINE)
         products_nr = 0
 
-        for site in self.config["sites"]:
-            jumpSite[site["name"]] = (site["url"] == "")
-        
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True, channel="chrome",
-                args=[
-                    "--no-sandbox",
-                    "--disable-gpu",
-                    "--disable-dev-shm-usage",
-                    "--disable-blink-features=AutomationControlled",
-            ])
+        # incremental runs stop after this many pages in a row read the same as last time; every run
+        # stores its fingerprints, so a full crawl is the baseline for the next incremental one
+        stop_after = max(1, int(site.get("incremental_pages", DEFAULT_INCREMENTAL_PAGES)))
+        known, unchanged = dict(), 0
+        if incremental:
+            async with pool.reader() as db:
+                known = await load_page_fingerprints(db, site["name"], query)
 
-            pgn = 1
-            matcher = build_generic_matcher(query)
-            outOfSites = False
-
-            while not outOfSites:
-                outOfSites = True
-                for site in self.config["sites"]:
-                    if jumpSite[site["name"]]:
-                        continue
+        # "auto" tries plain HTTP first and only falls back to Chromium when page 1 has no product cards
+        session = await engines["playwright" if engine == "playwright" else "http"].open(site)
 
-                    context = await browser.new_context(
-                        user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.0.0 Safari/537.36",
-                        locale="en-US"
-                    )
+        try:
+            pgn = 1
+            outOfPages = False
+
+            while not outOfPages:
+                # pages pgn .. pgn + concurrency - 1 are fetched together, but consumed in order
+                pages = await asyncio.gather(*(
+                    self.ScrapePage(session, site, query, matcher, filter, p) for p in range(pgn, pgn + concurrency)
+                ))
+
+                if engine == "auto" and pgn == 1 and pages[0] is None:
+                    await session.close()
+                    session = await engines["playwright"].open(site)
+                    engine = "playwright"
+                    continue
+
+                for offset, batch in enumerate(pages):
+                    if batch is None:
+                        outOfPages = True
+                        break
+
+                    page_no = pgn + offset
+                    fingerprint = page_fingerprint(batch)
+                    persisted, changed = 0, []
+                    with timer("scrape_db_write_seconds", site=site["name"]):
+                        async with pool.writer() as db:
+                            for i in range(0, len(batch), PERSIST_BATCH_SIZE):
+                                persisted += len(await upsert_products_bulk(db, site["name"], batch[i:i + PERSIST_BATCH_SIZE], update_time, changed))
+                            await save_page_fingerprint(db, site["name"], query, page_no, fingerprint)
+                            alerts = await evaluate_alerts(db, changed, self.alert_rules)
+
+                    products_nr += persisted
+                    self.report("page", site=site["name"], page=page_no, items=len(batch), persisted=persisted)
+                    self.report_alerts(site["name"], alerts)
+
+                    unchanged = unchanged + 1 if known.get(page_no) == fingerprint else 0
+                    if incremental and unchanged >= stop_after:
+                        self.report("incremental_stop", site=site["name"], page=page_no)
+                        outOfPages = True
+                        break
+
+                if not outOfPages:
+                    await asyncio.sleep(delay)
+                    pgn += concurrency
+        finally:
+            await session.close()
+
+        return products_nr
+
+    async def RecheckWatched(self, engines, pool: ConnectionPool, site, update_time: float, adaptive: bool = False) -> int:
+        # watched products are refreshed from their own pages instead of the search results. The price
+        # is read with the site's "product_page_price" selector, or its card price selector when the
+        # product page uses the same markup; the scrape filters don't apply to tracked products.
+        # adaptive only takes the products whose next check is due (see Rechecks.next_interval)
+        async with pool.reader() as db:
+            products = await (load_due_watched(db, site["name"]) if adaptive else load_watched_products(db, site["name"]))
+        if not products:
+            return 0
+
+        concurrency = max(1, int(site.get("concurrency", DEFAULT_SITE_CONCURRENCY)))
+        delay = float(site.get("delay", DEFAULT_SITE_DELAY))
+        engine = site.get("engine", DEFAULT_ENGINE)
+        selector = site["selectors"].get("product_page_price") or site["selectors"]["price"]
+        products_nr = 0
 
-                    await context.set_extra_http_headers({
-                        "Accept-Language": "en-US;q=0.8,en;q=0.7",
-                        "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-                        "Connection": "keep-alive",
-                        "Referer": site["url"],
-                    })
+        session = await engines["playwright" if engine == "playwright" else "http"].open(site)
 
-                    page = await context.new_page()
+        try:
+            for start in range(0, len(products), concurrency):
+                chunk = products[start:start + concurrency]
+                self.pages_fetched += len(chunk)
+                texts = await asyncio.gather(*(session.fetch_text(p["link"], selector) for p in chunk), return_exceptions=True)
+
+                batch, missed = [], []
+                for product, text in zip(chunk, texts):
+                    price_value, currency = self.parse_price(text) if isinstance(text, str) else (None, None)
+                    if price_value is None:
+                        # a page that didn't show a price says nothing about the product, keep the stored one
+                        self.report("recheck_miss", site=site["name"], link=product["link"])
+                        missed.append(product)
+                        continue
 
-                    q = quote_plus(query.replace("\"", ""))
-                    url = site["url_searchTemplate"].format(query=q, page=pgn)
-                    await page.goto(url, timeout=60000, wait_until="domcontentloaded")
+                    batch.append({**product, "currency": currency, "price_minor": int(price_value)})
+
+                persisted, changed, alerts = 0, [], []
+                if batch or (adaptive and missed):
+                    with timer("scrape_db_write_seconds", site=site["name"]):
+                        async with pool.writer() as db:
+                            if batch:
+                                persisted = len(await upsert_products_bulk(db, site["name"], batch, update_time, changed))
+                                alerts = await evaluate_alerts(db, changed, self.alert_rules)
+                            if adaptive:
+                                await record_checks(db, [(p["id"], p["id"] in changed) for p in batch] +
+                                                        [(p["id"], None) for p in missed])
+
+                products_nr += persisted
+                self.report("page", site=site["name"], page=start // concurrency + 1, items=len(chunk), persisted=persisted)
+                self.report_alerts(site["name"], alerts)
+
+                if start + concurrency < len(products):
+                    await asyncio.sleep(delay)
+        finally:
+            await session.close()
+
+        return products_nr
+
+    async def RunScrap(self, query, filter: Filters, update_time: float = 0.0, engines=None, pool: Optional[ConnectionPool] = None,
+                       mode: str = "full") -> int:
+        # engines and a pool passed in by a long-lived caller stay open (and warm) after the run.
+        # mode is one of SCRAPE_MODES: every result page, result pages until they stop changing,
+        # only the watched products' own pages, or only those of them that are due a check
+        # read off the module: the name star-imported above is a copy taken at import time, still False
+        if not Database.database_initialized:
+            await init_db(pool.path if pool is not None else DB_PATH)
+
+        owns_pool = pool is None
+        if owns_pool:
+            pool = ConnectionPool(DB_PATH, size=0)
+            await pool.open()
 
-                    try:
-                        await page.wait_for_selector(site["selectors"]["product"], timeout=4000)
-                    except PWTimeout:
-                        jumpSite[site["name"]] = True
-                        continue
+        products_nr = 0
+        errors = []
+        started_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+        owns_engines = engines is None
+        if owns_engines:
+            engines = {"playwright": PlaywrightEngine(), "http": HttpEngine()}
+
+        # "profile_runs": true in config.json writes each run's timings to Data/profiles/
+        profile = Metrics.Registry() if Metrics.METRICS_ENABLED and self.config.get("profile_runs") else None
+        profile_token = Metrics.CURRENT_PROFILE.set(profile)
+        engine_before = engine_counters(engines) if profile is not None else None
+        pages_before = self.pages_fetched
+        run_start = time.perf_counter()
 
-                    items = await page.query_selector_all(site["selectors"]["product"])
-                    if not items:
-                        jumpSite[site["name"]] = True
-                        continue
+        try:
+            matcher = build_generic_matcher(query)
+            sites = [site for site in self.config["sites"] if site["url"] != ""]
 
-                    if site["selectors"]["end_of_pages"] != "":
-                        svg_elem = await page.query_selector(site["selectors"]["end_of_pages"])
-                        if svg_elem:
-                            jumpSite[site["name"]] = True
-                            continue
-
-                    empty = True
-                    for item in items:
-                        if site["selectors"]["remove_items_with"] != "":
-                            svg_elem = await item.query_selector(site["selectors"]["remove_items_with"])
-                            if svg_elem:
-                                continue
-                            
-                        title = await item.query_selector(site["selectors"]["title"])
-                        price = await item.query_selector(site["selectors"]["price"])
-                        rating = await item.query_selector(site["selectors"]["rating"])
-                        link = await item.query_selector(site["selectors"]["link"])
-                        image = await item.query_selector(site["selectors"]["image_link"])
-
-                        title_text = (await (title.inner_text())).strip() if title else "N/A"
-                        price_text = (await price.inner_text()).strip() if price else "N/A"
-                        price_value, currency = self.parse_price(price_text)
-                        rating_text = (await rating.inner_text()).strip() if rating else "N/A"
-                        ratingValue, ratingsNumber = self.parse_rating(rating_text)
-
-                        if link != None:
-                            link_text = await link.get_attribute("href")
-                            if link_text != None and link_text.startswith("/"):
-                                link_text = site["url"] + link_text
-                        else:
-                            link_text = "N/A"
-                        
-                        if site["selectors"]["id"] != "":
-                            id = await item.get_attribute(site["selectors"]["id"])
-                        else:
-                            id = link_text
-                        
-                        if image:
-                            image_link = await image.get_attribute("src")
-                        else:
-                            image_link = "N/A"
-                        
-                        if site["selectors"]["currency"] != "":
-                            temp = await item.query_selector(site["selectors"]["currency"])
-                            currency = (await temp.inner_text()).strip() if temp else "N/A"
-
-                        if title_text == "N/A" or not matcher(title_text):
-                            continue
-
-                        empty = False
-                        outOfSites = False
-
-                        if filter.min_price != 0 and (price_value is None or price_value < filter.min_price):
-                            continue
-                        if filter.max_price != 0 and (price_value is None or price_value > filter.max_price):
-                            continue
-                        if filter.min_rating != 0 and (ratingValue is None or ratingValue < filter.min_rating):
-                            continue
-                        if filter.min_ratings != 0 and (ratingsNumber is None or ratingsNumber < filter.min_ratings):
-                            continue
-                        
-                        product_id = await upsert_product(db, site["name"], title_text, link_text, id, image_link, currency, ratingValue, ratingsNumber, update_time)
-                        await upsert_price_history(db, product_id, int(price_value) if price_value else None, update_time)
-                        
-                        products_nr += 1
-
-                    if empty:
-                        jumpSite[site["name"]] = True
-
-                    await page.close()
-
-                await asyncio.sleep(3)
-                pgn += 1
+            if mode in ("watched", "adaptive"):
+                runs = (self.RecheckWatched(engines, pool, site, update_time, mode == "adaptive") for site in sites)
+            else:
+                runs = (self.ScrapeSite(engines, pool, site, query, matcher, filter, update_time, mode == "incremental")
+                        for site in sites)
+            results = await asyncio.gather(*runs, return_exceptions=True)
+
+            for site, result in zip(sites, results):
+                if isinstance(result, BaseException):
+                    print(f"[err] Scraping {site['name']} failed:", result)
+                    errors.append(f"{site['name']}: {result}")
+                    self.report("site_error", site=site["name"], error=str(result))
+                else:
+                    products_nr += result
+                    self.report("site_done", site=site["name"], persisted=result)
             
-            self.config["nr_changed_products"] = str(products_nr)
-            with open(CONFIG_PATH, "w", encoding="utf-8") as f:
-                json.dump(self.config, f, indent=2, ensure_ascii=False)
-
-            await browser.close()
-            await db.close()
+            async with pool.writer() as db:
+                await record_scrape_run(db, query, started_at, products_nr, errors, mode, self.pages_fetched)
+        finally:
+            Metrics.CURRENT_PROFILE.reset(profile_token)
+            if profile is not None:
+                try:
+                    path = Metrics.write_profile(profile, {
+                        "query": query, "mode": mode, "started_at": started_at,
+                        "duration": round(time.perf_counter() - run_start, 3),
+                        "pages": self.pages_fetched - pages_before, "products": products_nr, "errors": errors,
+                        "engines": engine_counters(engines, engine_before),
+                    })
+                    print("Run profile written to", path)
+                except OSError as e:
+                    print("[err] Writing the run profile failed:", e)
+            if owns_engines:
+                for engine in engines.values():
+                    await engine.close()
+            if owns_pool:
+                await pool.close()
+
+        return products_nr
     
     def Run(self, query, filter:Filters, min_hours_update: float) -> None:
         asyncio.run(self.RunScrap(query, filter, min_hours_update))
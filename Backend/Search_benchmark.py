@@ -0,0 +1,71 @@
+import sys
+import os
+import time
+import random
+import asyncio
+import sqlite3
+import tempfile
+
+from Database import init_db
+from Matcher import build_fts_query, search_text
+
+# Usage: python Search_benchmark.py [products] [query ...]
+# Fills a temporary database with generated titles and times the /products q filter both ways:
+# the old LOWER(title) LIKE scan and the products_fts MATCH, each as the count plus the first page.
+
+CATEGORIES = ["Laptop gaming", "Placă video", "Monitor", "Căști wireless", "Tastatură mecanică", "Mouse", "SSD", "Telefon"]
+BRANDS = ["ASUS", "Lenovo", "Gigabyte", "MSI", "Samsung", "Logitech", "HyperX", "Acer", "Apple", "Xiaomi"]
+SPECS = ["RTX4070", "RTX 4060", "rtx-4090", "16GB", "32GB", "1TB", "512GB", "144Hz", "i7-13700H", "Ryzen 7", "OLED",
+         "USB-C", "negru", "argintiu", "Bluetooth 5.3", "DDR5", "Wi-Fi 6E", "27\"", "QHD", "RGB"]
+
+QUERIES = ["rtx4070", "laptop asus rtx 4060", "placa video gigabyte", "casti", "\"wi-fi 6e\" ddr5"]
+
+def build_title(r: random.Random, i: int) -> str:
+    specs = " ".join(r.sample(SPECS, r.randint(2, 6)))
+    return f"{r.choice(CATEGORIES)} {r.choice(BRANDS)} {specs} {i}"
+
+def build_db(path: str, products: int) -> None:
+    asyncio.run(init_db(path))
+
+    r = random.Random(1)
+    con = sqlite3.connect(path)
+    titles = (build_title(r, i) for i in range(products))
+    con.executemany("""
+        INSERT INTO products(site_name, external_id, image_link, title, search_title, link, currency, watch_price)
+        VALUES (?, ?, '', ?, ?, '', 'RON', 0)
+    """, (("site" + str(i % 3), str(i), title, search_text(title)) for i, title in enumerate(titles)))
+    con.commit()
+    con.close()
+
+def timed(con: sqlite3.Connection, where: str, param: str, runs: int = 5):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        total = con.execute(f"SELECT COUNT(*) FROM products WHERE {where}", (param,)).fetchone()[0]
+        con.execute(f"SELECT id, title FROM products WHERE {where} ORDER BY id LIMIT 50", (param,)).fetchall()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, total
+
+if __name__ == "__main__":
+    products = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    queries = sys.argv[2:] or QUERIES
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "search.db")
+
+        start = time.perf_counter()
+        build_db(path, products)
+        print(f"{products} products inserted and indexed in {time.perf_counter() - start:.1f} s")
+
+        con = sqlite3.connect(path)
+        for q in queries:
+            like_time, like_hits = timed(con, "LOWER(title) LIKE ?", f"%{q.lower()}%")
+            fts_query = build_fts_query(q)
+            line = f"{q!r:28} LIKE {like_time * 1000:7.1f} ms ({like_hits} hits)"
+            if fts_query:
+                fts_time, fts_hits = timed(con, "id IN (SELECT rowid FROM products_fts WHERE products_fts MATCH ?)", fts_query)
+                line += f" | FTS {fts_time * 1000:7.1f} ms ({fts_hits} hits)"
+            print(line)
+        con.close()
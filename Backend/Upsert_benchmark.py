@@ -0,0 +1,63 @@
+import sys
+import os
+import time
+import random
+import asyncio
+import tempfile
+
+from Database import init_db, ConnectionPool, upsert_product, upsert_price_history, upsert_products_bulk
+from Scraper import PERSIST_BATCH_SIZE
+
+# Usage: python Upsert_benchmark.py [products] [changed percent]
+# Persists a generated catalogue twice through each write path, as two scrape runs would: the first
+# run inserts every product, the second sees the same products with some prices changed. The per-row
+# path is upsert_product + upsert_price_history per card, the bulk path upsert_products_bulk per page.
+
+WORDS = ["laptop", "asus", "lenovo", "rtx", "4060", "16gb", "ssd", "1tb", "gaming", "monitor", "144hz", "casti", "wireless"]
+
+def build_items(products: int, seed: int = 1):
+    r = random.Random(seed)
+    return [{
+        "external_id": str(i), "title": " ".join(r.choice(WORDS) for _ in range(8)),
+        "link": f"https://example.com/p/{i}", "image_link": f"https://example.com/i/{i}.jpg", "currency": "Lei",
+        "rating": round(r.uniform(1, 5), 1), "ratings_count": r.randint(0, 500), "price_minor": r.randint(1000, 900000),
+    } for i in range(products)]
+
+def change_prices(items, percent: float, seed: int = 2):
+    r = random.Random(seed)
+    return [{**item, "price_minor": item["price_minor"] - 100} if r.random() * 100 < percent else item for item in items]
+
+async def per_row(db, items) -> None:
+    for item in items:
+        product_id = await upsert_product(db, "site", item["title"], item["link"], item["external_id"], item["image_link"],
+                                          item["currency"], item["rating"], item["ratings_count"], 0)
+        await upsert_price_history(db, product_id, item["price_minor"], 0)
+
+async def bulk(db, items) -> None:
+    for i in range(0, len(items), PERSIST_BATCH_SIZE):
+        await upsert_products_bulk(db, "site", items[i:i + PERSIST_BATCH_SIZE], 0)
+
+async def run(name: str, write, runs) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "upsert_benchmark.db")
+        await init_db(path)
+        pool = ConnectionPool(path, size=0)
+        await pool.open()
+        try:
+            for label, items in runs:
+                start = time.perf_counter()
+                async with pool.writer() as db:
+                    await write(db, items)
+                took = time.perf_counter() - start
+                print(f"{name:8} {label:14} {len(items)} items in {took:6.2f}s ({len(items) / took:8.0f} items/s)")
+        finally:
+            await pool.close()
+
+if __name__ == "__main__":
+    products = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    percent = float(sys.argv[2]) if len(sys.argv) > 2 else 10.0
+
+    items = build_items(products)
+    runs = [("first run", items), (f"{percent:g}% changed", change_prices(items, percent))]
+    asyncio.run(run("per-row", per_row, runs))
+    asyncio.run(run("bulk", bulk, runs))
@@ -333,34 +333,53 @@ function initializeOnSubmitListeners() {
     };
 }
 
-async function initializeScrapeButton() {
-    let requestResp = await fetch(`${API_BASE}/scrape/status`, { method: 'GET' });
-    let data = await requestResp.json();
-    if(data.status == 'idle')
-        return;
-    
+// Follows one scrape job over /scrape/events (Server-Sent Events) instead of polling /scrape/status.
+// onProgress gets every page/site event; resolves with the job_done or job_failed event
+function watchScrapeJob(jobId, onProgress) {
+    return new Promise((resolve) => {
+        // EventSource reconnects on its own and resumes after the last event id it saw
+        const source = new EventSource(`${API_BASE}/scrape/events?job_id=${jobId}`);
+        const finish = (e) => {
+            source.close();
+            resolve(JSON.parse(e.data));
+        };
+
+        ['page', 'site_done', 'site_error', 'incremental_stop'].forEach(name =>
+            source.addEventListener(name, e => onProgress(JSON.parse(e.data))));
+        source.addEventListener('job_done', finish);
+        source.addEventListener('job_failed', finish);
+    });
+}
+
+async function followScrapeJob(jobId, query) {
     const scrapeBtn = document.querySelector('#scrape-form button[type="submit"]');
     scrapeBtn.disabled = true;
     scrapeBtn.classList.add('btn-danger');
     scrapeBtn.classList.remove('btn-primary');
 
-    scrapingInProgress = true;
-    let finished = false;
-    let nr_products = '';
+    const messageElement = document.getElementById('success-message');
+    let pages = 0;
+    let persisted = 0;
 
-    while (!finished) {
-        await new Promise(res => setTimeout(res, 3000));
-        let statusResp = await fetch(`${API_BASE}/scrape/status`, { method: 'GET' });
-        let statusData = await statusResp.json();
+    scrapingInProgress = true;
+    const result = await watchScrapeJob(jobId, (event) => {
+        if (event.event !== 'page')
+            return;
 
-        if (statusData.status === 'done') {
-            finished = true;
-            nr_products = statusData.len_products;
-        }
-    }
+        pages += 1;
+        persisted += event.persisted;
+        messageElement.textContent = `Scraping in progress with query = ${query} (${pages} pages, ` +
+                                     `${persisted} products saved, last: ${event.site} page ${event.page})`;
+    });
     scrapingInProgress = false;
 
-    showAlert('success', 'Scraping finished! ' + nr_products + ' products affected');
+    // marks the job as reported, so the next page load doesn't announce it again
+    await fetch(`${API_BASE}/scrape/status?job_id=${jobId}`, { method: 'GET' });
+
+    if (result.event === 'job_failed')
+        showAlert('error', 'Scraping failed: ' + result.errors.join('; '));
+    else
+        showAlert('success', 'Scraping finished! ' + result.len_products + ' products affected');
     showLoading();
     loadProducts();
     hideLoading();
@@ -372,6 +391,23 @@ async function initializeScrapeButton() {
     scrapeInput.value = "";
 }
 
+async function initializeScrapeButton() {
+    let requestResp = await fetch(`${API_BASE}/scrape/status`, { method: 'GET' });
+    let data = await requestResp.json();
+    if(data.status == 'idle')
+        return;
+
+    if(data.status == 'done') {
+        showAlert('success', 'Scraping finished! ' + data.len_products + ' products affected');
+        return;
+    }
+
+    let jobsResp = await fetch(`${API_BASE}/scrape/jobs`, { method: 'GET' });
+    let active = (await jobsResp.json()).filter(job => job.status === 'queued' || job.status === 'in_progress');
+    for (const job of active)
+        await followScrapeJob(job.job_id, job.query);
+}
+
 async function initializeScrapeSettings() {
     const formData = new FormData();
     const response = await fetch(`${API_BASE}/get_config`, { method: 'POST', body: formData });
@@ -430,7 +466,7 @@ async function loadProducts() {
         renderProducts(data);
     } catch (error) {
         showAlert('error', error.message);
-        document.getElementById('products-table').innerHTML = `<tr><td colspan="7" class="empty-state"><i class="fas fa-exclamation-triangle"></i><div>Eroare la încărcarea datelor</div></td></tr>`;
+        document.getElementById('products-table').innerHTML = `<tr><td colspan="8" class="empty-state"><i class="fas fa-exclamation-triangle"></i><div>Eroare la încărcarea datelor</div></td></tr>`;
     } finally {
         hideLoading();
     }
@@ -441,7 +477,7 @@ function renderProducts(data) {
     tbody.innerHTML = '';
 
     if (!data.items || data.items.length === 0) {
-        tbody.innerHTML = `<tr><td colspan="7" class="empty-state"><i class="fas fa-box-open"></i><div>No products found</div></td></tr>`;
+        tbody.innerHTML = `<tr><td colspan="8" class="empty-state"><i class="fas fa-box-open"></i><div>No products found</div></td></tr>`;
     } else {
         data.items.forEach((p, idx) => {
             tbody.innerHTML += `<tr>
@@ -450,6 +486,7 @@ function renderProducts(data) {
                 <td><span class="site-badge">${p.site_name}</span></td>
                 <td><a href="product.html?product_id=${p.id}" class="product-link">${p.title}</a></td>
                 <td class="price">${p.currency || ''} ${p.last_price !== null ? p.last_price : '-'}</td>
+                <td>${renderPriceChange(p)}</td>
                 <td>${p.rating !== null ? p.rating : '-'}${p.ratings_count ? ` (${p.ratings_count})` : ''}</td>
                 <td class="text-muted">${p.last_seen_at}</td>
             </tr>`;
@@ -463,6 +500,16 @@ function renderProducts(data) {
     document.getElementById('total-products').textContent = data.total;
 }
 
+function renderPriceChange(p) {
+    const stats = p.stats;
+    if (!stats || stats.last_change_pct === null)
+        return '-';
+
+    const cls = stats.last_change_pct < 0 ? 'price-down' : 'price-up';
+    const low = p.last_price !== null && p.last_price === stats.all_time_min ? ' title="All-time low"' : '';
+    return `<span class="${cls}"${low}>${stats.last_change_pct > 0 ? '+' : ''}${stats.last_change_pct}%</span>`;
+}
+
 function renderPagination(page, total, per_page) {
     const pag = document.querySelector('.pagination');
     pag.innerHTML = '';
@@ -617,14 +664,12 @@ async function exportData(format) {
 
     try {
         if (format === 'csv') {
-            let resp = await fetch(`${API_BASE}/export_csv?q=${currentFilters.q}&site=${currentFilters.site}`);
-            window.location.href = resp.url;
+            // the CSV is streamed, let the browser download it directly instead of buffering it here
+            window.location.href = `${API_BASE}/export_csv?q=${currentFilters.q}&site=${currentFilters.site}`;
         } else if (format === 'pdf') {
-            let resp = await fetch(`${API_BASE}/export_pdf?q=${currentFilters.q}&site=${currentFilters.site}`);
-            window.location.href = resp.url;
+            window.location.href = `${API_BASE}/export_pdf?q=${currentFilters.q}&site=${currentFilters.site}`;
         } else if (format === 'xlsx') {
-            let resp = await fetch(`${API_BASE}/export_xlsx?q=${currentFilters.q}&site=${currentFilters.site}`);
-            window.location.href = resp.url;
+            window.location.href = `${API_BASE}/export_xlsx?q=${currentFilters.q}&site=${currentFilters.site}`;
         }
     } catch (error) {
         showAlert('error', 'Error exporting: ' + error.message);
@@ -772,44 +817,15 @@ async function handleScrape(event) {
                                                 { method: 'POST', body: formData });
         
         if (response.ok) {
+            const { job_id } = await response.json();
             const alertElement = document.getElementById(`alert-success`);
             const messageElement = document.getElementById(`success-message`);
             
             messageElement.textContent = 'Scraping in progress with query =  ' + query;
             alertElement.style.display = 'flex';
 
-            const scrapeBtn = document.querySelector('#scrape-form button[type="submit"]');
-            scrapeBtn.disabled = true;
-            scrapeBtn.classList.add('btn-danger');
-            scrapeBtn.classList.remove('btn-primary');
-
             hideLoading();
-            
-            scrapingInProgress = true;
-            let finished = false;
-            let nr_products = '';
-
-            while (!finished) {
-                await new Promise(res => setTimeout(res, 3000));
-                let statusResp = await fetch(`${API_BASE}/scrape/status`, { method: 'GET' });
-                let statusData = await statusResp.json();
-
-                if (statusData.status === 'done') {
-                    finished = true;
-                    nr_products = statusData.len_products;
-                }
-            }
-            scrapingInProgress = false;
-
-            showAlert('success', 'Scraping finished! ' + nr_products + ' products affected');
-            showLoading();
-            loadProducts();
-            hideLoading();
-
-            scrapeBtn.disabled = false;
-            scrapeBtn.classList.remove('btn-danger');
-            scrapeBtn.classList.add('btn-primary');
-            document.getElementById('scrape-query').value = "";
+            await followScrapeJob(job_id, query);
         } else
             throw new Error('Error starting scraping');
     } catch (error) {
@@ -914,14 +930,10 @@ function HandleHeaderBtn(orderBy) {
 }
 
 async function initializeSitesConfig() {
-    let requestResp = await fetch(`${API_BASE}/get_site_number`, { method: 'GET' });
-    let data = await requestResp.json();
-    const nr_sites = data.nr_sites;
-
-    for(let i = 0; i < nr_sites; i++) {
-        requestResp = await fetch(`${API_BASE}/get_site_settings?index=${i}`, { method: 'GET' });
-        data = await requestResp.json();
+    const requestResp = await fetch(`${API_BASE}/sites`, { method: 'GET' });
+    const sites = await requestResp.json();
 
+    for (const data of sites) {
         let newSite = {
             name: data.name,
             url: data.url,
@@ -1,5 +1,6 @@
 const API_URL = "http://127.0.0.1:8000";
 let historyDataCache = [];
+let historyChartCache = null;
 let historyViewMode = 'table';
 let historyPage = 1;
 const historyPerPage = 10;
@@ -85,7 +86,8 @@ document.addEventListener('DOMContentLoaded', function () {
 
     const imageUrl = await fetchProductImage(productId);
     renderProduct(product, imageUrl);
-    const history = await fetchHistory(productId);
+    const [history, chart] = await Promise.all([fetchHistory(productId), fetchHistoryChart(productId)]);
+    historyChartCache = chart;
     renderHistory(history);
 })();
 
@@ -110,6 +112,15 @@ async function fetchHistory(productId) {
     return await resp.json();
 }
 
+// downsampled on the server: a fixed number of points however long the history is
+async function fetchHistoryChart(productId) {
+    const resp = await fetch(`${API_URL}/products/${productId}/history/chart?points=300`);
+    if (!resp.ok) 
+        return null;
+
+    return await resp.json();
+}
+
 async function fetchProductImage(productId) {
     const resp = await fetch(`${API_URL}/product_image?product_id=${productId}`);
     if (!resp.ok) 
@@ -191,6 +202,7 @@ function renderHistory(history) {
     historyDataCache = history.slice().reverse();
     historyPage = 1;
 
+    // rows of the table below: intervals of an unchanged price, not individual observations
     document.getElementById('history-total').textContent = history.length;
     updateHistoryView();
     document.getElementById('history-card').style.display = 'block';
@@ -225,7 +237,7 @@ function updateHistoryView() {
         pagContainer.style.display = 'none';
         footer.style.display = 'none';
 
-        renderPriceChart(historyDataCache);
+        renderPriceChart(historyChartCache ? historyChartCache.points : historyDataCache.slice().reverse());
     }
 }
 
@@ -270,7 +282,7 @@ function renderHistoryTable(history) {
         }
         rows += `<tr>
         <td style="width:2.5em;text-align:center;color:#64748b;">${startIdx + idx + 1}</td>
-        <td class="text-muted">${h.captured_at}</td>
+        <td class="text-muted">${h.valid_from}${h.valid_to !== h.valid_from ? ' &rarr; ' + h.valid_to : ''}</td>
         <td style="text-align:center;" class="${priceClass}">${price !== null ? price : '-'}</td>
         <td style="text-align:center;">${percent}</td>
       </tr>`;
@@ -321,7 +333,6 @@ window.changeHistoryPage = function (direction) {
 };
 
 function renderPriceChart(history) {
-    history = history.slice().reverse();
     const canvas = document.getElementById('priceChart');
     canvas.width = canvas.offsetWidth || 400;
     canvas.height = 220;
@@ -0,0 +1,70 @@
+import asyncio
+import json
+import os
+import sys
+
+from contextlib import asynccontextmanager
+
+import pytest
+
+# the backend modules import each other by bare name, the way they run from Backend/
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "Backend"))
+
+FIXTURES = os.path.join(ROOT, "tests", "fixtures")
+
+import Database
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "tracker.db")
+    asyncio.run(Database.init_db(path))
+    yield path
+    Database.database_initialized = False
+
+@pytest.fixture
+def config_path(tmp_path):
+    # a copy of the shipped config, so tests can change it freely
+    with open(os.path.join(ROOT, "Data", "config.json"), encoding="utf-8") as f:
+        config = json.load(f)
+
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(config), encoding="utf-8")
+    return str(path)
+
+@pytest.fixture
+def api(db_path, monkeypatch):
+    # the API module with its pool pointed at the test database; open_client serves it in-process
+    import API
+
+    monkeypatch.setattr(API, "DB_PATH", db_path)
+    monkeypatch.setattr(API.DB_POOL, "path", db_path)
+    Database.database_initialized = True
+    return API
+
+@asynccontextmanager
+async def open_client(api):
+    import httpx
+
+    await api.DB_POOL.open()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=api.APP), base_url="http://test") as client:
+            yield client
+    finally:
+        await api.DB_POOL.close()
+
+@pytest.fixture(scope="session")
+def fixture_server():
+    # the saved shop pages under tests/fixtures, served the way a site would serve them
+    import threading
+    from functools import partial
+    from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+    class Handler(SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), partial(Handler, directory=FIXTURES))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
@@ -0,0 +1,63 @@
+import asyncio
+import sqlite3
+
+from conftest import open_client
+
+def seed_watched_product(db_path):
+    with sqlite3.connect(db_path) as con:
+        con.execute("""
+            INSERT INTO products(site_name, external_id, image_link, title, link, last_price, watch_price, watch_max_price)
+            VALUES ('shop', '1', 'N/A', 'Old laptop', 'N/A', 900, 1, 1000)
+        """)
+        con.execute("INSERT INTO alerts(product_id, rule, price_minor) VALUES (1, 'below_max', 900)")
+        con.execute("INSERT INTO page_fingerprints(site_name, query, page, fingerprint) VALUES ('shop', 'laptop', 1, 'f')")
+        con.execute("INSERT INTO watch_checks(product_id, interval_hours, next_check_at, checked_at) VALUES (1, 24, '2999-01-01', '2026-01-01')")
+
+def table_count(db_path, table):
+    with sqlite3.connect(db_path) as con:
+        return con.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+def test_delete_db_clears_what_refers_to_products(api, db_path):
+    seed_watched_product(db_path)
+
+    async def run():
+        async with open_client(api) as client:
+            assert (await client.post("/delete_db")).json() == {"ok": True}
+            # the next request recreates the tables; ids start again at 1
+            return (await client.get("/alerts", params={"pending": True})).json()
+
+    assert asyncio.run(run()) == []
+    assert table_count(db_path, "alerts") == 0
+    assert table_count(db_path, "page_fingerprints") == 0
+    assert table_count(db_path, "watch_checks") == 0
+
+def test_reader_pool_serves_waiters_in_order(db_path):
+    from Database import ConnectionPool
+
+    async def run():
+        pool = ConnectionPool(db_path, size=1)
+        await pool.open()
+        served = []
+
+        async def read(name):
+            for _ in range(3):
+                async with pool.reader():
+                    served.append(name)
+                    await asyncio.sleep(0)
+
+        try:
+            await asyncio.gather(*(read(name) for name in "abc"))
+        finally:
+            await pool.close()
+        return served
+
+    # a task giving its connection back and asking again goes behind the ones already waiting
+    assert asyncio.run(run())[:6] == list("abcabc")
+
+def test_add_schedule_without_a_query_is_rejected(api, db_path):
+    async def run():
+        async with open_client(api) as client:
+            return (await client.post("/add_schedule", params={"time": "08:30", "discord_id": "1"})).status_code
+
+    assert asyncio.run(run()) == 400
+    assert table_count(db_path, "schedules") == 0
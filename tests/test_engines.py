@@ -0,0 +1,186 @@
+import asyncio
+import gzip
+import json
+import os
+import threading
+import time
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from Engines import AssetCache, HttpEngine, PlaywrightEngine, RequestPolicy, SiteMetrics, extract_cards_html
+from conftest import FIXTURES
+
+SELECTORS = {
+    "product": "div.card-item", "title": "a.card-title", "link": "a.card-title", "price": "p.product-new-price",
+    "currency": "", "rating": "div.rating", "id": "data-product-id", "image_link": "div.thumb-wrap img",
+    "remove_items_with": "svg[viewBox=\"0 0 16 16\"]", "end_of_pages": "svg.no-results",
+}
+
+def fixture_site(base, **settings):
+    return {"name": "shop", "url": base, "url_searchTemplate": base + "/search_page_{page}.html?q={query}",
+            "selectors": SELECTORS, **settings}
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+async def fetch_pages(engine, site, pages):
+    session = await engine.open(site)
+    try:
+        return [await session.fetch_cards(site["url_searchTemplate"].format(query="laptop", page=p)) for p in pages]
+    finally:
+        await session.close()
+        await engine.close()
+
+def test_html_extraction_reads_every_card():
+    cards = extract_cards_html(read_fixture("search_page_1.html"), SELECTORS)
+
+    assert len(cards) == 64
+    # the two sponsored cards carry the remove_items_with badge
+    assert [i for i, card in enumerate(cards) if card["skip"]] == [4, 32]
+    assert cards[0] == {
+        "skip": False, "title": "Laptop Gaming Model 1 16GB RAM", "price": "1.03799 Lei", "rating": "4.1 (7)",
+        "link": "/p/1001/laptop-1", "id": "1001", "image": "/img/1001.jpg", "currency": None,
+    }
+    # a lazy image has no src yet, a card without reviews has no rating element
+    assert cards[9]["image"] is None
+    assert cards[19]["rating"] is None
+    assert cards[39]["link"] == "https://shop.test/p/1040"
+
+def test_html_extraction_stops_at_the_end_page():
+    assert extract_cards_html(read_fixture("search_page_2.html"), SELECTORS) is None
+
+def test_http_engine_against_a_local_server(fixture_server):
+    site = fixture_site(fixture_server)
+    first, end, missing = asyncio.run(fetch_pages(HttpEngine(), site, [1, 2, 3]))
+
+    assert first == extract_cards_html(read_fixture("search_page_1.html"), SELECTORS)
+    assert end is None
+    # a 404 ends the site like an empty page
+    assert missing is None
+
+async def launch_or_skip(engine):
+    try:
+        await engine.get_browser()
+    except Exception as e:
+        await engine.close()
+        pytest.skip(f"no browser to run: {e}")
+
+@pytest.mark.parametrize("extraction", ["evaluate", "handles"])
+def test_http_engine_matches_playwright(fixture_server, extraction):
+    site = fixture_site(fixture_server, extraction=extraction, block_resources=[], block_urls=[])
+
+    async def run():
+        engine = PlaywrightEngine()
+        await launch_or_skip(engine)
+        return (await fetch_pages(engine, site, [1]))[0]
+
+    browser_cards = asyncio.run(run())
+    http_cards = asyncio.run(fetch_pages(HttpEngine(), site, [1]))[0]
+
+    assert http_cards == browser_cards
+
+def test_asset_cache_keeps_only_headers_that_fit_the_decoded_body(tmp_path):
+    cache = AssetCache(str(tmp_path))
+    headers = {"content-type": "text/css", "content-encoding": "gzip", "Content-Length": "31", "etag": "\"v1\""}
+    cache.put("https://shop.test/site.css", headers, b"body { color: red; }")
+
+    assert cache.get("https://shop.test/site.css") == ({"content-type": "text/css", "etag": "\"v1\""}, b"body { color: red; }")
+
+    # an entry stored with the wire headers is cleaned up when it's read
+    with open(cache.file("https://shop.test/old.js") + ".json", "w", encoding="utf-8") as f:
+        json.dump({"content-type": "application/javascript", "transfer-encoding": "chunked"}, f)
+    with open(cache.file("https://shop.test/old.js"), "wb") as f:
+        f.write(b"window.old = true;")
+
+    assert cache.get("https://shop.test/old.js") == ({"content-type": "application/javascript"}, b"window.old = true;")
+
+def test_asset_cache_drops_expired_and_oldest_entries(tmp_path):
+    cache = AssetCache(str(tmp_path), max_age=60, max_bytes=100)
+    for i, age in enumerate([120, 30, 20, 10]):
+        cache.put(f"https://shop.test/{i}.js", {}, b"x" * 40)
+        os.utime(cache.file(f"https://shop.test/{i}.js"), (0, time.time() - age))
+
+    # an expired entry is deleted when it's asked for
+    assert cache.get("https://shop.test/0.js") is None
+    assert not os.path.exists(cache.file("https://shop.test/0.js") + ".json")
+
+    # a sweep keeps the newest entries that fit in max_bytes (each is 40 bytes plus "{}")
+    cache.sweep()
+    assert [os.path.exists(cache.file(f"https://shop.test/{i}.js")) for i in range(4)] == [False, False, True, True]
+
+def test_request_policy_only_tracks_cache_hits_it_will_count(tmp_path):
+    class Request:
+        method, resource_type, url = "GET", "stylesheet", "https://shop.test/site.css"
+
+    class Route:
+        request = Request()
+
+        async def fulfill(self, **kwargs):
+            pass
+
+    cache = AssetCache(str(tmp_path))
+    cache.put(Request.url, {"content-type": "text/css"}, b"body {}")
+    site = {"name": "shop", "block_resources": [], "block_urls": [], "asset_cache": True}
+
+    # without byte counting nothing would ever take the request back out
+    quiet = RequestPolicy(site, SiteMetrics(), cache)
+    asyncio.run(quiet.handle(Route()))
+    assert quiet.metrics.cache_hits == 1 and not quiet.served
+
+    counting = RequestPolicy(site, SiteMetrics(), cache, count_bytes=True)
+    asyncio.run(counting.handle(Route()))
+    assert counting.served == {Route.request}
+    counting.forget(Route.request)
+    assert not counting.served
+
+def test_cached_asset_from_a_compressed_origin_still_runs(tmp_path):
+    # the second page load gets app.js from the asset cache, which stored it from a gzipped response
+    script = gzip.compress(b"document.body.dataset.loaded = 'yes';" + b" " * 5000)
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path == "/app.js":
+                body, headers = script, {"Content-Type": "application/javascript", "Content-Encoding": "gzip"}
+            else:
+                body, headers = b"<html><body><script src='/app.js'></script></body></html>", {"Content-Type": "text/html"}
+            self.send_response(200)
+            for name, value in {**headers, "Content-Length": str(len(body))}.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    site = {"name": "shop", "url": base, "block_resources": [], "block_urls": [], "asset_cache": True}
+
+    async def run():
+        engine = PlaywrightEngine(cache=AssetCache(str(tmp_path)))
+        await launch_or_skip(engine)
+        loaded = []
+        try:
+            for _ in range(2):
+                session = await engine.open(site)
+                try:
+                    page = await session.context.new_page()
+                    await page.goto(base + "/", wait_until="load")
+                    loaded.append(await page.evaluate("document.body.dataset.loaded"))
+                finally:
+                    await session.close()
+            return loaded, engine.metrics["shop"].cache_hits
+        finally:
+            await engine.close()
+
+    try:
+        loaded, cache_hits = asyncio.run(run())
+    finally:
+        server.shutdown()
+
+    assert loaded == ["yes", "yes"]
+    assert cache_hits == 1
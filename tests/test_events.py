@@ -0,0 +1,117 @@
+import asyncio
+import json
+
+import pytest
+
+import ScrapeService
+from Scraper import Scraper
+from conftest import open_client
+
+class FakeScraper(Scraper):
+    # reports what a two-page run of one site would, without fetching anything; "broken" fails the run
+    async def RunScrap(self, query, filter, update_time=0.0, engines=None, pool=None, mode="full"):
+        await asyncio.sleep(0)
+        if query == "broken":
+            raise RuntimeError("site unreachable")
+
+        for page in (1, 2):
+            self.report("page", site="shop", page=page, items=3, persisted=3)
+            await asyncio.sleep(0)
+        self.report("site_done", site="shop", persisted=6)
+
+        return 6
+
+def parse_sse(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n") if not line.startswith(":"))
+        events.append({"id": int(fields["id"]), "event": fields["event"], "data": json.loads(fields["data"])})
+
+    return events
+
+@pytest.fixture
+def service(api, config_path, monkeypatch):
+    monkeypatch.setattr(ScrapeService, "Scraper", FakeScraper)
+    service = ScrapeService.ScrapeService(config_path, api.DB_POOL, workers=1)
+    monkeypatch.setattr(api, "SCRAPE_SERVICE", service)
+    return service
+
+def test_job_stream_is_ordered_and_ends_with_the_job(api, service):
+    async def run():
+        await service.start()
+        try:
+            async with open_client(api) as client:
+                job_id = (await client.post("/scrape/trigger", params={"query": "laptop"})).json()["job_id"]
+                response = await asyncio.wait_for(client.get("/scrape/events", params={"job_id": job_id}), 5)
+                return job_id, response
+        finally:
+            await service.stop()
+
+    job_id, response = asyncio.run(run())
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = parse_sse(response.text)
+    assert [e["event"] for e in events] == ["job_queued", "job_started", "page", "page", "site_done", "job_done"]
+    assert [e["data"]["page"] for e in events if e["event"] == "page"] == [1, 2]
+    assert all(e["data"]["job_id"] == job_id for e in events)
+    ids = [e["id"] for e in events]
+    assert ids == sorted(ids) and len(set(ids)) == len(ids)
+    assert events[-1]["data"]["len_products"] == 6
+
+def test_failed_job_ends_its_stream_with_job_failed(api, service):
+    async def run():
+        await service.start()
+        try:
+            async with open_client(api) as client:
+                ok = (await client.post("/scrape/trigger", params={"query": "laptop"})).json()["job_id"]
+                broken = (await client.post("/scrape/trigger", params={"query": "broken"})).json()["job_id"]
+                response = await asyncio.wait_for(client.get("/scrape/events", params={"job_id": broken}), 5)
+                return ok, broken, response
+        finally:
+            await service.stop()
+
+    ok, broken, response = asyncio.run(run())
+
+    events = parse_sse(response.text)
+    # only the requested job's events, although the other job ran first on the same bus
+    assert all(e["data"]["job_id"] == broken for e in events)
+    assert [e["event"] for e in events] == ["job_queued", "job_started", "job_failed"]
+    assert events[-1]["data"]["errors"] == ["site unreachable"]
+
+def test_last_event_id_resumes_after_that_event(api, service):
+    async def run():
+        await service.start()
+        try:
+            async with open_client(api) as client:
+                job_id = (await client.post("/scrape/trigger", params={"query": "laptop"})).json()["job_id"]
+                first = await asyncio.wait_for(client.get("/scrape/events", params={"job_id": job_id}), 5)
+                seen = parse_sse(first.text)
+                # as EventSource reconnects after the connection dropped with the first page
+                resumed = await asyncio.wait_for(client.get("/scrape/events", params={"job_id": job_id},
+                                                            headers={"Last-Event-ID": str(seen[2]["id"])}), 5)
+                return seen, parse_sse(resumed.text)
+        finally:
+            await service.stop()
+
+    seen, resumed = asyncio.run(run())
+
+    assert resumed == seen[3:]
+    assert [e["event"] for e in resumed] == ["page", "site_done", "job_done"]
+
+def test_stream_of_a_job_whose_end_left_the_history_still_ends(api, service):
+    async def run():
+        await service.start()
+        try:
+            async with open_client(api) as client:
+                job_id = (await client.post("/scrape/trigger", params={"query": "laptop"})).json()["job_id"]
+                await asyncio.wait_for(service.get(job_id).done.wait(), 5)
+                for _ in range(service.events.history.maxlen):
+                    service.events.publish({"event": "page", "job_id": job_id + 1})
+                return await asyncio.wait_for(client.get("/scrape/events", params={"job_id": job_id}), 5)
+        finally:
+            await service.stop()
+
+    events = parse_sse(asyncio.run(run()).text)
+
+    assert [e["event"] for e in events] == ["job_done"]
+    assert events[0]["data"]["len_products"] == 6
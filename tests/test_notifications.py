@@ -0,0 +1,162 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from Database import ConnectionPool
+from Notifications import DiscordDMSink, Notifier, send_pending_alerts, split_message
+
+class DiscordStandIn:
+    # the two REST calls DiscordDMSink makes, plus scripted failures answered before a message is taken
+    def __init__(self):
+        self.messages = []
+        self.attempts = []
+        self.failures = []
+        self.channels = 0
+
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if self.path == "/users/@me/channels":
+                    stand_in.channels += 1
+                    self.reply(200, {"id": "555"})
+                    return
+
+                stand_in.attempts.append(time.monotonic())
+                if stand_in.failures:
+                    self.reply(*stand_in.failures.pop(0))
+                    return
+
+                stand_in.messages.append(payload["content"])
+                self.reply(200, {"id": str(len(stand_in.messages))})
+
+            def reply(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+@pytest.fixture
+def discord():
+    stand_in = DiscordStandIn()
+    yield stand_in
+    stand_in.server.shutdown()
+
+def notify_all(discord, texts, **settings):
+    async def run():
+        notifier = Notifier([DiscordDMSink("token", "42", api_base=discord.url)],
+                            **{"batch_window": 0.2, "min_interval": 0, "backoff": 0.05, **settings})
+        try:
+            futures = [notifier.notify(text) for text in texts]
+            return await asyncio.gather(*futures)
+        finally:
+            await notifier.close()
+
+    return asyncio.run(run())
+
+def test_messages_within_the_batch_window_go_out_together(discord):
+    assert notify_all(discord, ["first", "second", "third"]) == [True, True, True]
+
+    assert discord.messages == ["first\n\nsecond\n\nthird"]
+    assert discord.channels == 1
+
+def test_split_message_keeps_lines_whole_at_the_limit():
+    lines = [f"- product {i:04d} " + "x" * 80 for i in range(50)]
+    chunks = split_message("\n".join(lines))
+
+    assert all(len(chunk) <= 2000 for chunk in chunks)
+    assert "\n".join(chunks).split("\n") == lines
+    assert split_message("y" * 2000) == ["y" * 2000]
+    assert split_message("y" * 2001) == ["y" * 2000, "y"]
+
+def test_long_batch_is_sent_as_several_messages(discord):
+    text = "\n".join(f"- product {i:04d} " + "x" * 80 for i in range(50))
+    assert notify_all(discord, [text]) == [True]
+
+    assert len(discord.messages) == 3
+    assert all(len(message) <= 2000 for message in discord.messages)
+    assert "\n".join(discord.messages) == text
+
+def test_rate_limit_waits_for_retry_after(discord):
+    discord.failures = [(429, {"message": "You are being rate limited.", "retry_after": 0.4})]
+    assert notify_all(discord, ["hello"]) == [True]
+
+    assert discord.messages == ["hello"]
+    assert len(discord.attempts) == 2
+    assert discord.attempts[1] - discord.attempts[0] >= 0.4
+
+def test_server_errors_are_retried_with_growing_backoff(discord):
+    discord.failures = [(500, {}), (502, {}), (503, {})]
+    assert notify_all(discord, ["hello"], backoff=0.1) == [True]
+
+    assert discord.messages == ["hello"]
+    gaps = [b - a for a, b in zip(discord.attempts, discord.attempts[1:])]
+    # jittered between half and all of 0.1, 0.2 and 0.4 seconds
+    assert len(gaps) == 3
+    assert gaps[0] >= 0.05 and gaps[1] >= 0.1 and gaps[2] >= 0.2
+
+def test_server_errors_give_up_after_the_last_retry(discord):
+    discord.failures = [(500, {})] * 10
+    assert notify_all(discord, ["hello"], retries=2, backoff=0.01) == [False]
+
+    assert len(discord.attempts) == 3
+    assert discord.messages == []
+
+def test_client_error_is_not_retried(discord):
+    discord.failures = [(403, {"message": "Cannot send messages to this user"})]
+    assert notify_all(discord, ["hello"]) == [False]
+
+    assert len(discord.attempts) == 1
+    assert discord.messages == []
+
+def seed_pending_alert(db_path):
+    with sqlite3.connect(db_path) as con:
+        con.execute("""
+            INSERT INTO products(site_name, external_id, image_link, title, link, last_price, watch_price, watch_max_price)
+            VALUES ('shop', '1', 'N/A', 'Laptop Alpha', 'N/A', 900, 1, 1000)
+        """)
+        con.execute("INSERT INTO alerts(product_id, rule, price_minor, detail) VALUES (1, 'below_max', 900, 1000)")
+
+def pending_alerts(db_path):
+    with sqlite3.connect(db_path) as con:
+        return con.execute("SELECT COUNT(*) FROM alerts WHERE notified_at IS NULL").fetchone()[0]
+
+def send_alerts(db_path, config):
+    async def run():
+        pool = ConnectionPool(db_path, size=0)
+        await pool.open()
+        try:
+            return await send_pending_alerts(pool, config, None)
+        finally:
+            await pool.close()
+
+    return asyncio.run(run())
+
+def test_alerts_stay_pending_until_a_send_succeeds(db_path, discord):
+    seed_pending_alert(db_path)
+    # the webhook sink posts to the stand-in's message endpoint like any incoming webhook
+    config = {"notify_webhook": discord.url + "/channels/555/messages"}
+
+    discord.failures = [(403, {"message": "Unknown Webhook"})]
+    assert send_alerts(db_path, config) == 0
+    assert pending_alerts(db_path) == 1
+
+    assert send_alerts(db_path, config) == 1
+    assert pending_alerts(db_path) == 0
+    assert discord.messages == ["**Products below threshold:**\n- Laptop Alpha — 900 < 1000"]
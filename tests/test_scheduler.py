@@ -0,0 +1,99 @@
+import asyncio
+import sqlite3
+
+from datetime import datetime
+
+from Database import ConnectionPool
+from Scheduler import ScheduleRunner, save_schedule, parse_time
+
+class FakeConfig:
+    def get(self):
+        return {}
+
+class FakeJob:
+    def __init__(self, id, status="queued"):
+        self.id = id
+        self.status = status
+        self.done = asyncio.Event()
+
+class FakeService:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.submitted = []
+        self.jobs = dict()
+
+    def submit(self, query, mode):
+        if self.fail:
+            raise RuntimeError("service unavailable")
+        job = FakeJob(len(self.submitted) + 1)
+        self.submitted.append(job)
+        self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+def make_due(db_path, name):
+    with sqlite3.connect(db_path) as con:
+        con.execute("UPDATE schedules SET next_run_at = '2000-01-01 00:00:00' WHERE name = ?", (name,))
+
+def test_schedule_that_fails_to_start_moves_to_its_next_run(db_path):
+    service = FakeService(fail=True)
+
+    async def run():
+        pool = ConnectionPool(db_path, size=0)
+        await pool.open()
+        runner = ScheduleRunner(pool, service, FakeConfig())
+        try:
+            async with pool.writer() as db:
+                await save_schedule(db, {"name": "nightly", "query": "laptop", "cron": "0 3 * * *"})
+            make_due(db_path, "nightly")
+
+            calls = 0
+            submit = service.submit
+            def counted(*args):
+                nonlocal calls
+                calls += 1
+                return submit(*args)
+            service.submit = counted
+
+            await runner.start()
+            await asyncio.sleep(0.3)
+            return calls
+        finally:
+            await runner.stop()
+            await pool.close()
+
+    calls = asyncio.run(run())
+
+    # one attempt, not a loop spinning on the same due schedule
+    assert calls == 1
+    with sqlite3.connect(db_path) as con:
+        next_run_at = con.execute("SELECT next_run_at FROM schedules WHERE name = 'nightly'").fetchone()[0]
+    assert parse_time(next_run_at) > datetime.now()
+
+def test_job_ids_from_a_previous_process_do_not_skip_a_run(db_path):
+    service = FakeService()
+    # this process's job 1 is still running, but the stored last_job_id 1 was another process's job
+    service.jobs[1] = FakeJob(1, status="in_progress")
+
+    async def run():
+        pool = ConnectionPool(db_path, size=0)
+        await pool.open()
+        runner = ScheduleRunner(pool, service, FakeConfig())
+        try:
+            async with pool.writer() as db:
+                await save_schedule(db, {"name": "nightly", "query": "laptop", "cron": "0 3 * * *"})
+            make_due(db_path, "nightly")
+            with sqlite3.connect(db_path) as con:
+                con.execute("UPDATE schedules SET last_job_id = 1")
+
+            await runner.start()
+            await asyncio.sleep(0.3)
+        finally:
+            await runner.stop()
+            await pool.close()
+
+    asyncio.run(run())
+
+    assert len(service.submitted) == 1
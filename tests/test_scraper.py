@@ -0,0 +1,80 @@
+import asyncio
+
+from Database import ConnectionPool, upsert_products_bulk
+from Matcher import build_generic_matcher
+from Scraper import Scraper, Filters
+
+SITE = {
+    "name": "shop",
+    "url": "https://shop.test",
+    "url_searchTemplate": "https://shop.test/search/{query}/p{page}",
+    "selectors": {
+        "product": "div.card", "title": "a.title", "link": "a.title", "price": "p.price", "currency": "",
+        "rating": "div.rating", "id": "data-id", "image_link": "img", "remove_items_with": "", "end_of_pages": "",
+    },
+}
+
+def card(id, title, image="https://shop.test/img.jpg", link="/p/1"):
+    return {"skip": False, "title": title, "price": "1.299,99 Lei", "rating": "4.5 (10)",
+            "link": link, "id": id, "image": image, "currency": None}
+
+class FakeSession:
+    def __init__(self, cards):
+        self.cards = cards
+
+    async def fetch_cards(self, url):
+        return self.cards
+
+def test_cards_with_missing_attributes_are_stored(db_path, config_path):
+    # a lazy-loaded image has no src yet and a card can lack its id attribute; neither may fail the page
+    cards = [
+        card("1", "Laptop Alpha", image=None),
+        card(None, "Laptop Beta"),
+        card("3", "Laptop Gamma", link=None),
+    ]
+
+    async def run():
+        scraper = Scraper(config_path)
+        batch = await scraper.ScrapePage(FakeSession(cards), SITE, "laptop", build_generic_matcher("laptop"), Filters(), 1)
+
+        pool = ConnectionPool(db_path, size=0)
+        await pool.open()
+        try:
+            async with pool.writer() as db:
+                ids = await upsert_products_bulk(db, SITE["name"], batch, 0)
+                async with db.execute("SELECT external_id, image_link, link FROM products ORDER BY external_id") as cur:
+                    rows = await cur.fetchall()
+        finally:
+            await pool.close()
+
+        return batch, ids, rows
+
+    batch, ids, rows = asyncio.run(run())
+
+    assert [item["external_id"] for item in batch] == ["1", "3"]
+    assert len(ids) == 2
+    assert rows == [("1", "N/A", "https://shop.test/p/1"), ("3", "https://shop.test/img.jpg", "N/A")]
+
+def test_bulk_upsert_skips_items_without_id(db_path):
+    items = [
+        {"external_id": None, "title": "No id", "link": "x", "image_link": None, "currency": None,
+         "rating": None, "ratings_count": None, "price_minor": 100},
+        {"external_id": "7", "title": "Seven", "link": None, "image_link": None, "currency": None,
+         "rating": None, "ratings_count": None, "price_minor": 700},
+    ]
+
+    async def run():
+        pool = ConnectionPool(db_path, size=0)
+        await pool.open()
+        try:
+            async with pool.writer() as db:
+                ids = await upsert_products_bulk(db, "shop", items, 0)
+                async with db.execute("SELECT external_id, image_link, link, last_price FROM products") as cur:
+                    return ids, await cur.fetchall()
+        finally:
+            await pool.close()
+
+    ids, rows = asyncio.run(run())
+
+    assert len(ids) == 1
+    assert rows == [("7", "N/A", "N/A", 700)]